@@ -4,6 +4,7 @@ Everything About Agent - Scripts Package
 Contains utility scripts for:
 - file_watcher: Auto-reload web server with file monitoring
 - diagnose: System diagnostic and troubleshooting tool
+- benchmark_ann: Recall/QPS benchmark of the IVF vector index against exact search
 """
 
 __version__ = "1.0.0"
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+ANN Index Benchmark
+Compares the IVF approximate index against exact search on synthetic clustered data.
+Reports build time, recall@k against exact search and QPS for each nprobe.
+
+Usage:
+    python scripts/benchmark_ann.py --vectors 200000 --dim 128 --nprobe 1 4 8 16 32
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.utils.ann_index import IVFIndex  # noqa: E402
+from src.utils.vector_index import DenseIndex  # noqa: E402
+
+
+def synthetic_data(n: int, dim: int, clusters: int, queries: int, seed: int = 0):
+    """Gaussian blobs around random centers (embeddings are clustered, not uniform)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    query = centers[rng.integers(clusters, size=queries)] + 0.5 * rng.normal(size=(queries, dim)).astype(np.float32)
+    return data, query
+
+
+def recall_at_k(approx: List[List[tuple]], exact: List[List[tuple]]) -> float:
+    hits = sum(len({d for d, _ in a} & {d for d, _ in e}) for a, e in zip(approx, exact))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+def run(args) -> List[Dict[str, float]]:
+    data, queries = synthetic_data(args.vectors, args.dim, args.clusters, args.queries, args.seed)
+    ids = [str(i) for i in range(len(data))]
+
+    start = time.perf_counter()
+    exact_index = DenseIndex(dim=args.dim)
+    exact_index.add_batch(ids, data)
+    exact_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ivf = IVFIndex(dim=args.dim, nlist=args.nlist, min_train_size=len(data) + 1, seed=args.seed)
+    ivf.add_batch(ids, data)
+    ivf.train()
+    ivf_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact = [exact_index.search(q, args.k) for q in queries]
+    exact_qps = len(queries) / (time.perf_counter() - start)
+
+    print(f"vectors={len(data)} dim={args.dim} nlist={ivf.get_stats()['nlist']} k={args.k} queries={len(queries)}")
+    print(f"build: exact {exact_build:.2f}s, ivf {ivf_build:.2f}s")
+    print(f"{'index':<14}{'recall@k':>10}{'QPS':>12}{'scanned':>12}")
+    print(f"{'exact':<14}{1.0:>10.3f}{exact_qps:>12.1f}{len(data):>12}")
+
+    rows = []
+    for nprobe in args.nprobe:
+        scanned_before = ivf.stats["scanned"]
+        start = time.perf_counter()
+        approx = [ivf.search(q, args.k, nprobe=nprobe) for q in queries]
+        qps = len(queries) / (time.perf_counter() - start)
+        scanned = (ivf.stats["scanned"] - scanned_before) / len(queries)
+        recall = recall_at_k(approx, exact)
+        rows.append({"nprobe": nprobe, "recall": recall, "qps": qps, "scanned": scanned})
+        print(f"{'ivf/' + str(nprobe):<14}{recall:>10.3f}{qps:>12.1f}{scanned:>12.0f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF ANN index against exact search")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--clusters", type=int, default=256, help="number of synthetic clusters")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default 4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
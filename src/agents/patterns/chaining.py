@@ -1,9 +1,20 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
+from typing import AsyncIterator, Dict, Optional
+from pydantic import BaseModel
 from src.utils.model_loader import model_loader
+from src.utils.streaming import track_stream
+from src.utils.structured_output import avalidate_json_stream, json_mode, structured_llm
 from loguru import logger
 
+class Specifications(BaseModel):
+    """转换步骤产出的技术规格"""
+    cpu: Optional[str] = None
+    memory: Optional[str] = None
+    storage: Optional[str] = None
+
+
 class ChainingAgent:
     """
     Implements the Prompt Chaining pattern.
@@ -16,10 +27,16 @@ class ChainingAgent:
         # If model_id is None, load_llm uses active model. We can fetch it back from llm or query loader.
         # But for logging, let's get the effective ID.
         effective_id = model_id if model_id else model_loader.active_model_id
-        self.chain = self._build_chain()
+        specifications = self._build_specifications_step()
+        # JSON 步骤按 Specifications 约束（后端支持时走约束解码）：
+        # extract() 返回校验后的模型；run() / astream() 返回（流式转发）模型输出的原文
+        self.structured_chain = specifications | structured_llm(self.llm, Specifications)
+        self.chain = specifications | json_mode(self.llm, Specifications) | StrOutputParser()
+        self.last_stream_metrics: Dict[str, float] = {}
         logger.info(f"🔗 ChainingAgent initialized with model: {effective_id}")
 
-    def _build_chain(self):
+    def _build_specifications_step(self):
+        """两条链共用的提取步骤：text_input -> 转换提示"""
         # --- Prompt 1: Extract Information ---
         prompt_extract = ChatPromptTemplate.from_template(
             "Extract the technical specifications from the following text:\n\n{text_input}"
@@ -32,20 +49,26 @@ class ChainingAgent:
         
         # --- Build the Chain using LCEL ---
         extraction_chain = prompt_extract | self.llm | StrOutputParser()
-        
-        full_chain = (
-            {"specifications": extraction_chain}
-            | prompt_transform
-            | self.llm
-            | StrOutputParser()
-        )
-        
-        return full_chain
+        return {"specifications": extraction_chain} | prompt_transform
+
+    def extract(self, text_input: str) -> Specifications:
+        """运行链并返回按 schema 校验后的技术规格（不符合时抛出 StructuredOutputError）"""
+        logger.info(f"Extracting specifications from input: {text_input[:50]}...")
+        return self.structured_chain.invoke({"text_input": text_input})
 
     def run(self, text_input: str) -> str:
+        """运行链并返回最终步骤的模型输出原文（需要结构化结果时用 extract()）"""
         logger.info(f"Running chain with input: {text_input[:50]}...")
         return self.chain.invoke({"text_input": text_input})
 
+    async def astream(self, text_input: str) -> AsyncIterator[str]:
+        """流式运行：提取步骤完成后，逐个转发最终JSON步骤的token（边转发边校验）"""
+        logger.info(f"Streaming chain with input: {text_input[:50]}...")
+        self.last_stream_metrics = {}
+        tokens = avalidate_json_stream(self.chain.astream({"text_input": text_input}), Specifications)
+        async for token in track_stream(tokens, self.last_stream_metrics):
+            yield token
+
 if __name__ == "__main__":
     # Test block
     agent = ChainingAgent()
@@ -169,52 +169,78 @@ class Evaluator:
             评估结果列表
         """
         results = []
-        
-        test_cases = self.test_cases
-        if test_case_filter:
-            test_cases = [tc for tc in test_cases if test_case_filter in tc.tags]
-        
+        test_cases = self._select(test_case_filter)
         logger.info(f"Running evaluation on {len(test_cases)} test cases")
         
         for tc in test_cases:
             try:
                 # 执行 Agent
                 actual_output = agent_func(tc.input_data)
-                
-                # 计算指标
-                metrics = self._calculate_metrics(
-                    str(actual_output), 
-                    str(tc.expected_output)
-                )
-                
-                # 判断是否通过
-                overall = sum(m.score * m.weight for m in metrics) / sum(m.weight for m in metrics) if metrics else 0
-                passed = overall >= 0.7  # 阈值
-                
-                result = EvalResult(
-                    test_case_id=tc.id,
-                    input_data=tc.input_data,
-                    expected_output=tc.expected_output,
-                    actual_output=actual_output,
-                    metrics=metrics,
-                    passed=passed
-                )
-                
-                results.append(result)
-                self.results.append(result)
-                
+                results.append(self._score(tc, actual_output))
             except Exception as e:
                 logger.error(f"Evaluation failed for {tc.id}: {e}")
-                results.append(EvalResult(
-                    test_case_id=tc.id,
-                    input_data=tc.input_data,
-                    expected_output=tc.expected_output,
-                    actual_output=f"ERROR: {e}",
-                    passed=False
-                ))
+                results.append(self._error(tc, e))
         
         return results
     
+    def evaluate_model(self, model_id: str = None, prompt_template: str = "{input}",
+                       test_case_filter: str = None) -> List[EvalResult]:
+        """
+        直接评估模型：各测试用例的提示互相独立，经 model_loader.generate_batch 一次提交
+        （支持批处理的后端由微批处理器合并为少量批量调用）
+        
+        Args:
+            model_id: 被评估的模型（默认 active_model）
+            prompt_template: 提示模板，{input} 替换为测试用例输入
+            test_case_filter: 测试用例过滤标签
+        """
+        test_cases = self._select(test_case_filter)
+        logger.info(f"Running batched model evaluation on {len(test_cases)} test cases")
+        prompts = [prompt_template.format(input=tc.input_data) for tc in test_cases]
+        try:
+            outputs = model_loader.generate_batch(prompts, model_id)
+        except Exception as e:
+            logger.error(f"Batched evaluation failed: {e}")
+            return [self._error(tc, e) for tc in test_cases]
+        return [self._score(tc, output) for tc, output in zip(test_cases, outputs)]
+    
+    def _select(self, test_case_filter: Optional[str]) -> List[TestCase]:
+        if test_case_filter:
+            return [tc for tc in self.test_cases if test_case_filter in tc.tags]
+        return self.test_cases
+    
+    def _score(self, tc: TestCase, actual_output: Any) -> EvalResult:
+        """计算指标、判断是否通过并记录结果"""
+        metrics = self._calculate_metrics(
+            str(actual_output), 
+            str(tc.expected_output)
+        )
+        
+        # 判断是否通过
+        overall = sum(m.score * m.weight for m in metrics) / sum(m.weight for m in metrics) if metrics else 0
+        passed = overall >= 0.7  # 阈值
+        
+        result = EvalResult(
+            test_case_id=tc.id,
+            input_data=tc.input_data,
+            expected_output=tc.expected_output,
+            actual_output=actual_output,
+            metrics=metrics,
+            passed=passed
+        )
+        self.results.append(result)
+        return result
+    
+    @staticmethod
+    def _error(tc: TestCase, error: Exception) -> EvalResult:
+        return EvalResult(
+            test_case_id=tc.id,
+            input_data=tc.input_data,
+            expected_output=tc.expected_output,
+            actual_output=f"ERROR: {error}",
+            passed=False
+        )
+    
     def _calculate_metrics(self, predicted: str, expected: str) -> List[EvalMetric]:
         """计算评估指标"""
         metrics = []
@@ -6,15 +6,16 @@ Chapter 11: Goal Setting and Monitoring
 适用于长期任务、项目管理和自主 Agent 系统。
 """
 
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Literal, Optional, Callable
 from dataclasses import dataclass, field
 from enum import Enum, auto
 from datetime import datetime, timedelta
 from src.utils.model_loader import model_loader
+from src.utils.structured_output import structured_llm
+from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from loguru import logger
-import json
 
 
 class GoalStatus(Enum):
@@ -259,6 +260,17 @@ class GoalManager:
         }
 
 
+class SmartGoalSpec(BaseModel):
+    """LLM 输出的 SMART 目标结构"""
+    specific: str = ""
+    measurable: str = ""
+    achievable: str = ""
+    relevant: str = ""
+    time_bound: str = ""
+    milestones: List[str] = Field(default_factory=list)
+    priority: Literal["CRITICAL", "HIGH", "MEDIUM", "LOW"] = "MEDIUM"
+
+
 class GoalSettingAgent:
     """
     目标设定与监控 Agent
@@ -296,11 +308,11 @@ class GoalSettingAgent:
 只输出 JSON，不要其他文字。
 """)
         
-        chain = prompt | self.llm | StrOutputParser()
+        # 约束解码/增量校验保证输出符合 SmartGoalSpec，不再手工解析 JSON
+        chain = prompt | structured_llm(self.llm, SmartGoalSpec)
         
         try:
-            result = chain.invoke({"description": description})
-            smart_data = json.loads(result)
+            smart_data = chain.invoke({"description": description}).model_dump()
             
             # 创建目标
             goal_id = f"goal_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -3,11 +3,12 @@ Memory Management Pattern Implementation
 Chapter 8: Memory Management
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from src.utils.model_loader import model_loader
+from src.utils.tokenizer import tokenizer_service
 from loguru import logger
 
 
@@ -16,6 +17,7 @@ class MemoryAgent:
     
     def __init__(self, model_id: str = None):
         self.llm = model_loader.load_llm(model_id)
+        self.model_id = model_id
         self.short_term_memory: List = []
         self.long_term_memory: Dict = {}
         logger.info("MemoryAgent initialized")
@@ -27,9 +29,25 @@ class MemoryAgent:
         else:
             self.short_term_memory.append(AIMessage(content=message))
     
-    def get_context(self, max_messages: int = 10) -> List:
-        """获取上下文"""
-        return self.short_term_memory[-max_messages:]
+    def get_context(self, max_messages: int = 10, max_tokens: Optional[int] = None) -> List:
+        """获取上下文：最近的 max_messages 条中，从新到旧保留不超过 max_tokens 的部分
+        
+        max_tokens 默认为模型上下文窗口的提示预算。
+        """
+        guard = model_loader.context_guard(self.model_id)
+        if max_tokens is None and guard is not None:
+            max_tokens = guard.budget
+        messages = self.short_term_memory[-max_messages:]
+        if max_tokens is None:
+            return messages
+        model = guard.model if guard is not None else self.model_id
+        kept, used = [], 0
+        for message in reversed(messages):
+            used += tokenizer_service.count_messages([message], model)
+            if used > max_tokens:
+                break
+            kept.append(message)
+        return kept[::-1]
     
     def save_to_long_term(self, key: str, value: Any):
         """保存到长期记忆"""
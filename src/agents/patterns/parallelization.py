@@ -6,7 +6,6 @@ This module demonstrates the Parallelization pattern for executing independent t
 It includes implementations for both LangChain LCEL and conceptual Google ADK approaches.
 """
 
-import asyncio
 from typing import Dict, Any, List
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -93,27 +92,28 @@ class ParallelizationWithMap:
     Useful when you have multiple independent inputs to process.
     """
     
+    PROMPT = "Provide a brief analysis of: {item}"
+    
     def __init__(self, model_id: str = None):
+        self.model_id = model_id
         self.llm = model_loader.load_llm(model_id)
         self.chain = self._build_chain()
     
     def _build_chain(self):
-        prompt = ChatPromptTemplate.from_template(
-            "Provide a brief analysis of: {item}"
-        )
+        prompt = ChatPromptTemplate.from_template(self.PROMPT)
         return prompt | self.llm | StrOutputParser()
     
     def run_batch(self, items: List[str]) -> List[str]:
-        """Process multiple items in parallel."""
+        """
+        Process multiple items in parallel.
+        
+        The items are independent, so they go through model_loader.generate_batch:
+        backends that support batching merge them into a few batched calls via the
+        micro-batcher, others fall back to concurrent LangChain calls.
+        """
         logger.info(f"⚡ Processing {len(items)} items in parallel")
-        # Use ainvoke for async parallel execution
-        return asyncio.run(self._run_batch_async(items))
-    
-    async def _run_batch_async(self, items: List[str]) -> List[str]:
-        """Async helper for batch processing."""
-        tasks = [self.chain.ainvoke(item) for item in items]
-        results = await asyncio.gather(*tasks)
-        return list(results)
+        prompts = [self.PROMPT.format(item=item) for item in items]
+        return model_loader.generate_batch(prompts, self.model_id)
 
 
 # --- Google ADK Style Implementation (Conceptual) ---
@@ -7,11 +7,17 @@ This module demonstrates the Planning pattern for breaking down complex tasks in
 
 from typing import List, Dict, Any
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from pydantic import BaseModel, Field
 from src.utils.model_loader import model_loader
+from src.utils.structured_output import structured_llm
 from loguru import logger
 
 
+class Plan(BaseModel):
+    """Structured plan returned by the LLM."""
+    steps: List[str] = Field(description="Actionable steps in execution order")
+
+
 class PlanningAgent:
     """
     Implements the Planning pattern.
@@ -26,25 +32,17 @@ class PlanningAgent:
     def create_plan(self, task: str) -> List[str]:
         """Create a plan by breaking down the task into steps."""
         planning_prompt = ChatPromptTemplate.from_template(
-            """Break down the following task into a numbered list of steps.
+            """Break down the following task into a list of steps.
             Each step should be a clear, actionable item.
             
             Task: {task}
             
-            Return a numbered list (1., 2., 3., etc.)"""
+            Return a JSON object whose "steps" field lists the steps in execution order."""
         )
         
-        chain = planning_prompt | self.llm | StrOutputParser()
-        result = chain.invoke({"task": task})
-        
-        # Parse steps
-        steps = []
-        for line in result.split('\n'):
-            line = line.strip()
-            if line and (line[0].isdigit() or line.startswith('-')):
-                steps.append(line)
-        
-        return steps
+        # Structured output: steps come back as a validated list, no line parsing
+        chain = planning_prompt | structured_llm(self.llm, Plan)
+        return chain.invoke({"task": task}).steps
     
     def execute_plan(self, task: str) -> Dict[str, Any]:
         """Create and execute a plan."""
@@ -6,13 +6,22 @@ Chapter 14: RAG
 提供更准确、有依据的回答。
 """
 
-from typing import Dict, Any, List, Optional, Callable
-from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Callable, AsyncIterator, Iterable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
 from enum import Enum
 import hashlib
 import json
 from loguru import logger
 from src.utils.model_loader import model_loader
+from src.utils.streaming import track_stream
+from src.utils.tokenizer import tokenizer_service
+from src.utils.bm25 import BM25Index
+from src.utils.embeddings import Embedder, HashingEmbedder
+from src.utils.vector_index import DenseIndex
+from src.utils.metadata_index import DEFAULT_FIELDS, MetadataIndex, filter_candidates
+from src.utils.mapped_store import WAL, MappedDenseIndex, MappedDocuments, MappedSnapshot, WriteAheadLog, \
+    commit_snapshot, stage_snapshot, write_snapshot
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
@@ -43,23 +52,56 @@ class SimpleVectorStore:
     """
     简单向量存储实现
     用于演示 RAG 核心概念（生产环境应使用专用向量数据库）
+    
+    检索模式（search_mode）：
+    - keyword: 增量维护的 BM25 倒排索引（写入/删除时更新）
+    - dense: 向量余弦相似度，向量来自 Document.embedding 或 embedder（默认离线的 HashingEmbedder）
+    
+    dense_index 默认为精确的 DenseIndex；语料很大时可换成近似的 IVFIndex（search 的 search_params 如 nprobe 透传给它）
+    
+    metadata_fields 中的元数据字段建有二级索引：带 filters 的检索先求出候选文档集合，只对候选文档打分
     """
     
-    def __init__(self, name: str = "default"):
+    SEARCH_MODES = ("keyword", "dense")
+    
+    def __init__(self, name: str = "default", embedder: Optional[Embedder] = None,
+                 search_mode: str = "keyword", dense_index: Optional[Any] = None,
+                 metadata_fields: Iterable[str] = DEFAULT_FIELDS):
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"未知的检索模式: {search_mode}，可用: {self.SEARCH_MODES}")
         self.name = name
         self.documents: Dict[str, Document] = {}
+        self.keyword_index = BM25Index()
+        self.metadata_index = MetadataIndex(metadata_fields)
+        self.search_mode = search_mode
+        self.embedder = embedder or (HashingEmbedder() if search_mode == "dense" else None)
+        self.dense_index = dense_index if dense_index is not None else DenseIndex()
         self._initialized = False
         logger.info(f"Vector store '{name}' initialized")
     
     def add_document(self, doc: Document) -> str:
-        """添加文档"""
-        self.documents[doc.id] = doc
-        logger.debug(f"Added document: {doc.id}")
-        return doc.id
+        """添加文档（ID 已存在时覆盖）"""
+        return self.add_documents([doc])[0]
     
     def add_documents(self, docs: List[Document]) -> List[str]:
-        """批量添加文档"""
-        return [self.add_document(d) for d in docs]
+        """批量添加文档（没有 embedding 的文档一次性批量向量化）"""
+        for doc in docs:
+            self.documents[doc.id] = doc
+            self.keyword_index.add(doc.id, doc.content)
+            self.metadata_index.add(doc.id, doc.metadata)
+            logger.debug(f"Added document: {doc.id}")
+        with_vectors = [d for d in docs if d.embedding is not None]
+        if with_vectors:
+            self.dense_index.add_batch([d.id for d in with_vectors], [d.embedding for d in with_vectors])
+        pending = [d for d in docs if d.embedding is None]
+        if pending and self.embedder is not None:
+            self.dense_index.add_batch([d.id for d in pending],
+                                       self.embedder.embed_documents([d.content for d in pending]))
+        else:
+            # 覆盖写入的文档没有新向量：移除旧向量，避免按过期内容命中
+            for doc in pending:
+                self.dense_index.remove(doc.id)
+        return [d.id for d in docs]
     
     def get_document(self, doc_id: str) -> Optional[Document]:
         """获取文档"""
@@ -69,47 +111,204 @@ class SimpleVectorStore:
         """删除文档"""
         if doc_id in self.documents:
             del self.documents[doc_id]
+            self.keyword_index.remove(doc_id)
+            self.metadata_index.remove(doc_id)
+            self.dense_index.remove(doc_id)
             return True
         return False
     
-    def search(self, query: str, top_k: int = 5) -> List[SearchResult]:
+    def search(self, query: str, top_k: int = 5, mode: Optional[str] = None,
+               filters: Optional[Dict[str, Any]] = None, **search_params) -> List[SearchResult]:
         """
-        简单的关键词搜索（演示用）
-        实际实现应使用向量相似度搜索
+        检索前 k 个文档
+        keyword 只遍历查询词的倒排表并用堆选出前 k 个；dense 为一次矩阵向量乘法 + argpartition
+        filters 为元数据等值条件，在打分之前下推为候选集合
         """
-        query_terms = query.lower().split()
-        scored_docs = []
-        
-        for doc in self.documents.values():
-            # 简单的 TF 分数计算
-            score = sum(1 for term in query_terms if term in doc.content.lower())
-            if score > 0:
-                scored_docs.append((doc, score))
-        
-        # 按分数排序
-        scored_docs.sort(key=lambda x: x[1], reverse=True)
-        
-        # 返回前 k 个
-        results = []
-        for i, (doc, score) in enumerate(scored_docs[:top_k], 1):
-            results.append(SearchResult(document=doc, score=score, rank=i))
-        
-        return results
+        return self.search_batch([query], top_k, mode, filters, **search_params)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5, mode: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None, **search_params) -> List[List[SearchResult]]:
+        """批量检索：dense 模式下所有查询合并为一次矩阵乘法"""
+        mode = mode or self.search_mode
+        candidates = filter_candidates(self.metadata_index, filters, self.documents) if filters else None
+        if candidates is not None and not candidates:
+            return [[] for _ in queries]
+        if mode == "dense":
+            if self.embedder is None:
+                raise ValueError("dense 检索需要 embedder")
+            hits = self.dense_index.search_batch(self.embedder.embed_queries(queries), top_k,
+                                                 candidates=candidates, **search_params)
+            # 与关键词检索一致：完全不相关（相似度 <= 0）的文档不返回
+            hits = [[(doc_id, score) for doc_id, score in row if score > 0] for row in hits]
+        else:
+            hits = [self.keyword_index.search(query, top_k, candidates) for query in queries]
+        return [
+            [SearchResult(document=self.documents[doc_id], score=score, rank=i)
+             for i, (doc_id, score) in enumerate(row, 1)]
+            for row in hits
+        ]
     
     def count(self) -> int:
         """文档数量"""
         return len(self.documents)
 
 
+class PersistentVectorStore(SimpleVectorStore):
+    """
+    磁盘持久化的向量存储（格式见 src/utils/mapped_store.py）
+    
+    启动时只读映射快照并重放 WAL，不复制、不重新向量化语料；多个进程可以同时只读打开同一目录。
+    写入先追加到 WAL（含向量），再更新内存；checkpoint() 把 WAL 合并进新快照。
+    BM25 索引与元数据索引需要扫描全部文档，在首次使用时才构建。
+    """
+    
+    # 延迟构建的索引 -> 写入一个文档的方式
+    LAZY_INDEXES = {
+        "keyword_index": lambda index, doc: index.add(doc.id, doc.content),
+        "metadata_index": lambda index, doc: index.add(doc.id, doc.metadata),
+    }
+    
+    def __init__(self, path: str, name: Optional[str] = None, embedder: Optional[Embedder] = None,
+                 search_mode: str = "dense", fsync: bool = False,
+                 metadata_fields: Iterable[str] = DEFAULT_FIELDS):
+        self.path = Path(path)
+        if not MappedSnapshot.exists(self.path):
+            write_snapshot(self.path, [], getattr(embedder, "dim", None) or None)
+        self._lazy: Dict[str, Any] = {}
+        self._built: set = set()
+        super().__init__(name or self.path.name, embedder=embedder, search_mode=search_mode,
+                         metadata_fields=metadata_fields)
+        self.wal = WriteAheadLog(self.path / WAL, fsync=fsync)
+        self._open_snapshot()
+        replayed = self._replay()
+        logger.info(f"💾 Vector store '{self.name}' mapped from {self.path}: "
+                    f"{self.snapshot.count} documents, {replayed} WAL entries replayed")
+    
+    def _open_snapshot(self) -> None:
+        self.snapshot = MappedSnapshot(self.path)
+        self.documents = MappedDocuments(self.snapshot, lambda record: Document(**record))
+        self.dense_index = MappedDenseIndex(self.snapshot)
+    
+    def _lazy_index(self, name: str) -> Any:
+        index = self._lazy[name]
+        if name not in self._built:
+            add = self.LAZY_INDEXES[name]
+            for doc in self.documents.values():
+                add(index, doc)
+            self._built.add(name)
+        return index
+    
+    def _set_lazy_index(self, name: str, index: Any) -> None:
+        self._lazy[name] = index
+        self._built.discard(name)
+    
+    @property
+    def keyword_index(self) -> BM25Index:
+        return self._lazy_index("keyword_index")
+    
+    @keyword_index.setter
+    def keyword_index(self, index: BM25Index) -> None:
+        self._set_lazy_index("keyword_index", index)
+    
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        return self._lazy_index("metadata_index")
+    
+    @metadata_index.setter
+    def metadata_index(self, index: MetadataIndex) -> None:
+        self._set_lazy_index("metadata_index", index)
+    
+    def _replay(self) -> int:
+        count = 0
+        for entry in self.wal.replay():
+            if entry["op"] == "add":
+                self._apply_add([Document(**entry["doc"])])
+            elif entry["op"] == "delete":
+                self._apply_delete(entry["id"])
+            count += 1
+        return count
+    
+    def add_documents(self, docs: List[Document]) -> List[str]:
+        """批量添加文档：向量化后连同向量写入 WAL，重启时无需重新向量化"""
+        pending = [d for d in docs if d.embedding is None]
+        if pending and self.embedder is not None:
+            vectors = self.embedder.embed_documents([d.content for d in pending])
+            for doc, vector in zip(pending, vectors):
+                doc.embedding = vector.tolist()
+        self.wal.append([{"op": "add", "doc": asdict(d)} for d in docs])
+        self._apply_add(docs)
+        return [d.id for d in docs]
+    
+    def _apply_add(self, docs: List[Document]) -> None:
+        for doc in docs:
+            self.documents[doc.id] = doc
+            for name in self._built:
+                self.LAZY_INDEXES[name](self._lazy[name], doc)
+        with_vectors = [d for d in docs if d.embedding is not None]
+        if with_vectors:
+            self.dense_index.add_batch([d.id for d in with_vectors], [d.embedding for d in with_vectors])
+        for doc in docs:
+            if doc.embedding is None:
+                self.dense_index.remove(doc.id)
+    
+    def delete_document(self, doc_id: str) -> bool:
+        """删除文档"""
+        if doc_id not in self.documents:
+            return False
+        self.wal.append([{"op": "delete", "id": doc_id}])
+        self._apply_delete(doc_id)
+        return True
+    
+    def _apply_delete(self, doc_id: str) -> None:
+        if doc_id in self.documents:
+            del self.documents[doc_id]
+        for name in self._built:
+            self._lazy[name].remove(doc_id)
+        self.dense_index.remove(doc_id)
+    
+    def checkpoint(self) -> int:
+        """把快照与 WAL 合并为新快照并清空 WAL，返回文档数"""
+        vectors = dict(self.dense_index.items())
+        records = (
+            {"id": doc.id, "content": doc.content, "metadata": doc.metadata, "embedding": vectors.get(doc.id)}
+            for doc in self.documents.values()
+        )
+        count = stage_snapshot(self.path, records, self.dense_index.dim)
+        del vectors, records
+        # 切换 CURRENT 之后、清空 WAL 之前崩溃时，重放 WAL 是幂等的
+        commit_snapshot(self.path)
+        self.wal.truncate()
+        self.snapshot.close()
+        self._open_snapshot()
+        logger.info(f"💾 Vector store '{self.name}' checkpointed: {count} documents")
+        return count
+    
+    def close(self) -> None:
+        self.wal.close()
+        self.snapshot.close()
+    
+    def get_storage_stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "mapped_documents": self.snapshot.count,
+            "overlay_documents": len(self.documents.overlay),
+            "wal_bytes": self.wal.size(),
+            "indexes_built": sorted(self._built),
+        }
+
+
 class Retriever:
     """
     检索器
     负责从向量存储中检索相关文档
     """
     
-    def __init__(self, vector_store: SimpleVectorStore, top_k: int = 5):
+    def __init__(self, vector_store: SimpleVectorStore, top_k: int = 5,
+                 search_params: Optional[Dict[str, Any]] = None):
         self.vector_store = vector_store
         self.top_k = top_k
+        # 透传给索引的检索参数（如 IVFIndex 的 nprobe），用于权衡召回率与延迟
+        self.search_params = search_params or {}
     
     def retrieve(self, query: str, filters: Dict[str, Any] = None) -> List[SearchResult]:
         """
@@ -122,30 +321,22 @@ class Retriever:
         Returns:
             搜索结果列表
         """
-        results = self.vector_store.search(query, self.top_k)
-        
-        # 应用过滤器
-        if filters:
-            filtered = []
-            for result in results:
-                doc_metadata = result.document.metadata
-                match = all(
-                    doc_metadata.get(k) == v for k, v in filters.items()
-                )
-                if match:
-                    filtered.append(result)
-            results = filtered
+        # 过滤条件下推到存储：先按元数据索引求候选集合，只在候选文档中取前 k 个
+        results = self.vector_store.search(query, self.top_k, filters=filters, **self.search_params)
         
         logger.info(f"Retrieved {len(results)} documents for query: {query[:50]}...")
         return results
     
-    def get_context_string(self, query: str, max_length: int = 2000) -> str:
+    def get_context_string(self, query: str, max_length: int = 2000,
+                           max_tokens: Optional[int] = None, model: Optional[str] = None) -> str:
         """
         获取格式化的上下文字符串
         
         Args:
             query: 查询字符串
-            max_length: 最大长度
+            max_length: 最大长度（字符）
+            max_tokens: 最大 token 数（按 model 的分词器计数，None 表示不限）
+            model: 计数使用的模型
         
         Returns:
             格式化的上下文
@@ -157,6 +348,7 @@ class Retriever:
         
         contexts = []
         current_length = 0
+        current_tokens = 0
         
         for result in results:
             doc = result.document
@@ -164,6 +356,12 @@ class Retriever:
             
             if current_length + len(context_text) > max_length:
                 break
+            if max_tokens is not None:
+                # 分隔符 "\n---\n" 约 3 个 token
+                tokens = tokenizer_service.count(context_text, model) + 3
+                if current_tokens + tokens > max_tokens:
+                    break
+                current_tokens += tokens
             
             contexts.append(context_text)
             current_length += len(context_text)
@@ -181,8 +379,10 @@ class RAGAgent:
                  vector_store: Optional[SimpleVectorStore] = None,
                  top_k: int = 5):
         self.llm = model_loader.load_llm(model_id)
+        self.model_id = model_id
         self.vector_store = vector_store or SimpleVectorStore()
         self.retriever = Retriever(self.vector_store, top_k=top_k)
+        self.last_stream_metrics: Dict[str, float] = {}
         effective_id = model_id if model_id else model_loader.active_model_id
         logger.info(f"📚 RAGAgent initialized with model: {effective_id}")
     
@@ -198,6 +398,7 @@ class RAGAgent:
             文档 ID
         """
         doc = Document(
+            id="",
             content=content,
             metadata=metadata or {}
         )
@@ -206,7 +407,7 @@ class RAGAgent:
     def ingest_documents(self, documents: List[Dict[str, Any]]) -> List[str]:
         """批量摄入文档"""
         docs = [
-            Document(content=d["content"], metadata=d.get("metadata", {}))
+            Document(id=d.get("id", ""), content=d["content"], metadata=d.get("metadata", {}))
             for d in documents
         ]
         return self.vector_store.add_documents(docs)
@@ -222,8 +423,8 @@ class RAGAgent:
         Returns:
             包含回答和元数据的字典
         """
-        # 1. 检索相关文档
-        context = self.retriever.get_context_string(question)
+        # 1. 检索相关文档（按上下文窗口剩余的 token 数取文档）
+        context = self._get_context(question)
         
         if not context:
             logger.warning("No relevant documents found")
@@ -233,24 +434,8 @@ class RAGAgent:
                 "context_used": False
             }
         
-        # 2. 构建 RAG 提示
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """你是一个基于检索的问答助手。使用以下检索到的上下文来回答问题。
-如果上下文中没有足够信息，请明确说明。
-始终保持回答的准确性和相关性。"""),
-            ("user", """上下文信息:
-{context}
-
-基于以上上下文，回答问题: {question}
-
-要求:
-1. 只使用上下文中的信息
-2. 如果信息不足，直接说明
-3. 引用来源时标注 [source:X]""")
-        ])
-        
-        # 3. 生成回答
-        chain = prompt | self.llm | StrOutputParser()
+        # 2. 构建 RAG 提示并生成回答
+        chain = self._answer_chain()
         answer = chain.invoke({
             "context": context,
             "question": question
@@ -278,6 +463,56 @@ class RAGAgent:
             "context_used": True
         }
     
+    async def astream(self, question: str) -> AsyncIterator[str]:
+        """
+        流式查询：检索完成后逐个转发回答的 token
+        
+        首token延迟等指标写入 self.last_stream_metrics
+        """
+        self.last_stream_metrics = {}
+        context = self._get_context(question)
+        
+        if not context:
+            logger.warning("No relevant documents found")
+            yield "未找到相关信息。"
+            return
+        
+        stream = self._answer_chain().astream({
+            "context": context,
+            "question": question
+        })
+        async for token in track_stream(stream, self.last_stream_metrics):
+            yield token
+    
+    def _get_context(self, question: str) -> str:
+        """检索上下文，文档总量不超过提示模板与问题之外剩余的 token 预算"""
+        guard = model_loader.context_guard(self.model_id)
+        if guard is None:
+            return self.retriever.get_context_string(question)
+        template = self._answer_prompt().format_messages(context="", question=question)
+        budget = max(0, guard.budget - guard.count(template))
+        return self.retriever.get_context_string(question, max_tokens=budget, model=guard.model)
+    
+    def _answer_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_messages([
+            ("system", """你是一个基于检索的问答助手。使用以下检索到的上下文来回答问题。
+如果上下文中没有足够信息，请明确说明。
+始终保持回答的准确性和相关性。"""),
+            ("user", """上下文信息:
+{context}
+
+基于以上上下文，回答问题: {question}
+
+要求:
+1. 只使用上下文中的信息
+2. 如果信息不足，直接说明
+3. 引用来源时标注 [source:X]""")
+        ])
+    
+    def _answer_chain(self):
+        """RAG 回答链（提示 -> LLM -> 文本）"""
+        return self._answer_prompt() | self.llm | StrOutputParser()
+    
     def add_to_knowledge_base(self, texts: List[str], 
                              source: str = "user_upload",
                              chunk_size: int = 500) -> List[str]:
@@ -325,6 +560,9 @@ class RAGAgent:
         return {
             "total_documents": self.vector_store.count(),
             "vector_store_name": self.vector_store.name,
+            "search_mode": self.vector_store.search_mode,
+            "keyword_index": self.vector_store.keyword_index.get_stats(),
+            "dense_index": self.vector_store.dense_index.get_stats(),
             "retriever_top_k": self.retriever.top_k
         }
 
@@ -10,6 +10,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import HumanMessage, SystemMessage
 from src.utils.model_loader import model_loader
+from src.utils.tokenizer import tokenizer_service
 from loguru import logger
 
 
@@ -21,6 +22,7 @@ class ReflectionAgent:
     
     def __init__(self, model_id: str = None):
         self.llm = model_loader.load_llm(model_id)
+        self.model_id = model_id
         effective_id = model_id if model_id else model_loader.active_model_id
         logger.info(f"🔄 ReflectionAgent initialized with model: {effective_id}")
     
@@ -37,10 +39,31 @@ class ReflectionAgent:
                 "Task: {task}\n\nPrevious attempt:\n{previous}\n\n"
                 "Please refine the solution based on the following critique:\n{critique}"
             )
+            previous = history[-1]["output"]
+            return (prompt | self.llm | StrOutputParser()).invoke({
+                "task": task,
+                "previous": previous,
+                "critique": self._fit_critiques(history, task, previous),
+            })
         
         chain = prompt | self.llm | StrOutputParser()
         return chain.invoke({"task": task})
     
+    def _fit_critiques(self, history: List, *fixed: str) -> str:
+        """最新的评审在前，早期评审在上下文窗口放不下时被丢弃"""
+        critiques = [h["critique"] for h in reversed(history)]
+        guard = model_loader.context_guard(self.model_id)
+        if guard is None:
+            return "\n\n".join(critiques)
+        budget = guard.available(*fixed)
+        kept = []
+        for critique in critiques:
+            budget -= tokenizer_service.count(critique, guard.model) + 2
+            if budget < 0 and kept:
+                break
+            kept.append(critique)
+        return "\n\n".join(kept)
+    
     def reflect(self, task: str, output: str) -> str:
         """Critique the generated output."""
         reflector_prompt = ChatPromptTemplate.from_messages([
@@ -1,7 +1,9 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableBranch
+from typing import AsyncIterator, Dict
 from src.utils.model_loader import model_loader
+from src.utils.streaming import track_stream
 from loguru import logger
 
 class RoutingAgent:
@@ -13,8 +15,12 @@ class RoutingAgent:
     
     def __init__(self, model_id: str = None):
         self.llm = model_loader.load_llm(model_id)
+        # cascade.enabled 开启且未指定模型时分类步骤走级联（小模型给出合法标签即可，否则升级）
+        cascade = model_loader.load_cascade("routing") if model_id is None else None
+        self.router_llm = cascade if cascade is not None else self.llm
         effective_id = model_id if model_id else model_loader.active_model_id
         self.chain = self._build_chain()
+        self.last_stream_metrics: Dict[str, float] = {}
         logger.info(f"🔀 RoutingAgent initialized with model: {effective_id}")
 
     def _booking_handler(self, request: str) -> str:
@@ -39,7 +45,7 @@ class RoutingAgent:
             """
         )
         
-        router_chain = router_prompt | self.llm | StrOutputParser()
+        router_chain = router_prompt | self.router_llm | StrOutputParser()
         
         # --- Branching Logic ---
         branch = RunnableBranch(
@@ -64,6 +70,13 @@ class RoutingAgent:
         logger.info(f"Routing request: {request}")
         return self.chain.invoke({"request": request})
 
+    async def astream(self, request: str) -> AsyncIterator[str]:
+        """流式运行：分类完成后立即输出处理器结果"""
+        logger.info(f"Streaming routing request: {request}")
+        self.last_stream_metrics = {}
+        async for chunk in track_stream(self.chain.astream({"request": request}), self.last_stream_metrics):
+            yield chunk
+
 if __name__ == "__main__":
     agent = RoutingAgent()
     
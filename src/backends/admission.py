@@ -0,0 +1,244 @@
+"""
+准入控制 - 按后端YAML限制并发
+
+并发上限来自后端配置：features.supports_concurrent 为 false 时为 1，
+否则取 benchmarks.max_concurrent_users。超出上限的请求按优先级排队（数值越小越先执行），
+排队超时或队列已满时抛出 AdmissionRejected，使过载时的表现可预期，而不是在后端超时。
+同一个控制器同时服务同步线程和异步协程。
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from .base import DelegatingBackend, ModelBackend, ModelResponse
+
+# 当前调用链已持有名额时，嵌套调用（如 generate 内部走 stream）不再重复申请
+_holding: contextvars.ContextVar[frozenset] = contextvars.ContextVar("admission_holding", default=frozenset())
+
+
+def _reset_holding(token: contextvars.Token) -> None:
+    try:
+        _holding.reset(token)
+    except ValueError:
+        # 生成器在其他上下文中被关闭（如GC回收），该上下文随之丢弃，无需恢复
+        pass
+
+
+class AdmissionRejected(RuntimeError):
+    """队列已满或排队超时，请求被拒绝"""
+    pass
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionController:
+    """
+    并发准入控制器
+
+    - max_concurrent: 同时执行的请求数上限
+    - max_queue: 排队请求数上限（超出立即拒绝）
+    - max_wait: 最长排队时间（秒），None 表示不限
+    """
+
+    def __init__(self, name: str, max_concurrent: int = 1, max_queue: int = 32,
+                 max_wait: Optional[float] = 120.0):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue: List[tuple] = []  # (priority, seq, waiter)
+        self._seq = itertools.count()
+        self.stats = {
+            "admitted": 0, "rejected": 0, "timed_out": 0,
+            "max_queue_depth": 0, "total_wait": 0.0, "max_wait": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, name: str, config: Dict[str, Any]) -> Optional["AdmissionController"]:
+        """根据后端YAML构建；admission.enabled 为 false 时返回 None"""
+        options = config.get("admission", {})
+        if not options.get("enabled", True):
+            return None
+        if config.get("features", {}).get("supports_concurrent", True):
+            limit = options.get("max_concurrent", config.get("benchmarks", {}).get("max_concurrent_users", 8))
+        else:
+            limit = 1
+        return cls(
+            name,
+            max_concurrent=limit,
+            max_queue=options.get("max_queue", 32),
+            max_wait=options.get("max_wait", 120.0),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _try_enter(self, priority: int, waiter: _Waiter) -> bool:
+        """持锁调用：有空闲名额则直接进入，否则入队；队列满时拒绝"""
+        if self._in_flight < self.max_concurrent and not self._queue:
+            self._in_flight += 1
+            return True
+        if len(self._queue) >= self.max_queue:
+            self.stats["rejected"] += 1
+            logger.warning(f"⛔ 后端 {self.name} 队列已满，拒绝请求")
+            raise AdmissionRejected(
+                f"后端 {self.name} 过载: 并发 {self._in_flight}/{self.max_concurrent}，"
+                f"排队 {len(self._queue)}/{self.max_queue}"
+            )
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._queue))
+        return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """排队超时/取消：若名额已在同一时刻移交，则保留名额返回 True"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._queue = [item for item in self._queue if item[2] is not waiter]
+            heapq.heapify(self._queue)
+            self.stats["timed_out"] += 1
+            return False
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True  # 名额直接移交，in_flight 不变
+                waiter.wake()
+                return
+            self._in_flight -= 1
+
+    def _admitted(self, start: float) -> None:
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.stats["admitted"] += 1
+            self.stats["total_wait"] += waited
+            self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+
+    def _timeout_error(self) -> AdmissionRejected:
+        return AdmissionRejected(f"后端 {self.name} 排队超过 {self.max_wait}s，请求被拒绝")
+
+    @contextmanager
+    def slot(self, priority: int = 0) -> Iterator[None]:
+        """同步获取执行名额"""
+        if self.name in _holding.get():
+            yield
+            return
+        start = time.perf_counter()
+        waiter = _Waiter()
+        with self._lock:
+            entered = self._try_enter(priority, waiter)
+        if not entered and not waiter.event.wait(self.max_wait):
+            if not self._abandon(waiter):
+                raise self._timeout_error()
+        self._admitted(start)
+        token = _holding.set(_holding.get() | {self.name})
+        try:
+            yield
+        finally:
+            _reset_holding(token)
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = 0) -> AsyncIterator[None]:
+        """异步获取执行名额（排队时不阻塞事件循环）"""
+        if self.name in _holding.get():
+            yield
+            return
+        start = time.perf_counter()
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            entered = self._try_enter(priority, waiter)
+        if not entered:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if not self._abandon(waiter):
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    raise self._timeout_error() from None
+                if isinstance(e, asyncio.CancelledError):
+                    self._release()
+                    raise
+        self._admitted(start)
+        token = _holding.set(_holding.get() | {self.name})
+        try:
+            yield
+        finally:
+            _reset_holding(token)
+            self._release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """队列深度、在途数与等待时间"""
+        with self._lock:
+            admitted = self.stats["admitted"]
+            return {
+                **self.stats,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+                "max_concurrent": self.max_concurrent,
+                "avg_wait": self.stats["total_wait"] / admitted if admitted else 0.0,
+            }
+
+
+class AdmittedBackend(DelegatingBackend):
+    """在生成类调用外层套上准入控制；调用方可通过 priority 关键字指定优先级"""
+
+    def __init__(self, inner: ModelBackend, controller: AdmissionController):
+        super().__init__(inner)
+        self.admission = controller
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        with self.admission.slot(kwargs.pop("priority", 0)):
+            return self.inner.generate(prompt, **kwargs)
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        async with self.admission.aslot(kwargs.pop("priority", 0)):
+            return await self.inner.agenerate(prompt, **kwargs)
+
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        # 一个批次在后端是一次请求，只占一个名额
+        with self.admission.slot(kwargs.pop("priority", 0)):
+            return self.inner.generate_batch(prompts, **kwargs)
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        async with self.admission.aslot(kwargs.pop("priority", 0)):
+            async for chunk in self.inner.generate_stream(prompt, **kwargs):
+                yield chunk
@@ -1,13 +1,65 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, AsyncIterator, List, Optional
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Type, TypeVar
 from pydantic import BaseModel
 
+from .structured import IncrementalJSONValidator, StructuredOutputError, guided_kwargs, parse_structured, \
+    schema_instruction
+
+T = TypeVar("T", bound=BaseModel)
+
+def is_sampled(parameters: Dict[str, Any]) -> bool:
+    """temperature > 0 视为随机采样"""
+    return float((parameters or {}).get("temperature", 0) or 0) > 0
+
+
+def close_on_loop(close: Callable[[], Awaitable[Any]], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """
+    在异步客户端所属的事件循环上执行 close()
+    
+    aiohttp / httpx 的异步连接池只能在创建它的循环中关闭：该循环仍在运行时（本线程或其他线程）把 close 投递过去；
+    循环已停止或关闭时连接随循环一起失效，只丢弃引用。
+    """
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        loop.create_task(close())
+    else:
+        asyncio.run_coroutine_threadsafe(close(), loop)
+
+
 class ModelResponse(BaseModel):
     """统一响应格式"""
     content: str
     tool_calls: list = []
     usage: Dict[str, int] = {}
     latency: float = 0.0
+    time_to_first_token: Optional[float] = None  # 首token延迟（秒）
+    inter_token_latency: Optional[float] = None  # 平均token间隔（秒）
+
+class StreamTimer:
+    """流式输出计时：每个分块携带截至当前的总延迟、首token延迟和平均分块间隔"""
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.chunks = 0
+    
+    def tick(self) -> Dict[str, float]:
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        self.chunks += 1
+        return {
+            "latency": now - self.start,
+            "time_to_first_token": self.first - self.start,
+            "inter_token_latency": (now - self.first) / (self.chunks - 1) if self.chunks > 1 else 0.0,
+        }
 
 class ModelBackend(ABC):
     """模型后端抽象基类 - 支持Ollama/vLLM/HTTP"""
@@ -22,11 +74,56 @@ class ModelBackend(ABC):
         """同步生成"""
         pass
     
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        """异步生成。默认在线程池中执行generate，后端应提供原生非阻塞实现"""
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+    
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        """批量生成（同一组采样参数）。默认逐条调用generate，支持批处理的后端应覆盖"""
+        return [self.generate(p, **kwargs) for p in prompts]
+    
+    async def agenerate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        """异步批量生成。默认并发调用agenerate"""
+        return list(await asyncio.gather(*(self.agenerate(p, **kwargs) for p in prompts)))
+    
     @abstractmethod
     async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
         """流式生成"""
         pass
     
+    # 后端能否按 JSON Schema 约束解码（generate 的 json_schema 关键字）
+    supports_guided_decoding: bool = False
+    
+    def generate_structured(self, prompt: str, schema: Type[T], **kwargs) -> T:
+        """
+        按 Pydantic schema 生成并校验结构化结果（不符合时抛出 StructuredOutputError）
+        
+        不支持约束解码时只是普通的 generate 加事后校验：后端只提供异步流式接口，同步路径无法在格式出错时
+        提前中止，会等模型写完整段输出。需要提前中止时使用 agenerate_structured。
+        """
+        prompt = f"{prompt}\n\n{schema_instruction(schema)}"
+        if self.supports_guided_decoding:
+            kwargs.update(guided_kwargs(schema))
+        return parse_structured(self.generate(prompt, **kwargs).content, schema)
+    
+    async def agenerate_structured(self, prompt: str, schema: Type[T], **kwargs) -> T:
+        """异步结构化生成：不支持约束解码时走流式输出并增量校验，格式一出错即中止生成"""
+        prompt = f"{prompt}\n\n{schema_instruction(schema)}"
+        if self.supports_guided_decoding:
+            response = await self.agenerate(prompt, **kwargs, **guided_kwargs(schema))
+            return parse_structured(response.content, schema)
+        validator = IncrementalJSONValidator(schema=schema)
+        stream = self.generate_stream(prompt, **kwargs)
+        try:
+            async for chunk in stream:
+                if validator.feed(chunk.content):
+                    break
+        finally:
+            await stream.aclose()
+        if not validator.complete:
+            raise StructuredOutputError(f"输出在 JSON 完整之前结束: {validator.text[-80:]!r}")
+        return parse_structured(validator.text, schema)
+    
     @abstractmethod
     def is_available(self) -> bool:
         """检查后端服务是否可用"""
@@ -46,3 +143,76 @@ class ModelBackend(ABC):
     def base_url(self) -> str:
         """获取Base URL"""
         return getattr(self, "_base_url", "")
+
+    def close(self) -> None:
+        """释放后端持有的连接等资源（默认无操作）"""
+        pass
+
+    async def aclose(self) -> None:
+        """异步释放资源（默认调用close）"""
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+class DelegatingBackend(ModelBackend):
+    """包装另一个后端的基类：默认全部委托给 inner，子类只覆盖需要增强的方法"""
+    
+    def __init__(self, inner: ModelBackend):
+        self.inner = inner
+    
+    def __getattr__(self, name: str):
+        # 其余属性（config、连接池等）透传给被包装的后端
+        return getattr(self.inner, name)
+    
+    @property
+    def base_url(self) -> str:
+        return self.inner.base_url
+    
+    @property
+    def supports_guided_decoding(self) -> bool:
+        return self.inner.supports_guided_decoding
+    
+    def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
+        return self.inner.load_model(model_id, config)
+    
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        return self.inner.generate(prompt, **kwargs)
+    
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        return await self.inner.agenerate(prompt, **kwargs)
+    
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        return self.inner.generate_batch(prompts, **kwargs)
+    
+    async def agenerate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        return await self.inner.agenerate_batch(prompts, **kwargs)
+    
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        async for chunk in self.inner.generate_stream(prompt, **kwargs):
+            yield chunk
+    
+    def is_available(self) -> bool:
+        return self.inner.is_available()
+    
+    def get_model_info(self, model_id: str) -> Dict[str, Any]:
+        return self.inner.get_model_info(model_id)
+    
+    def list_loaded_models(self) -> List[str]:
+        return self.inner.list_loaded_models()
+    
+    def close(self) -> None:
+        self.inner.close()
+    
+    async def aclose(self) -> None:
+        await self.inner.aclose()
@@ -0,0 +1,187 @@
+"""
+客户端微批处理
+
+在很短的时间窗口内收集多个独立请求，合并为一次 generate_batch 调用，
+再把结果分发回各自的 Future。适用于大量小而独立的提示（批量评估、map 式并行）。
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from .base import ModelBackend, ModelResponse
+
+
+@dataclass
+class _PendingRequest:
+    key: str
+    prompt: str
+    kwargs: Dict[str, Any]
+    future: Future = field(default_factory=Future)
+
+
+class MicroBatcher:
+    """
+    微批处理器
+    
+    - 按采样参数分组：只有 model/parameters 相同的请求才会合并
+    - 达到 max_batch_size 或窗口 window_ms 到期即提交
+    - 后端不支持批处理（features.supports_batching: false）时直接透传
+    """
+    
+    def __init__(self, backend: ModelBackend, max_batch_size: int = 16,
+                 window_ms: float = 5.0, max_inflight_batches: int = 4,
+                 enabled: bool = True):
+        self.backend = backend
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000.0
+        self.enabled = enabled
+        self._max_inflight_batches = max_inflight_batches
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+    
+    @classmethod
+    def from_config(cls, backend: ModelBackend, config: Dict[str, Any]) -> "MicroBatcher":
+        """根据后端YAML构建：features.supports_batching 决定是否启用，batching 段提供参数"""
+        features = config.get("features", {})
+        options = config.get("batching", {})
+        return cls(
+            backend,
+            max_batch_size=options.get("max_batch_size", 16),
+            window_ms=options.get("window_ms", 5.0),
+            max_inflight_batches=options.get("max_inflight_batches", 4),
+            enabled=bool(features.get("supports_batching", False)) and options.get("enabled", True),
+        )
+    
+    def submit(self, prompt: str, **kwargs) -> Future:
+        """提交请求，返回 concurrent.futures.Future"""
+        if self._closed:
+            raise RuntimeError("MicroBatcher已关闭")
+        self._record(requests=1)
+        if not self.enabled:
+            future: Future = Future()
+            try:
+                future.set_result(self.backend.generate(prompt, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        
+        self._ensure_worker()
+        request = _PendingRequest(
+            key=json.dumps(kwargs, sort_keys=True, default=str),
+            prompt=prompt,
+            kwargs=kwargs,
+        )
+        self._queue.put(request)
+        return request.future
+    
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        """同步生成（阻塞直到所在批次完成）"""
+        return self.submit(prompt, **kwargs).result()
+    
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        """异步生成"""
+        if not self.enabled:
+            self._record(requests=1)
+            return await self.backend.agenerate(prompt, **kwargs)
+        return await asyncio.wrap_future(self.submit(prompt, **kwargs))
+    
+    def _record(self, requests: int = 0, batch_size: int = 0) -> None:
+        # 统计在提交线程与批次线程池中并发更新
+        with self._stats_lock:
+            self.stats["requests"] += requests
+            if batch_size:
+                self.stats["batches"] += 1
+                self.stats["max_batch"] = max(self.stats["max_batch"], batch_size)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            batches = self.stats["batches"]
+            return {**self.stats, "enabled": self.enabled,
+                    "avg_batch": round(self.stats["requests"] / batches, 2) if batches else 0.0}
+    
+    def close(self) -> None:
+        """停止后台线程，已入队的请求会先处理完"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            worker = self._worker
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+    
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_inflight_batches,
+                    thread_name_prefix="micro-batch",
+                )
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker.start()
+    
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            groups: Dict[str, List[_PendingRequest]] = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for group in groups.values():
+                self._executor.submit(self._dispatch, group)
+            if stop:
+                return
+    
+    def _dispatch(self, group: List[_PendingRequest]) -> None:
+        self._record(batch_size=len(group))
+        try:
+            responses = self.backend.generate_batch(
+                [r.prompt for r in group], **group[0].kwargs
+            )
+        except Exception as e:
+            logger.error(f"微批处理失败 (size={len(group)}): {e}")
+            for request in group:
+                request.future.set_exception(e)
+            return
+        responses = list(responses)
+        if len(responses) != len(group):
+            logger.error(f"微批处理返回数量不符: 请求 {len(group)} 条，响应 {len(responses)} 条")
+        for request, response in zip(group, responses):
+            request.future.set_result(response)
+        for request in group[len(responses):]:
+            request.future.set_exception(
+                RuntimeError(f"微批处理缺少响应 (size={len(group)}, responses={len(responses)})"))
@@ -0,0 +1,267 @@
+"""
+对冲请求（hedged requests）
+
+请求在最近延迟的某个分位数（如 p95）内仍未拿到首个 token 时，向另一个副本发出一份相同请求，
+先返回者胜出，落后者被取消。只在多副本时生效，用少量额外请求削掉单个慢副本或 GC 停顿造成的长尾。
+"""
+
+import asyncio
+import bisect
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+from loguru import logger
+
+from .load_balancer import Endpoint, EndpointPool
+
+T = TypeVar("T")
+
+# 延迟直方图桶上界（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+
+class LatencyTracker:
+    """延迟直方图（累计）+ 最近 window 个样本（用于计算分位数）"""
+
+    def __init__(self, window: int = 200):
+        self._recent: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.histogram: Dict[str, int] = {f"le_{b}": 0 for b in LATENCY_BUCKETS}
+        self.count = 0
+
+    def observe(self, latency: float) -> None:
+        with self._lock:
+            self._recent.append(latency)
+            self.count += 1
+            bound = LATENCY_BUCKETS[bisect.bisect_left(LATENCY_BUCKETS, latency)]
+            self.histogram[f"le_{bound}"] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """最近样本的 q 分位数（0-100），无样本时为 None"""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q / 100 * len(samples))) - 1))
+        return samples[index]
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "histogram": dict(self.histogram),
+        }
+
+
+class HedgePolicy:
+    """
+    对冲策略
+
+    - percentile: 触发对冲的延迟分位数
+    - min_samples: 样本不足时使用 initial_delay
+    - min_delay: 对冲等待下限（秒），防止延迟普遍很低时几乎每个请求都被对冲
+    - max_hedges: 每个请求最多追加的副本请求数
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_samples: int = 20,
+                 initial_delay: float = 1.0, min_delay: float = 0.05, max_hedges: int = 1,
+                 window: int = 200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_hedges = max_hedges
+        self.latency: Dict[str, LatencyTracker] = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "cancelled": 0}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HedgePolicy":
+        """根据后端YAML的 hedging 段构建"""
+        options = config.get("hedging", {})
+        return cls(
+            enabled=options.get("enabled", False),
+            percentile=options.get("percentile", 95),
+            min_samples=options.get("min_samples", 20),
+            initial_delay=options.get("initial_delay", 1.0),
+            min_delay=options.get("min_delay", 0.05),
+            max_hedges=options.get("max_hedges", 1),
+            window=options.get("window", 200),
+        )
+
+    def tracker(self, kind: str) -> LatencyTracker:
+        if kind not in self.latency:
+            with self._lock:
+                self.latency.setdefault(kind, LatencyTracker(self._window))
+        return self.latency[kind]
+
+    def observe(self, kind: str, latency: float) -> None:
+        self.tracker(kind).observe(latency)
+
+    def delay(self, kind: str) -> float:
+        """发出对冲请求前的等待时间"""
+        tracker = self.tracker(kind)
+        if len(tracker) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "latency": {kind: t.to_dict() for kind, t in self.latency.items()},
+        }
+
+
+class _Race:
+    """一次对冲请求的簿记：已尝试的端点、剩余对冲/重试次数"""
+
+    def __init__(self, pool: EndpointPool, policy: HedgePolicy, max_retries: int):
+        self.pool = pool
+        self.policy = policy
+        self.tried: list = []
+        self.hedged: set = set()
+        self.hedges = 0
+        self.retries = max_retries
+        self.last_error: Optional[BaseException] = None
+
+    def next_endpoint(self) -> Optional[Endpoint]:
+        endpoint = self.pool.select(exclude=self.tried)
+        if endpoint is None or endpoint.url in self.tried:
+            return None
+        self.tried.append(endpoint.url)
+        return endpoint
+
+    def timeout(self, delay: float) -> Optional[float]:
+        return delay if self.hedges < self.policy.max_hedges else None
+
+    def hedge(self) -> Optional[Endpoint]:
+        endpoint = self.next_endpoint()
+        # 没有其他副本可用时不再尝试对冲，只等待在途请求
+        self.hedges = self.policy.max_hedges if endpoint is None else self.hedges + 1
+        if endpoint is not None:
+            self.hedged.add(endpoint.url)
+            self.policy._count("hedged")
+            logger.debug(f"⏱️ 请求超过对冲阈值，追加副本请求: {endpoint.url}")
+        return endpoint
+
+    def won(self, endpoint: Endpoint, losers: int) -> None:
+        if endpoint.url in self.hedged:
+            self.policy._count("hedge_wins")
+        if losers:
+            self.policy._count("cancelled", losers)
+
+    def failed(self, error: BaseException) -> Optional[Endpoint]:
+        """一个尝试失败；还有重试次数时换副本补发"""
+        self.last_error = error
+        if self.retries <= 0:
+            return None
+        self.retries -= 1
+        return self.next_endpoint()
+
+    def error(self) -> BaseException:
+        return self.last_error or RuntimeError("没有可用的端点")
+
+
+def hedged_call(pool: EndpointPool, policy: HedgePolicy, kind: str, executor: Executor,
+                attempt: Callable[[Endpoint], T], retryable: Tuple[Type[BaseException], ...],
+                max_retries: int = 0) -> T:
+    """
+    同步对冲调用：attempt 在线程池中执行，落后者的结果被丢弃
+
+    同步HTTP请求无法中途中止，落后的请求会在后台跑完后归还连接（结果直接丢弃）。
+    """
+    race = _Race(pool, policy, max_retries)
+    policy._count("requests")
+    delay = policy.delay(kind)
+    start = time.perf_counter()
+    endpoint = race.next_endpoint()
+    if endpoint is None:
+        raise race.error()
+    futures = {executor.submit(attempt, endpoint): endpoint}
+    while futures:
+        done, _ = wait(futures, timeout=race.timeout(max(0.0, delay - (time.perf_counter() - start))),
+                       return_when=FIRST_COMPLETED)
+        if not done:
+            endpoint = race.hedge()
+            if endpoint is not None:
+                futures[executor.submit(attempt, endpoint)] = endpoint
+            continue
+        for future in done:
+            endpoint = futures.pop(future)
+            error = future.exception()
+            if error is None:
+                for loser in futures:
+                    loser.cancel()
+                race.won(endpoint, len(futures))
+                policy.observe(kind, time.perf_counter() - start)
+                return future.result()
+            if not isinstance(error, retryable):
+                raise error
+            retry = race.failed(error)
+            if retry is not None:
+                futures[executor.submit(attempt, retry)] = retry
+    raise race.error()
+
+
+async def ahedged_call(pool: EndpointPool, policy: HedgePolicy, kind: str,
+                       attempt: Callable[[Endpoint], Awaitable[T]],
+                       retryable: Tuple[Type[BaseException], ...], max_retries: int = 0,
+                       discard: Optional[Callable[[T], Awaitable[None]]] = None) -> T:
+    """
+    异步对冲调用：胜出者返回后取消其余在途尝试（中止对应的HTTP请求）
+
+    discard 用于释放与胜出者同时完成、但未被采用的结果（如已打开的流）。
+    """
+    race = _Race(pool, policy, max_retries)
+    policy._count("requests")
+    delay = policy.delay(kind)
+    start = time.perf_counter()
+    endpoint = race.next_endpoint()
+    if endpoint is None:
+        raise race.error()
+    tasks = {asyncio.ensure_future(attempt(endpoint)): endpoint}
+    try:
+        while tasks:
+            elapsed = time.perf_counter() - start
+            done, _ = await asyncio.wait(tasks, timeout=race.timeout(max(0.0, delay - elapsed)),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                endpoint = race.hedge()
+                if endpoint is not None:
+                    tasks[asyncio.ensure_future(attempt(endpoint))] = endpoint
+                continue
+            for task in done:
+                endpoint = tasks.pop(task)
+                error = task.exception()
+                if error is None:
+                    race.won(endpoint, len(tasks))
+                    policy.observe(kind, time.perf_counter() - start)
+                    return task.result()
+                if not isinstance(error, retryable):
+                    raise error
+                retry = race.failed(error)
+                if retry is not None:
+                    tasks[asyncio.ensure_future(attempt(retry))] = retry
+        raise race.error()
+    finally:
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                if discard is not None:
+                    await discard(task.result())
+            else:
+                task.cancel()
@@ -0,0 +1,183 @@
+"""
+多副本负载均衡
+
+为 vLLM 等 HTTP 后端维护一组等价端点：
+- 路由策略：最少在途请求（least_outstanding）或按在途 token 加权（token_weighted）
+- 请求失败（连接错误/超时/5xx）累计到阈值后摘除端点
+- 后台线程定期用健康检查接口探测，摘除的端点恢复后重新加入
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+
+@dataclass
+class Endpoint:
+    """单个后端副本的状态"""
+    url: str
+    healthy: bool = True
+    outstanding: int = 0
+    outstanding_tokens: int = 0
+    consecutive_failures: int = 0
+    requests: int = 0
+    errors: int = 0
+    ejected_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "outstanding_tokens": self.outstanding_tokens,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class EndpointPool:
+    """
+    端点池
+
+    probe 为健康探测函数（接收端点URL，返回是否健康），由具体后端提供。
+    """
+
+    POLICIES = ("least_outstanding", "token_weighted")
+
+    def __init__(self, urls: Iterable[str], policy: str = "least_outstanding",
+                 eject_after_failures: int = 1, health_check_interval: float = 10.0,
+                 probe: Optional[Callable[[str], bool]] = None):
+        self.endpoints: List[Endpoint] = [Endpoint(url=u.rstrip("/")) for u in urls]
+        if not self.endpoints:
+            raise ValueError("端点列表不能为空")
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的负载均衡策略: {policy}，可用: {self.POLICIES}")
+        self.policy = policy
+        self.eject_after_failures = max(1, eject_after_failures)
+        self.health_check_interval = health_check_interval
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._tiebreak = itertools.count()
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], default_url: str,
+                    probe: Optional[Callable[[str], bool]] = None) -> "EndpointPool":
+        """根据后端YAML构建：connection.endpoints 为副本列表（缺省使用 connection.host）"""
+        connection = config.get("connection", {})
+        options = config.get("load_balancing", {})
+        urls = connection.get("endpoints") or [connection.get("host", default_url)]
+        return cls(
+            urls,
+            policy=options.get("policy", "least_outstanding"),
+            eject_after_failures=options.get("eject_after_failures", 1),
+            health_check_interval=options.get("health_check_interval", 10.0),
+            probe=probe,
+        )
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _load(self, endpoint: Endpoint) -> int:
+        if self.policy == "token_weighted":
+            return endpoint.outstanding_tokens
+        return endpoint.outstanding
+
+    def select(self, exclude: Iterable[str] = ()) -> Optional[Endpoint]:
+        """选择负载最低的健康端点；全部不健康时退化为在所有端点中选择"""
+        self._ensure_monitor()
+        excluded = set(exclude)
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.url not in excluded]
+            healthy = [e for e in candidates if e.healthy]
+            pool = healthy or candidates
+            if not pool:
+                return None
+            # 负载相同时轮转，避免总是压在第一个端点上
+            offset = next(self._tiebreak)
+            return min(
+                pool,
+                key=lambda e: (self._load(e), (self.endpoints.index(e) - offset) % len(self.endpoints)),
+            )
+
+    @contextmanager
+    def track(self, endpoint: Endpoint, cost: int = 0):
+        """记录在途请求数与在途 token 数"""
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.outstanding_tokens += cost
+            endpoint.requests += 1
+        try:
+            yield endpoint
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+                endpoint.outstanding_tokens -= cost
+
+    def mark_success(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.consecutive_failures = 0
+
+    def mark_failure(self, endpoint: Endpoint, error: Exception) -> None:
+        """记录失败，连续失败达到阈值后摘除"""
+        with self._lock:
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.healthy and endpoint.consecutive_failures >= self.eject_after_failures:
+                endpoint.healthy = False
+                endpoint.ejected_at = time.time()
+                logger.warning(f"⛔ 摘除端点 {endpoint.url}: {error}")
+
+    def _readmit(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            if not endpoint.healthy:
+                endpoint.healthy = True
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_at = None
+                logger.info(f"✅ 端点恢复: {endpoint.url}")
+
+    def check_health(self) -> None:
+        """探测所有端点：失败即摘除，恢复即重新加入"""
+        if self.probe is None:
+            return
+        for endpoint in list(self.endpoints):
+            try:
+                ok = self.probe(endpoint.url)
+            except Exception:
+                ok = False
+            if ok:
+                self._readmit(endpoint)
+            elif endpoint.healthy:
+                with self._lock:
+                    endpoint.consecutive_failures = self.eject_after_failures
+                self.mark_failure(endpoint, RuntimeError("健康检查失败"))
+
+    def _ensure_monitor(self) -> None:
+        if (self._monitor is not None or self.probe is None
+                or self.health_check_interval <= 0 or len(self.endpoints) < 2):
+            return
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._run_monitor, name="endpoint-health", daemon=True)
+                self._monitor.start()
+
+    def _run_monitor(self) -> None:
+        while not self._stop.wait(self.health_check_interval):
+            self.check_health()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=1)
+            self._monitor = None
+        self._stop.clear()
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [e.to_dict() for e in self.endpoints]
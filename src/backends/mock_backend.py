@@ -0,0 +1,220 @@
+"""
+Mock后端 - 无需模型服务的本地后端
+
+按配置返回脚本化或回显的回复，模拟首token延迟分布、按 tokens_per_second 流式输出、
+随机错误与服务端并发上限，用于在没有GPU的机器上对各个 Agent 做压测和基准测试。
+延迟与错误的随机数由 (seed, 提示, 该提示第几次出现) 决定，与并发调度顺序无关，重复运行结果一致。
+"""
+
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+
+from .base import ModelBackend, ModelResponse, StreamTimer
+
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class MockBackendError(RuntimeError):
+    """按 error_rate 注入的模拟故障"""
+    pass
+
+
+def tokenize(text: str) -> List[str]:
+    """按空白切分（保留空白），作为模拟的 token"""
+    return _TOKEN_PATTERN.findall(text)
+
+
+class MockBackend(ModelBackend):
+    """Mock后端实现 - 本地压测"""
+
+    DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        options = config.get("mock", {})
+        self._base_url = config.get("connection", {}).get("host", "mock://local")
+        self.seed = options.get("seed", 0)
+        self.mode = options.get("mode", "echo")
+        self.echo_prefix = options.get("echo_prefix", "")
+        self.script: List[Dict[str, str]] = options.get("script", [])
+        self.default_response: Optional[str] = options.get("default_response")
+        self.latency = options.get("latency", {})
+        if self.latency.get("distribution", "fixed") not in self.DISTRIBUTIONS:
+            raise ValueError(f"未知的延迟分布: {self.latency.get('distribution')}，可用: {self.DISTRIBUTIONS}")
+        self.tokens_per_second = options.get("tokens_per_second", 0)
+        self.error_rate = options.get("error_rate", 0.0)
+        max_concurrent = options.get("max_concurrent", 0)
+        self._capacity = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._lock = threading.Lock()
+        self._occurrences: Counter = Counter()
+        self.stats = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+        logger.info(f"🔧 初始化Mock后端 (mode={self.mode}, seed={self.seed})")
+
+    # ---- 回复与随机数 ----
+
+    def _rng(self, prompt: str) -> random.Random:
+        with self._lock:
+            self._occurrences[prompt] += 1
+            n = self._occurrences[prompt]
+        return random.Random(f"{self.seed}:{n}:{prompt}")
+
+    def respond(self, prompt: str) -> str:
+        """脚本按子串匹配（先到先得），未命中时回显提示"""
+        if self.mode == "script":
+            for rule in self.script:
+                if rule.get("match", "") in prompt:
+                    return rule["response"]
+            if self.default_response is not None:
+                return self.default_response
+        return f"{self.echo_prefix}{prompt}"
+
+    def _first_token_delay(self, rng: random.Random) -> float:
+        options = self.latency
+        distribution = options.get("distribution", "fixed")
+        mean = options.get("mean", 0.0)
+        stddev = options.get("stddev", 0.0)
+        if distribution == "uniform":
+            value = rng.uniform(options.get("min", 0.0), options.get("max", 2 * mean))
+        elif distribution == "normal":
+            value = rng.gauss(mean, stddev)
+        elif distribution == "lognormal" and mean > 0:
+            # 按目标均值/标准差换算对数正态参数
+            sigma2 = math.log(1 + (stddev / mean) ** 2)
+            value = rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+        else:
+            value = mean
+        return min(max(value, options.get("min", 0.0)), options.get("max", float("inf")))
+
+    def _token_interval(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _plan(self, prompt: str):
+        """本次请求的 (回复token, 首token延迟, 是否注入故障)"""
+        rng = self._rng(prompt)
+        delay = self._first_token_delay(rng)
+        fail = rng.random() < self.error_rate
+        return tokenize(self.respond(prompt)), delay, fail
+
+    def _usage(self, prompt: str, tokens: List[str]) -> Dict[str, int]:
+        return {"prompt_tokens": len(tokenize(prompt)), "completion_tokens": len(tokens)}
+
+    # ---- 并发上限 ----
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+
+    def _exit(self, failed: bool) -> None:
+        with self._lock:
+            self.stats["in_flight"] -= 1
+            self.stats["errors"] += int(failed)
+
+    def _acquire(self) -> None:
+        if self._capacity is not None:
+            self._capacity.acquire()
+        self._enter()
+
+    async def _aacquire(self) -> None:
+        if self._capacity is not None:
+            # 模拟服务端排队：不阻塞事件循环
+            while not self._capacity.acquire(blocking=False):
+                await asyncio.sleep(0.001)
+        self._enter()
+
+    def _release(self, failed: bool = False) -> None:
+        self._exit(failed)
+        if self._capacity is not None:
+            self._capacity.release()
+
+    # ---- ModelBackend ----
+
+    def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
+        return True
+
+    def _response(self, prompt: str, tokens: List[str], delay: float, start: float) -> ModelResponse:
+        return ModelResponse(
+            content="".join(tokens),
+            usage=self._usage(prompt, tokens),
+            latency=time.time() - start,
+            time_to_first_token=delay,
+            inter_token_latency=self._token_interval() if len(tokens) > 1 else None,
+        )
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        start = time.time()
+        tokens, delay, fail = self._plan(prompt)
+        self._acquire()
+        try:
+            time.sleep(delay)
+            if fail:
+                raise MockBackendError("mock后端注入故障")
+            time.sleep(self._token_interval() * max(0, len(tokens) - 1))
+        finally:
+            self._release(fail)
+        return self._response(prompt, tokens, delay, start)
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        start = time.time()
+        tokens, delay, fail = self._plan(prompt)
+        await self._aacquire()
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise MockBackendError("mock后端注入故障")
+            await asyncio.sleep(self._token_interval() * max(0, len(tokens) - 1))
+        finally:
+            self._release(fail)
+        return self._response(prompt, tokens, delay, start)
+
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        """整批共用一次首token延迟，总耗时由最长的回复决定（模拟服务端连续批处理）"""
+        if not prompts:
+            return []
+        start = time.time()
+        plans = [self._plan(p) for p in prompts]
+        delay = max(d for _, d, _ in plans)
+        fail = any(f for _, _, f in plans)
+        self._acquire()
+        try:
+            time.sleep(delay)
+            if fail:
+                raise MockBackendError("mock后端注入故障")
+            time.sleep(self._token_interval() * max(0, max(len(t) for t, _, _ in plans) - 1))
+        finally:
+            self._release(fail)
+        return [self._response(p, tokens, delay, start) for p, (tokens, _, _) in zip(prompts, plans)]
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        tokens, delay, fail = self._plan(prompt)
+        timer = StreamTimer()
+        await self._aacquire()
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise MockBackendError("mock后端注入故障")
+            interval = self._token_interval()
+            for i, token in enumerate(tokens):
+                if i and interval:
+                    await asyncio.sleep(interval)
+                yield ModelResponse(content=token, **timer.tick())
+        finally:
+            self._release(fail)
+
+    def is_available(self) -> bool:
+        return True
+
+    def get_model_info(self, model_id: str) -> Dict[str, Any]:
+        return {"backend": "mock", "model": model_id, "mode": self.mode, "stats": dict(self.stats)}
+
+    def list_loaded_models(self) -> List[str]:
+        return ["mock-model"]
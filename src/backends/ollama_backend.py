@@ -1,7 +1,8 @@
 import ollama
+import requests
 import asyncio
-from typing import Dict, Any, AsyncIterator, List
-from .base import ModelBackend, ModelResponse
+from typing import Dict, Any, AsyncIterator, List, Optional
+from .base import ModelBackend, ModelResponse, StreamTimer, close_on_loop
 from loguru import logger
 import time
 
@@ -10,71 +11,154 @@ class OllamaBackend(ModelBackend):
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self._base_url = config.get("connection", {}).get("host", "http://localhost:11434")
+        connection = config.get("connection", {})
+        self._base_url = connection.get("host", "http://localhost:11434")
+        self._health_endpoint = connection.get("health_check_endpoint", "/api/version")
+        self._health_timeout = connection.get("health_check_timeout", 2)
+        # 每次请求携带 keep_alive，使用中的模型常驻显存
+        self.keep_alive = config.get("ollama_specific", {}).get("keep_alive")
+        # Ollama 的 format 参数接受 JSON Schema，按 schema 约束解码
+        self.supports_guided_decoding = config.get("features", {}).get("supports_guided_decoding", True)
         logger.info(f"🔧 初始化Ollama后端 at {self._base_url}")
-        # Configure ollama client if needed, though the library usually defaults to localhost:11434 or OLLAMA_HOST env var
+        self._client = ollama.Client(host=self._base_url)
+        self._async_client: Optional[ollama.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_async_client(self) -> ollama.AsyncClient:
+        """异步客户端的连接池绑定事件循环，循环变化时重建"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._release_async_client(self._async_client, self._async_loop)
+            self._async_client = ollama.AsyncClient(host=self._base_url)
+            self._async_loop = loop
+        return self._async_client
+    
+    @staticmethod
+    def _release_async_client(client: Optional[ollama.AsyncClient],
+                              loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """在客户端所属的事件循环上关闭其连接池（见 close_on_loop）
+        
+        AsyncClient.close() 从 ollama 0.6 起才有；更早的版本没有公开的关闭接口，
+        这里只丢弃引用（每个事件循环仍各用一个新客户端），旧连接池由垃圾回收释放。
+        """
+        close = getattr(client, "close", None)
+        if close is not None:
+            close_on_loop(close, loop)
     
     def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
         try:
             logger.info(f"⬇️ Ollama开始拉取/加载模型: {model_id}")
-            ollama.pull(model_id)
+            self._client.pull(model_id)
             logger.info(f"✅ Ollama加载模型成功: {model_id}")
             return True
         except Exception as e:
             logger.error(f"❌ Ollama加载失败: {e}")
             return False
     
+    def _chat_kwargs(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "model": kwargs.get("model", "qwen2.5:3b"),
+            "messages": [{"role": "user", "content": prompt}],
+            "options": kwargs.get("parameters", {}),
+            "keep_alive": self.keep_alive,
+            "format": kwargs.get("json_schema"),
+        }
+    
+    @staticmethod
+    def _to_response(response, start: float) -> ModelResponse:
+        # Ollama返回纳秒级耗时：首token≈加载+提示处理，token间隔≈生成耗时/生成数
+        eval_count = response.get("eval_count", 0) or 0
+        prefill_ns = (response.get("load_duration", 0) or 0) + (response.get("prompt_eval_duration", 0) or 0)
+        eval_ns = response.get("eval_duration", 0) or 0
+        return ModelResponse(
+            content=response["message"]["content"],
+            latency=time.time() - start,
+            usage={
+                "prompt_tokens": response.get("prompt_eval_count", 0) or 0,
+                "completion_tokens": eval_count
+            },
+            time_to_first_token=prefill_ns / 1e9 if prefill_ns else None,
+            inter_token_latency=eval_ns / eval_count / 1e9 if eval_count else None
+        )
+    
     def generate(self, prompt: str, **kwargs) -> ModelResponse:
         start = time.time()
         
         try:
-            response = ollama.chat(
-                model=kwargs.get("model", "qwen2.5:3b"),
-                messages=[{"role": "user", "content": prompt}],
-                options=kwargs.get("parameters", {})
-            )
-            
-            return ModelResponse(
-                content=response["message"]["content"],
-                latency=time.time() - start,
-                usage={
-                    "prompt_tokens": response.get("prompt_eval_count", 0),
-                    "completion_tokens": response.get("eval_count", 0)
-                }
-            )
+            response = self._client.chat(**self._chat_kwargs(prompt, kwargs))
+            return self._to_response(response, start)
+        except Exception as e:
+            logger.error(f"Ollama generation error: {e}")
+            raise
+    
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        start = time.time()
+        
+        try:
+            response = await self._get_async_client().chat(**self._chat_kwargs(prompt, kwargs))
+            return self._to_response(response, start)
         except Exception as e:
             logger.error(f"Ollama generation error: {e}")
             raise
     
     async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
-        # Ollama流式实现
+        # Ollama流式实现（AsyncClient，不阻塞事件循环）
+        timer = StreamTimer()
         try:
-            stream = ollama.chat(
-                model=kwargs.get("model", "qwen2.5:3b"),
-                messages=[{"role": "user", "content": prompt}],
+            stream = await self._get_async_client().chat(
+                **self._chat_kwargs(prompt, kwargs),
                 stream=True,
-                options=kwargs.get("parameters", {})
             )
-            for chunk in stream:
+            async for chunk in stream:
                 content = chunk["message"]["content"]
                 if content:
-                    yield ModelResponse(content=content)
+                    yield ModelResponse(content=content, **timer.tick())
         except Exception as e:
              logger.error(f"Ollama streaming error: {e}")
              raise
 
     def is_available(self) -> bool:
+        # 轻量探活：只请求版本接口，不列出全部模型
         try:
-            ollama.list()
-            return True
+            return requests.get(f"{self._base_url}{self._health_endpoint}", timeout=self._health_timeout).ok
         except:
             return False
     
     def get_model_info(self, model_id: str) -> Dict[str, Any]:
         return {"backend": "ollama", "model": model_id}
     
+    # ---- 显存驻留（供 ResidencyManager 调用）----
+    
+    def load_resident(self, model_id: str, keep_alive: Optional[str] = None) -> None:
+        """把模型加载进显存（空提示的 generate 只加载不生成）"""
+        self._client.generate(model=model_id, prompt="", keep_alive=keep_alive or self.keep_alive)
+    
+    def unload(self, model_id: str) -> None:
+        """立即从显存卸载模型"""
+        self._client.generate(model=model_id, prompt="", keep_alive=0)
+    
+    def list_resident(self) -> Dict[str, int]:
+        """当前驻留的模型及其显存占用（字节）"""
+        return {m["model"]: m["size_vram"] or 0 for m in self._client.ps()["models"]}
+    
     def list_loaded_models(self) -> List[str]:
         try:
-            return [m["name"] for m in ollama.list()["models"]]
+            return [m["name"] for m in self._client.list()["models"]]
         except:
             return []
+    
+    def close(self) -> None:
+        """关闭异步客户端的连接池（同步客户端继续可用）"""
+        client, loop = self._async_client, self._async_loop
+        self._async_client, self._async_loop = None, None
+        self._release_async_client(client, loop)
+    
+    async def aclose(self) -> None:
+        """在事件循环内关闭连接池"""
+        client = self._async_client
+        if client is not None and self._async_loop is asyncio.get_running_loop():
+            self._async_client, self._async_loop = None, None
+            close = getattr(client, "close", None)
+            if close is not None:
+                await close()
+        self.close()
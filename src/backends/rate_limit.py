@@ -0,0 +1,275 @@
+"""
+令牌桶限流 - 按模型与租户
+
+每个模型、每个租户（调用方通过 tenant 关键字传入）各有两个令牌桶：请求数与 token 数（提示 + 生成）。
+超出限额的调用方等待令牌恢复（异步调用不阻塞事件循环），而不是被拒绝。
+token 数在请求前未知：请求前只要求 token 桶未透支，响应返回后按 ModelResponse.usage 实际扣除，
+透支的部分由后续请求等待偿还。流式分片不带 usage 时按 提示 token 估算 + 分片数 扣除。
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .base import DelegatingBackend, ModelBackend, ModelResponse
+
+DEFAULT_TENANT = "default"
+
+
+def usage_tokens(usage: Optional[Dict[str, Any]]) -> int:
+    """usage 中的提示 + 生成 token 数（兼容 OpenAI 与 LangChain 的字段名）"""
+    if not usage:
+        return 0
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0
+    completion = usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0
+    return int(prompt) + int(completion)
+
+
+def estimate_tokens(text: str) -> int:
+    """未配置分词器时的粗略估算（约 4 个字符一个 token）"""
+    return (len(text) + 3) // 4
+
+
+class TokenBucket:
+    """
+    令牌桶：每秒恢复 rate 个令牌，最多积累 capacity 个
+
+    允许透支（余额为负），用于请求结束后才知道实际消耗的 token 计数。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """余额达到 amount（0 表示只要求不透支）还需等待的秒数"""
+        self._refill(now)
+        need = min(amount, self.capacity) - self.level
+        if need <= 0:
+            return 0.0
+        return need / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+
+class _Limit:
+    """一个限流键（模型或租户）的请求桶、token 桶与统计"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 burst_seconds: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute * burst_seconds / 60) \
+            if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute * burst_seconds / 60) \
+            if tokens_per_minute else None
+        self.stats = {"requests": 0, "tokens": 0, "throttled": 0, "total_wait": 0.0}
+
+    def wait_time(self, now: float) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(0, now))
+        return max(waits)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.stats)
+        if self.requests is not None:
+            data["requests_available"] = round(self.requests.level, 3)
+        if self.tokens is not None:
+            data["tokens_available"] = round(self.tokens.level, 3)
+        return data
+
+
+class RateLimiter:
+    """
+    按模型与租户的令牌桶限流器
+
+    - models / tenants: 名称 -> {requests_per_minute, tokens_per_minute}，"*" 为未单独配置者的默认限额
+      （每个模型/租户各自一份桶，而不是共享 "*" 的桶）
+    - burst_seconds: 桶容量，按多少秒的配额计算
+    同一个限流器同时服务同步线程和异步协程。
+    """
+
+    def __init__(self, name: str, models: Optional[Dict[str, Dict[str, float]]] = None,
+                 tenants: Optional[Dict[str, Dict[str, float]]] = None, burst_seconds: float = 60.0,
+                 default_tenant: str = DEFAULT_TENANT,
+                 count_tokens: Optional[Callable[[str, str], int]] = None):
+        self.name = name
+        # (文本, 模型) -> token 数，用于估算不带 usage 的流式请求的提示 token
+        self.count_tokens = count_tokens
+        self.policies = {"model": models or {}, "tenant": tenants or {}}
+        self.burst_seconds = burst_seconds
+        self.default_tenant = default_tenant
+        self._limits: Dict[Tuple[str, str], Optional[_Limit]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name: str, config: Dict[str, Any],
+                    count_tokens: Optional[Callable[[str, str], int]] = None) -> Optional["RateLimiter"]:
+        """根据后端YAML的 rate_limits 段构建；未启用时返回 None"""
+        options = config.get("rate_limits", {})
+        if not options.get("enabled", False):
+            return None
+        return cls(
+            name,
+            models=options.get("models"),
+            tenants=options.get("tenants"),
+            burst_seconds=options.get("burst_seconds", 60.0),
+            default_tenant=options.get("default_tenant", DEFAULT_TENANT),
+            count_tokens=count_tokens,
+        )
+
+    def prompt_tokens(self, text: str, model: str) -> int:
+        """估算提示的 token 数（计数失败时退回粗略估算）"""
+        if self.count_tokens is not None:
+            try:
+                return self.count_tokens(text, model)
+            except Exception as e:
+                logger.debug(f"提示 token 计数失败，改用估算: {e}")
+        return estimate_tokens(text)
+
+    def _limit(self, kind: str, key: str) -> Optional[_Limit]:
+        """持锁调用：取出（首次时创建）某个键的限额，未配置时为 None"""
+        if (kind, key) not in self._limits:
+            policy = self.policies[kind].get(key, self.policies[kind].get("*"))
+            self._limits[(kind, key)] = _Limit(burst_seconds=self.burst_seconds, **policy) if policy else None
+        return self._limits[(kind, key)]
+
+    def _limits_for(self, model: str, tenant: Optional[str]) -> List[_Limit]:
+        limits = [self._limit("model", model), self._limit("tenant", tenant or self.default_tenant)]
+        return [limit for limit in limits if limit is not None]
+
+    def _try_acquire(self, limits: List[_Limit]) -> float:
+        """持锁调用：所有桶都有余量时扣除一个请求并返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        wait = max((limit.wait_time(now) for limit in limits), default=0.0)
+        if wait > 0:
+            return wait
+        for limit in limits:
+            if limit.requests is not None:
+                limit.requests.consume(1, now)
+            limit.stats["requests"] += 1
+        return 0.0
+
+    def _waited(self, limits: List[_Limit], model: str, tenant: Optional[str], waited: float) -> None:
+        if waited <= 0:
+            return
+        with self._lock:
+            for limit in limits:
+                limit.stats["throttled"] += 1
+                limit.stats["total_wait"] += waited
+        logger.debug(f"🚦 {self.name} 限流: model={model} tenant={tenant or self.default_tenant} 等待 {waited:.2f}s")
+
+    def acquire(self, model: str, tenant: Optional[str] = None) -> None:
+        """同步等待，直到模型与租户的桶都允许发出一个请求"""
+        start = time.perf_counter()
+        with self._lock:
+            limits = self._limits_for(model, tenant)
+        while True:
+            with self._lock:
+                wait = self._try_acquire(limits)
+            if wait == 0:
+                break
+            time.sleep(wait)
+        self._waited(limits, model, tenant, time.perf_counter() - start)
+
+    async def aacquire(self, model: str, tenant: Optional[str] = None) -> None:
+        """异步等待（不阻塞事件循环）"""
+        start = time.perf_counter()
+        with self._lock:
+            limits = self._limits_for(model, tenant)
+        while True:
+            with self._lock:
+                wait = self._try_acquire(limits)
+            if wait == 0:
+                break
+            await asyncio.sleep(wait)
+        self._waited(limits, model, tenant, time.perf_counter() - start)
+
+    def record(self, model: str, tenant: Optional[str], tokens: int) -> None:
+        """响应返回后按实际 token 数扣除"""
+        if tokens <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for limit in self._limits_for(model, tenant):
+                if limit.tokens is not None:
+                    limit.tokens.consume(tokens, now)
+                limit.stats["tokens"] += tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各模型/租户的请求数、token 数、被限流次数、累计等待与桶内实时余量"""
+        with self._lock:
+            now = time.monotonic()
+            stats: Dict[str, Dict[str, Any]] = {"models": {}, "tenants": {}}
+            for (kind, key), limit in self._limits.items():
+                if limit is None:
+                    continue
+                for bucket in (limit.requests, limit.tokens):
+                    if bucket is not None:
+                        bucket._refill(now)
+                stats[f"{kind}s"][key] = limit.to_dict()
+            return stats
+
+
+class RateLimitedBackend(DelegatingBackend):
+    """在生成类调用外层套上令牌桶限流；调用方可通过 tenant 关键字指定租户"""
+
+    def __init__(self, inner: ModelBackend, limiter: RateLimiter):
+        super().__init__(inner)
+        self.rate_limiter = limiter
+
+    @staticmethod
+    def _model(kwargs: Dict[str, Any]) -> str:
+        return kwargs.get("model", "default")
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        tenant = kwargs.pop("tenant", None)
+        self.rate_limiter.acquire(self._model(kwargs), tenant)
+        response = self.inner.generate(prompt, **kwargs)
+        self.rate_limiter.record(self._model(kwargs), tenant, usage_tokens(response.usage))
+        return response
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        tenant = kwargs.pop("tenant", None)
+        await self.rate_limiter.aacquire(self._model(kwargs), tenant)
+        response = await self.inner.agenerate(prompt, **kwargs)
+        self.rate_limiter.record(self._model(kwargs), tenant, usage_tokens(response.usage))
+        return response
+
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        # 批内每条提示各算一个请求
+        tenant = kwargs.pop("tenant", None)
+        for _ in prompts:
+            self.rate_limiter.acquire(self._model(kwargs), tenant)
+        responses = self.inner.generate_batch(prompts, **kwargs)
+        self.rate_limiter.record(self._model(kwargs), tenant, sum(usage_tokens(r.usage) for r in responses))
+        return responses
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        """流式分片通常不带 usage：此时按提示 token 估算加分片数（约等于生成 token 数）计数"""
+        tenant = kwargs.pop("tenant", None)
+        await self.rate_limiter.aacquire(self._model(kwargs), tenant)
+        chunks = tokens = 0
+        try:
+            async for chunk in self.inner.generate_stream(prompt, **kwargs):
+                chunks += 1
+                tokens += usage_tokens(chunk.usage)
+                yield chunk
+        finally:
+            if not tokens:
+                tokens = self.rate_limiter.prompt_tokens(prompt, self._model(kwargs)) + chunks
+            self.rate_limiter.record(self._model(kwargs), tenant, tokens)
@@ -0,0 +1,199 @@
+"""
+请求合并（singleflight）
+
+同一时刻键相同（模型、提示、参数）的多个请求只向后端发出一次，所有调用方共享结果。
+流式请求同样合并：由第一个调用方驱动底层流，后加入者先回放已产生的 token，再与其他人同步接收后续 token。
+与响应缓存不同，这里只合并"正在进行"的请求，请求完成即移除，不保存结果。
+"""
+
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from .base import DelegatingBackend, ModelBackend, ModelResponse, is_sampled
+
+
+def make_flight_key(prompt: Any, parameters: Dict[str, Any]) -> str:
+    """请求键：提示 + 参数（参数中包含模型名）"""
+    return json.dumps([prompt, parameters], sort_keys=True, default=str)
+
+
+class _Broadcast:
+    """单个事件循环内的一路流式广播，保留已产生的全部分片供后加入者回放"""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # 驱动底层流的任务与当前订阅者数量（全部订阅者离开时取消任务）
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    def publish(self, chunk: Any) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    在途请求合并组
+
+    同步与异步调用共用同一张在途表：异步请求的结果也写入线程安全的 Future，
+    其他线程中的同步调用方可以直接等待。
+    allow_sampled 为 False 时，temperature > 0 的请求不参与合并（每个调用方各自采样）。
+    """
+
+    def __init__(self, name: str = "", allow_sampled: bool = True):
+        self.name = name
+        self.allow_sampled = allow_sampled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.stats = {"leaders": 0, "saved_calls": 0}
+
+    def _join(self, key: Hashable):
+        """返回 (future, 是否为发起者)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats["saved_calls"] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.stats["leaders"] += 1
+            return future, True
+
+    def _settle(self, key: Hashable, future: Future, result: Any = None,
+                error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """同步执行：键相同的并发调用只执行一次 fn"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """异步执行：底层请求在独立任务中运行，发起者被取消不影响其他等待者"""
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(fn())
+
+            def _done(t: asyncio.Task) -> None:
+                error = asyncio.CancelledError() if t.cancelled() else t.exception()
+                self._settle(key, future, None if error else t.result(), error)
+
+            task.add_done_callback(_done)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """流式执行：同一事件循环内键相同的并发流共享一次底层请求"""
+        key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is not None:
+                self.stats["saved_calls"] += 1
+            else:
+                broadcast = self._streams[key] = _Broadcast()
+                self.stats["leaders"] += 1
+                broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, fn))
+            broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            with self._lock:
+                broadcast.subscribers -= 1
+                abandoned = broadcast.subscribers == 0 and not broadcast.done
+                if abandoned and self._streams.get(key) is broadcast:
+                    self._streams.pop(key)
+            if abandoned:
+                # 没有订阅者了：停止底层请求，释放连接
+                broadcast.task.cancel()
+
+    async def _pump(self, key: Hashable, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[Any]]) -> None:
+        error = None
+        try:
+            async for chunk in fn():
+                broadcast.publish(chunk)
+        except BaseException as e:
+            error = e
+        finally:
+            with self._lock:
+                if self._streams.get(key) is broadcast:
+                    self._streams.pop(key)
+            broadcast.finish(error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._calls) + len(self._streams)}
+
+
+class CoalescingBackend(DelegatingBackend):
+    """合并键相同的并发 generate / agenerate / generate_stream 调用"""
+
+    def __init__(self, inner: ModelBackend, group: SingleFlight):
+        super().__init__(inner)
+        self.singleflight = group
+
+    def _key(self, prompt: str, kwargs: Dict[str, Any]) -> Optional[str]:
+        # 与各后端一致，采样参数在 parameters 中
+        if not self.singleflight.allow_sampled and is_sampled(kwargs.get("parameters") or {}):
+            return None
+        # 优先级与租户只影响排队和限流，不影响结果
+        return make_flight_key(prompt, {k: v for k, v in kwargs.items() if k not in ("priority", "tenant")})
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        key = self._key(prompt, kwargs)
+        if key is None:
+            return self.inner.generate(prompt, **kwargs)
+        return self.singleflight.do(key, lambda: self.inner.generate(prompt, **kwargs))
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        key = self._key(prompt, kwargs)
+        if key is None:
+            return await self.inner.agenerate(prompt, **kwargs)
+        return await self.singleflight.ado(key, lambda: self.inner.agenerate(prompt, **kwargs))
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        key = self._key(prompt, kwargs)
+        stream = self.singleflight.stream(key, lambda: self.inner.generate_stream(prompt, **kwargs)) \
+            if key is not None else self.inner.generate_stream(prompt, **kwargs)
+        async for chunk in stream:
+            yield chunk
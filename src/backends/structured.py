@@ -0,0 +1,165 @@
+"""
+结构化输出（JSON）
+
+后端支持约束解码时（vLLM guided_json / Ollama format=<JSON Schema>），由服务端保证输出符合 schema；
+否则在流式输出上逐字符做增量 JSON 校验：一出现不可能构成合法 JSON 的字符就中止生成，
+顶层对象闭合后立即停止读取，不必等模型写完多余的说明文字，也不需要"解析失败再整段重试"。
+（后端的同步 generate_structured 没有流式接口可用，只做事后校验，见 ModelBackend.generate_structured。）
+"""
+
+import json
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+# JSON 字符串之外允许出现的字符（数字、字面量 true/false/null、分隔符）
+_VALUE_CHARS = set("0123456789+-.eE" "truefalsn" ",:" " \t\r\n")
+_CLOSERS = {"}": "{", "]": "["}
+
+
+class StructuredOutputError(ValueError):
+    """输出不是合法 JSON 或不符合 schema"""
+    pass
+
+
+def schema_instruction(schema: Type[BaseModel]) -> str:
+    """附加在提示后的格式说明（约束解码时同样附加，帮助模型理解各字段含义）"""
+    return ("Respond with only a JSON object that conforms to this JSON Schema, without any other text:\n"
+            + json.dumps(schema.model_json_schema(), ensure_ascii=False))
+
+
+class IncrementalJSONValidator:
+    """
+    增量 JSON 校验器
+
+    逐段 feed 模型输出：跳过开头不超过 max_preamble 个字符的前言（如 "```json"），
+    之后只做结构层面的检查（括号配对、字符串转义、值字符集），出错立即抛出 StructuredOutputError；
+    顶层值闭合后 complete 为 True，其后的内容被忽略。
+
+    传入 schema 时只从与其顶层类型相符的括号开始（对象只认 "{"），闭合后还要能解析并通过 schema 校验。
+    前言中的括号（如 "[注] ..."）不符合时放弃该起点，从下一个字符继续寻找，直到超出 max_preamble；
+    输出以 JSON 开头（没有前言）时不回退，格式错误立即报错。
+    """
+
+    def __init__(self, max_preamble: int = 200, schema: Optional[Type[BaseModel]] = None):
+        self.max_preamble = max_preamble
+        self.schema = schema
+        root = schema.model_json_schema().get("type") if schema is not None else None
+        self._openers = {"object": "{", "array": "["}.get(root, "{[")
+        self.preamble = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.stack: list = []
+        self.in_string = False
+        self.escape = False
+        self.complete = False
+        self._chars: list = []
+
+    @property
+    def started(self) -> bool:
+        return bool(self._chars)
+
+    @property
+    def text(self) -> str:
+        """已读到的 JSON 文本"""
+        return "".join(self._chars)
+
+    def _error(self, message: str) -> StructuredOutputError:
+        return StructuredOutputError(f"{message}（已读取: {self.text[-80:]!r}）")
+
+    def _can_restart(self) -> bool:
+        """当前起点出现在前言之后、且仍在 max_preamble 之内时可以放弃它"""
+        return 0 < self.preamble and self.preamble + len(self._chars) <= self.max_preamble
+
+    def _acceptable(self) -> bool:
+        try:
+            value = json.loads(self.text)
+            if self.schema is not None:
+                validate_structured(value, self.schema)
+        except (json.JSONDecodeError, StructuredOutputError):
+            return False
+        return True
+
+    def feed(self, chunk: str) -> bool:
+        """读入一段输出，返回顶层 JSON 是否已经完整"""
+        pending, i = list(chunk), 0
+        while i < len(pending) and not self.complete:
+            ch = pending[i]
+            i += 1
+            try:
+                self._step(ch)
+            except StructuredOutputError:
+                if not self._can_restart():
+                    raise
+                restart = True
+            else:
+                restart = self.complete and self._can_restart() and not self._acceptable()
+            if restart:
+                # 放弃当前起点：起始括号计入前言，其后的字符重新扫描
+                pending, i = self._chars[1:] + pending[i:], 0
+                self.preamble += 1
+                self._reset()
+        return self.complete
+
+    def _step(self, ch: str) -> None:
+        if not self.started:
+            if ch in self._openers:
+                self.stack.append(ch)
+                self._chars.append(ch)
+                return
+            self.preamble += 1
+            if self.preamble > self.max_preamble:
+                raise self._error(f"前 {self.max_preamble} 个字符内没有出现 JSON")
+            return
+        self._chars.append(ch)
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+            elif ch in "\n\r":
+                raise self._error("字符串中出现未转义的换行")
+        elif ch == '"':
+            self.in_string = True
+        elif ch in "{[":
+            self.stack.append(ch)
+        elif ch in _CLOSERS:
+            if not self.stack or self.stack[-1] != _CLOSERS[ch]:
+                raise self._error(f"括号不匹配: {ch}")
+            self.stack.pop()
+            self.complete = not self.stack
+        elif ch not in _VALUE_CHARS:
+            raise self._error(f"JSON 中出现非法字符 {ch!r}")
+
+
+def parse_json_text(content: str, schema: Optional[Type[BaseModel]] = None) -> Any:
+    """从完整输出中取出第一个 JSON 值（允许前言与尾随文字；传入 schema 时取第一个符合它的值）"""
+    validator = IncrementalJSONValidator(schema=schema)
+    validator.feed(content)
+    if not validator.complete:
+        raise StructuredOutputError(f"JSON 不完整: {content[-80:]!r}")
+    try:
+        return json.loads(validator.text)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"JSON 解析失败: {e}") from None
+
+
+def validate_structured(value: Any, schema: Type[T]) -> T:
+    try:
+        return schema.model_validate(value)
+    except ValidationError as e:
+        raise StructuredOutputError(f"输出不符合 {schema.__name__}: {e}") from None
+
+
+def parse_structured(content: str, schema: Type[T]) -> T:
+    return validate_structured(parse_json_text(content, schema), schema)
+
+
+def guided_kwargs(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """传给后端 generate 的约束解码参数"""
+    return {"json_schema": schema.model_json_schema()}
@@ -1,18 +1,107 @@
 import aiohttp
 import asyncio
-from typing import Dict, Any, AsyncIterator, List
-from .base import ModelBackend, ModelResponse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from .base import ModelBackend, ModelResponse, StreamTimer, close_on_loop
+from .hedging import HedgePolicy, ahedged_call, hedged_call
+from .load_balancer import Endpoint, EndpointPool
 from loguru import logger
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import time
+
+
+class ReplicaError(Exception):
+    """副本级故障（5xx），可换副本重试"""
+    pass
+
+
+# 可换副本重试的错误
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, ReplicaError)
+ASYNC_RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError, ReplicaError)
+
 
 class VLLMBackend(ModelBackend):
     """vLLM后端实现 - 生产级目标"""
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self._base_url = config.get("connection", {}).get("host", "http://localhost:8000")
-        logger.info(f"🔧 初始化vLLM后端 at {self._base_url}")
+        self.supports_guided_decoding = config.get("features", {}).get("supports_guided_decoding", True)
+        connection = config.get("connection", {})
+        self._base_url = connection.get("host", "http://localhost:8000")
+        # 连接池参数（见 configs/backends/vllm.yaml 的 connection 段）
+        self._timeout = connection.get("timeout", 60)
+        self._connect_timeout = connection.get("connect_timeout", 5)
+        self._pool_size = connection.get("pool_size", 100)
+        self._pool_per_host = connection.get("pool_per_host", 32)
+        self._keepalive_timeout = connection.get("keepalive_timeout", 30)
+        self._health_endpoint = connection.get("health_check_endpoint", "/health")
+        self._health_timeout = connection.get("health_check_timeout", 2)
+        
+        self._session: Optional[requests.Session] = None
+        self._async_session: Optional[aiohttp.ClientSession] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session_lock = threading.Lock()
+        
+        # 多副本负载均衡（connection.endpoints + load_balancing 段）
+        self._pool = EndpointPool.from_config(config, self._base_url, probe=self._probe)
+        self._base_url = self._pool.endpoints[0].url
+        self._max_retries = config.get("load_balancing", {}).get("max_retries", len(self._pool) - 1)
+        # 对冲请求（hedging 段，默认关闭；也可按调用传 hedge=True/False）
+        self._hedge = HedgePolicy.from_config(config)
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        # /v1/completions 不套用聊天模板，批量提示按 batching.prompt_template 在客户端套用
+        self._batch_template = config.get("batching", {}).get("prompt_template") or "{prompt}"
+        logger.info(f"🔧 初始化vLLM后端 at {[e.url for e in self._pool.endpoints]}")
+    
+    @property
+    def session(self) -> requests.Session:
+        """长连接同步会话（首次使用时创建，按配置设置连接池大小）"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self._pool_size,
+                        pool_maxsize=self._pool_per_host,
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers.update({"Content-Type": "application/json"})
+                    self._session = session
+        return self._session
+    
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """长连接异步会话。aiohttp会话绑定事件循环，循环变化时重建"""
+        loop = asyncio.get_running_loop()
+        if (self._async_session is None or self._async_session.closed
+                or self._async_loop is not loop):
+            self._release_async_session(self._async_session, self._async_loop)
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_size,
+                limit_per_host=self._pool_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+            )
+            self._async_session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self._timeout, sock_connect=self._connect_timeout),
+                headers={"Content-Type": "application/json"},
+            )
+            self._async_loop = loop
+        return self._async_session
+    
+    @staticmethod
+    def _release_async_session(session: Optional[aiohttp.ClientSession],
+                               loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """在会话所属的事件循环上关闭会话（见 close_on_loop）"""
+        if session is not None and not session.closed:
+            close_on_loop(session.close, loop)
+    
+    @property
+    def _request_timeout(self):
+        return (self._connect_timeout, self._timeout)
     
     def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
         """vLLM模型加载需通过命令行"""
@@ -20,74 +109,329 @@ class VLLMBackend(ModelBackend):
         # In a real scenario, we might call an endpoint to load a lora or check if model matches.
         return True
     
-    def generate(self, prompt: str, **kwargs) -> ModelResponse:
-        # Implementing sync generation via requests
-        url = f"{self._base_url}/v1/chat/completions"
-        headers = {"Content-Type": "application/json"}
-        
+    def _chat_payload(self, prompt: str, kwargs: Dict[str, Any], stream: bool) -> Dict[str, Any]:
         # Adapt parameters
         params = kwargs.get("parameters", {})
-        data = {
+        payload = {
             "model": kwargs.get("model", "default"), # vLLM often ignores model name if only one is served, or needs exact match
             "messages": [{"role": "user", "content": prompt}],
-            "stream": False,
+            "stream": stream,
             **params
         }
+        if kwargs.get("json_schema") is not None:
+            # vLLM 引导解码：输出被约束为符合 schema 的 JSON
+            payload["guided_json"] = kwargs["json_schema"]
+        return payload
+    
+    @staticmethod
+    def _estimate_cost(prompts: List[str], params: Dict[str, Any]) -> int:
+        """粗略估算请求的token量（提示约4字符/token + 最大生成长度），用于按token加权路由"""
+        return sum(len(p) // 4 for p in prompts) + params.get("max_tokens", 256) * len(prompts)
+    
+    def _probe(self, url: str) -> bool:
+        resp = self.session.get(f"{url}{self._health_endpoint}", timeout=self._health_timeout)
+        return resp.ok
+    
+    def _post_once(self, endpoint: Endpoint, path: str, data: Dict[str, Any], cost: int) -> Dict[str, Any]:
+        """向单个端点POST；可重试的错误会记入端点状态后抛出"""
+        with self._pool.track(endpoint, cost):
+            try:
+                resp = self.session.post(f"{endpoint.url}{path}", json=data, timeout=self._request_timeout)
+                if resp.status_code >= 500:
+                    raise ReplicaError(f"{endpoint.url} 返回 {resp.status_code}")
+                resp.raise_for_status()
+                result = resp.json()
+            except RETRYABLE_ERRORS as e:
+                self._pool.mark_failure(endpoint, e)
+                raise
+        self._pool.mark_success(endpoint)
+        return result
+    
+    async def _apost_once(self, endpoint: Endpoint, path: str, data: Dict[str, Any], cost: int) -> Dict[str, Any]:
+        session = self._get_async_session()
+        with self._pool.track(endpoint, cost):
+            try:
+                async with session.post(f"{endpoint.url}{path}", json=data) as resp:
+                    if resp.status >= 500:
+                        raise ReplicaError(f"{endpoint.url} 返回 {resp.status}")
+                    resp.raise_for_status()
+                    result = await resp.json()
+            except ASYNC_RETRYABLE_ERRORS as e:
+                self._pool.mark_failure(endpoint, e)
+                raise
+        self._pool.mark_success(endpoint)
+        return result
+    
+    def _post(self, path: str, data: Dict[str, Any], cost: int) -> Dict[str, Any]:
+        """同步POST，连接错误/超时/5xx时摘除副本并换副本重试"""
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self._max_retries + 1):
+            endpoint = self._pool.select(exclude=tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint.url)
+            try:
+                return self._post_once(endpoint, path, data, cost)
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+        raise last_error or RuntimeError("没有可用的vLLM端点")
+    
+    async def _apost(self, path: str, data: Dict[str, Any], cost: int) -> Dict[str, Any]:
+        """异步POST，重试语义同 _post"""
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self._max_retries + 1):
+            endpoint = self._pool.select(exclude=tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint.url)
+            try:
+                return await self._apost_once(endpoint, path, data, cost)
+            except ASYNC_RETRYABLE_ERRORS as e:
+                last_error = e
+        raise last_error or RuntimeError("没有可用的vLLM端点")
+    
+    def _should_hedge(self, kwargs: Dict[str, Any]) -> bool:
+        return kwargs.get("hedge", self._hedge.enabled) and len(self._pool) > 1
+    
+    @property
+    def hedge_executor(self) -> ThreadPoolExecutor:
+        """同步对冲请求使用的线程池（首次使用时创建）"""
+        if self._hedge_executor is None:
+            with self._session_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=self._pool_per_host, thread_name_prefix="vllm-hedge")
+        return self._hedge_executor
+    
+    def _chat(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        data = self._chat_payload(prompt, kwargs, stream=False)
+        cost = self._estimate_cost([prompt], data)
+        if self._should_hedge(kwargs):
+            return hedged_call(
+                self._pool, self._hedge, "generate", self.hedge_executor,
+                lambda e: self._post_once(e, "/v1/chat/completions", data, cost),
+                RETRYABLE_ERRORS, self._max_retries,
+            )
+        start = time.perf_counter()
+        result = self._post("/v1/chat/completions", data, cost)
+        # 未对冲的请求同样计入延迟分布，作为对冲阈值的依据
+        self._hedge.observe("generate", time.perf_counter() - start)
+        return result
+    
+    async def _achat(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        data = self._chat_payload(prompt, kwargs, stream=False)
+        cost = self._estimate_cost([prompt], data)
+        if self._should_hedge(kwargs):
+            return await ahedged_call(
+                self._pool, self._hedge, "generate",
+                lambda e: self._apost_once(e, "/v1/chat/completions", data, cost),
+                ASYNC_RETRYABLE_ERRORS, self._max_retries,
+            )
+        start = time.perf_counter()
+        result = await self._apost("/v1/chat/completions", data, cost)
+        self._hedge.observe("generate", time.perf_counter() - start)
+        return result
+    
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        # Implementing sync generation via the pooled session
+        start = time.time()
 
         try:
-            resp = requests.post(url, json=data, headers=headers)
-            resp.raise_for_status()
-            result = resp.json()
+            result = self._chat(prompt, kwargs)
             return ModelResponse(
                 content=result["choices"][0]["message"]["content"],
-                usage=result.get("usage", {})
+                usage=result.get("usage", {}),
+                latency=time.time() - start
             )
         except Exception as e:
             logger.error(f"vLLM generation error: {e}")
             raise
 
-    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
-        """vLLM流式API实现"""
-        url = f"{self._base_url}/v1/chat/completions"
-        headers = {"Content-Type": "application/json"}
-        params = kwargs.get("parameters", {})
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        """基于aiohttp的原生异步生成"""
+        start = time.time()
+
+        try:
+            result = await self._achat(prompt, kwargs)
+            return ModelResponse(
+                content=result["choices"][0]["message"]["content"],
+                usage=result.get("usage", {}),
+                latency=time.time() - start
+            )
+        except Exception as e:
+            logger.error(f"vLLM generation error: {e}")
+            raise
+
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        """
+        通过 /v1/completions 的 prompt 列表一次提交多条请求
+
+        与 generate（/v1/chat/completions）不同，completions 接口不会套用模型的聊天模板，
+        这里按 batching.prompt_template 在客户端套用；未配置时按原始文本续写，输出会与 generate 不一致。
+        """
+        if not prompts:
+            return []
         data = {
             "model": kwargs.get("model", "default"),
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": True,
-            **params
+            "prompt": [self._batch_template.format(prompt=p) for p in prompts],
+            **kwargs.get("parameters", {})
         }
+        start = time.time()
+
+        try:
+            result = self._post("/v1/completions", data, self._estimate_cost(prompts, data))
+        except Exception as e:
+            logger.error(f"vLLM batch generation error: {e}")
+            raise
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, headers=headers) as resp:
-                async for line in resp.content:
-                    line = line.decode('utf-8').strip()
-                    if line.startswith("data: ") and line != "data: [DONE]":
-                        json_str = line[6:]  # Remove "data: "
-                        try:
-                            chunk = json.loads(json_str)
-                            content = chunk["choices"][0]["delta"].get("content", "")
+        choices = sorted(result["choices"], key=lambda c: c.get("index", 0))
+        if len(choices) != len(prompts):
+            raise RuntimeError(f"vLLM批量响应数量不匹配: 期望 {len(prompts)}, 实际 {len(choices)}")
+        latency = time.time() - start
+        # 整批的usage记在第一条响应上，逐条求和与实际用量一致
+        return [
+            ModelResponse(
+                content=c["text"],
+                usage=result.get("usage", {}) if i == 0 else {},
+                latency=latency
+            )
+            for i, c in enumerate(choices)
+        ]
+
+    async def _stream_from(self, endpoint: Endpoint, data: Dict[str, Any], cost: int) -> AsyncIterator[str]:
+        """单个端点的流式内容；可重试的错误记入端点状态后抛出"""
+        session = self._get_async_session()
+        with self._pool.track(endpoint, cost):
+            try:
+                async with session.post(f"{endpoint.url}/v1/chat/completions", json=data) as resp:
+                    if resp.status >= 500:
+                        raise ReplicaError(f"{endpoint.url} 返回 {resp.status}")
+                    resp.raise_for_status()
+                    async for line in resp.content:
+                        line = line.decode('utf-8').strip()
+                        if line.startswith("data: ") and line != "data: [DONE]":
+                            json_str = line[6:]  # Remove "data: "
+                            try:
+                                chunk = json.loads(json_str)
+                                content = chunk["choices"][0]["delta"].get("content", "")
+                            except json.JSONDecodeError:
+                                continue
                             if content:
-                                yield ModelResponse(content=content)
-                        except json.JSONDecodeError:
-                            pass
+                                yield content
+            except ASYNC_RETRYABLE_ERRORS as e:
+                self._pool.mark_failure(endpoint, e)
+                raise
+        self._pool.mark_success(endpoint)
     
-    def is_available(self) -> bool:
+    async def _stream_with_retry(self, data: Dict[str, Any], cost: int) -> AsyncIterator[str]:
+        """仅在尚未输出任何token时换副本重试"""
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self._max_retries + 1):
+            endpoint = self._pool.select(exclude=tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint.url)
+            started = False
+            start = time.perf_counter()
+            try:
+                async for content in self._stream_from(endpoint, data, cost):
+                    if not started:
+                        started = True
+                        self._hedge.observe("stream", time.perf_counter() - start)
+                    yield content
+            except ASYNC_RETRYABLE_ERRORS as e:
+                if started:
+                    raise
+                last_error = e
+                continue
+            return
+        raise last_error or RuntimeError("没有可用的vLLM端点")
+    
+    async def _first_chunk(self, endpoint: Endpoint, data: Dict[str, Any],
+                           cost: int) -> Tuple[Optional[str], AsyncIterator[str]]:
+        """打开流并读到首个token（对冲以首token为准）"""
+        stream = self._stream_from(endpoint, data, cost)
         try:
-            requests.get(f"{self._base_url}/health", timeout=5)
-            return True
-        except:
-            return False
+            return await stream.__anext__(), stream
+        except StopAsyncIteration:
+            return None, stream
+        except BaseException:
+            await stream.aclose()
+            raise
+    
+    async def _hedged_stream(self, data: Dict[str, Any], cost: int) -> AsyncIterator[str]:
+        """首token超过对冲阈值时向另一副本发出相同的流式请求，先出首token者胜出"""
+        first, stream = await ahedged_call(
+            self._pool, self._hedge, "stream",
+            lambda e: self._first_chunk(e, data, cost),
+            ASYNC_RETRYABLE_ERRORS, self._max_retries,
+            discard=lambda result: result[1].aclose(),
+        )
+        try:
+            if first is None:
+                return
+            yield first
+            async for content in stream:
+                yield content
+        finally:
+            await stream.aclose()
+    
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        """vLLM流式API实现（仅在尚未输出任何token时换副本重试）"""
+        data = self._chat_payload(prompt, kwargs, stream=True)
+        cost = self._estimate_cost([prompt], data)
+        timer = StreamTimer()
+        if self._should_hedge(kwargs):
+            stream = self._hedged_stream(data, cost)
+        else:
+            stream = self._stream_with_retry(data, cost)
+        async for content in stream:
+            yield ModelResponse(content=content, **timer.tick())
+    
+    def is_available(self) -> bool:
+        """探测所有副本，任一健康即可用"""
+        self._pool.check_health()
+        return any(e.healthy for e in self._pool.endpoints)
     
     def get_model_info(self, model_id: str) -> Dict[str, Any]:
-        return {"backend": "vllm", "model": model_id}
+        return {
+            "backend": "vllm",
+            "model": model_id,
+            "endpoints": self._pool.get_stats(),
+            "hedging": self._hedge.get_stats(),
+        }
     
     def list_loaded_models(self) -> List[str]:
         # vLLM API获取模型列表
         try:
-            resp = requests.get(f"{self._base_url}/v1/models")
+            endpoint = self._pool.select()
+            resp = self.session.get(f"{endpoint.url}/v1/models", timeout=self._request_timeout)
             if resp.status_code == 200:
                 return [m["id"] for m in resp.json()["data"]]
         except:
             pass
         return ["vllm-model-placeholder"]
+    
+    def close(self) -> None:
+        """关闭同步与异步连接池"""
+        self._pool.close()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+            self._hedge_executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        session, loop = self._async_session, self._async_loop
+        self._async_session, self._async_loop = None, None
+        self._release_async_session(session, loop)
+    
+    async def aclose(self) -> None:
+        """在事件循环内关闭连接池"""
+        session = self._async_session
+        if session is not None and not session.closed and self._async_loop is asyncio.get_running_loop():
+            await session.close()
+            self._async_session, self._async_loop = None, None
+        self.close()
@@ -0,0 +1,254 @@
+"""
+近似最近邻索引（IVF，倒排文件）
+
+先用球面 k-means 把向量聚成 nlist 个簇，每个簇维护一个行号倒排表；
+查询时只扫描与查询最相似的 nprobe 个簇（nprobe 越大召回越高、越慢，nprobe = nlist 即精确搜索）。
+- 增量写入：新向量直接归入最近的簇；规模增长到训练时的 retrain_factor 倍后重新训练
+- 删除：打墓碑标记（查询时跳过），墓碑比例超过 compact_ratio 时整理矩阵并重建倒排表
+- 训练前（向量数不足 min_train_size）退化为精确搜索
+与 DenseIndex 接口一致，可直接替换 SimpleVectorStore.dense_index。
+"""
+
+import math
+import threading
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from src.utils.vector_index import normalize, top_k_rows
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """对归一化向量做球面 k-means（按余弦相似度分配），返回归一化的质心"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k)
+        # 空簇重新随机取一个样本作为质心
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    IVF 近似向量索引
+
+    - nlist: 簇数（None 表示训练时取 4·sqrt(n)）
+    - nprobe: 每次查询扫描的簇数，可在 search 时覆盖
+    - min_train_size: 达到该向量数后才训练，之前为精确搜索
+    """
+
+    def __init__(self, dim: Optional[int] = None, nlist: Optional[int] = None, nprobe: int = 8,
+                 min_train_size: int = 1024, retrain_factor: float = 4.0, compact_ratio: float = 0.3,
+                 seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.compact_ratio = compact_ratio
+        self.seed = seed
+        self._matrix: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self.ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+        self._trained_size = 0
+        self._lock = threading.RLock()
+        self.stats = {"trainings": 0, "compactions": 0, "queries": 0, "scanned": 0}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.rows
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """所有行（含墓碑）的视图"""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def _reserve(self, rows: int) -> None:
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        alive = np.zeros(new_capacity, dtype=bool)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            alive[:self._size] = self._alive[:self._size]
+        self._matrix, self._alive = matrix, alive
+
+    def add(self, doc_id: str, vector: Sequence[float]) -> None:
+        self.add_batch([doc_id], np.asarray(vector, dtype=np.float32)[None, :])
+
+    def add_batch(self, doc_ids: Sequence[str], vectors: np.ndarray) -> None:
+        """批量写入（已存在的ID旧行打墓碑后追加新行）"""
+        vectors = normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(doc_ids):
+            raise ValueError(f"向量形状 {vectors.shape} 与 {len(doc_ids)} 个文档ID不匹配")
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+            start = self._size
+            self._reserve(start + len(doc_ids))
+            self._matrix[start:start + len(doc_ids)] = vectors
+            self._alive[start:start + len(doc_ids)] = True
+            self._size += len(doc_ids)
+            for offset, doc_id in enumerate(doc_ids):
+                self._tombstone(doc_id)
+                self.rows[doc_id] = start + offset
+                self.ids.append(doc_id)
+            if self.trained:
+                self._assign(np.arange(start, self._size))
+            self._maybe_train()
+
+    def _assign(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        cells = np.argmax(self._matrix[rows] @ self.centroids.T, axis=1)
+        for row, cell in zip(rows.tolist(), cells.tolist()):
+            self._lists[cell].append(row)
+            self._list_arrays[cell] = None
+
+    def _maybe_train(self) -> None:
+        alive = len(self.rows)
+        if not self.trained:
+            if alive >= self.min_train_size:
+                self.train()
+        elif alive >= self._trained_size * self.retrain_factor:
+            self.train()
+
+    def train(self, sample_size: Optional[int] = None) -> None:
+        """在（采样的）现有向量上训练质心并重建倒排表"""
+        with self._lock:
+            self._compact()
+            n = self._size
+            if n == 0:
+                return
+            nlist = min(self.nlist or max(1, int(4 * math.sqrt(n))), n)
+            sample_size = sample_size or min(n, nlist * 64)
+            rng = np.random.default_rng(self.seed)
+            sample = self._matrix[rng.choice(n, size=sample_size, replace=False)] if sample_size < n \
+                else self._matrix[:n]
+            self.centroids = spherical_kmeans(sample, nlist, seed=self.seed)
+            self._lists = [[] for _ in range(nlist)]
+            self._list_arrays = [None] * nlist
+            self._assign(np.arange(n))
+            self._trained_size = n
+            self.stats["trainings"] += 1
+            logger.debug(f"🧭 IVF 索引训练完成: {n} 个向量, {nlist} 个簇")
+
+    def get(self, doc_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self.rows.get(doc_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def _tombstone(self, doc_id: str) -> bool:
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        self.ids[row] = None
+        return True
+
+    def remove(self, doc_id: str) -> bool:
+        """删除：打墓碑，必要时整理"""
+        with self._lock:
+            if not self._tombstone(doc_id):
+                return False
+            if self._size and (self._size - len(self.rows)) / self._size > self.compact_ratio:
+                self._compact()
+                if self.trained:
+                    self._lists = [[] for _ in range(len(self.centroids))]
+                    self._list_arrays = [None] * len(self.centroids)
+                    self._assign(np.arange(self._size))
+            return True
+
+    def _compact(self) -> None:
+        """移除墓碑行，行号重新编排（调用方负责重建倒排表）"""
+        if self._size == len(self.rows):
+            return
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._matrix[:len(keep)] = self._matrix[keep]
+        self._alive[:] = False
+        self._alive[:len(keep)] = True
+        self.ids = [self.ids[row] for row in keep.tolist()]
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._size = len(keep)
+        self.stats["compactions"] += 1
+
+    def _list_array(self, cell: int) -> np.ndarray:
+        array = self._list_arrays[cell]
+        if array is None:
+            array = self._list_arrays[cell] = np.asarray(self._lists[cell], dtype=np.int64)
+        return array
+
+    def search(self, query: Sequence[float], top_k: int = 5, nprobe: Optional[int] = None,
+               candidates: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        return self.search_batch(np.asarray(query, dtype=np.float32)[None, :], top_k, nprobe, candidates)[0]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5, nprobe: Optional[int] = None,
+                     candidates: Optional[AbstractSet[str]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        每个查询只扫描最相似的 nprobe 个簇
+        给定 candidates（过滤后的文档）时直接在候选行上做精确搜索：按簇搜索再过滤会凑不满 k 个
+        """
+        queries = normalize(queries)
+        with self._lock:
+            self.stats["queries"] += len(queries)
+            if not self.rows:
+                return [[] for _ in range(len(queries))]
+            if candidates is not None:
+                rows = np.fromiter((self.rows[d] for d in candidates if d in self.rows), dtype=np.int64)
+                candidates_rows = [rows] * len(queries)
+            elif not self.trained:
+                candidates_rows = [np.flatnonzero(self._alive[:self._size])] * len(queries)
+            else:
+                probe = min(nprobe or self.nprobe, len(self.centroids))
+                cells, _ = top_k_rows(queries @ self.centroids.T, probe)
+                candidates_rows = []
+                for row_cells in cells:
+                    rows = np.concatenate([self._list_array(c) for c in row_cells])
+                    candidates_rows.append(rows[self._alive[rows]])
+            results = []
+            for query, rows in zip(queries, candidates_rows):
+                self.stats["scanned"] += len(rows)
+                if len(rows) == 0:
+                    results.append([])
+                    continue
+                columns, selected = top_k_rows((self._matrix[rows] @ query)[None, :], top_k)
+                results.append([(self.ids[rows[c]], float(s)) for c, s in zip(columns[0], selected[0])])
+            return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = self.stats["queries"]
+            return {
+                **self.stats,
+                "vectors": len(self.rows),
+                "tombstones": self._size - len(self.rows),
+                "dim": self.dim,
+                "trained": self.trained,
+                "nlist": 0 if self.centroids is None else len(self.centroids),
+                "nprobe": self.nprobe,
+                "avg_scanned": round(self.stats["scanned"] / queries, 1) if queries else 0.0,
+            }
@@ -1,29 +1,121 @@
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List, Iterator, Mapping
+from src.backends.admission import AdmissionController, AdmittedBackend
 from src.backends.base import ModelBackend
+from src.backends.batching import MicroBatcher
+from src.backends.rate_limit import RateLimitedBackend, RateLimiter
+from src.backends.singleflight import CoalescingBackend, SingleFlight
+from src.utils.health_monitor import HealthMonitor
+import importlib
+import threading
 import yaml
 from loguru import logger
 import os
 
-# Circular import avoidance: Import specific backends inside methods or use dynamic loading if needed.
-# For now, I'll import them at the top but handle the circular dependency if ModelBackend needed BackendManager (it doesn't).
-from src.backends.ollama_backend import OllamaBackend
-from src.backends.vllm_backend import VLLMBackend
+# 后端注册表：backend_type -> (模块路径, 类名)
+# 后端实现及其客户端库（ollama/aiohttp/requests）在首次使用时才导入
+BACKEND_REGISTRY: Dict[str, tuple] = {
+    "ollama": ("src.backends.ollama_backend", "OllamaBackend"),
+    "vllm": ("src.backends.vllm_backend", "VLLMBackend"),
+    "mock": ("src.backends.mock_backend", "MockBackend"),
+}
+
+
+class LazyBackends(Mapping):
+    """后端映射：配置在加载时登记，实例在首次访问时构建"""
+    
+    def __init__(self, wrap: Optional[Callable[[str, ModelBackend], ModelBackend]] = None):
+        self._configs: Dict[str, Dict] = {}
+        self._instances: Dict[str, ModelBackend] = {}
+        self._lock = threading.Lock()
+        self._wrap = wrap  # 构建后对实例做包装（如准入控制）
+    
+    def register(self, name: str, config: Dict):
+        """登记后端配置（不构建实例）"""
+        backend_type = config.get("backend_type", name)
+        if backend_type not in BACKEND_REGISTRY:
+            raise ValueError(f"未知的后端类型: {backend_type}")
+        self._configs[name] = config
+    
+    def __getitem__(self, name: str) -> ModelBackend:
+        if name not in self._instances:
+            config = self._configs[name]
+            with self._lock:
+                if name not in self._instances:
+                    module_path, class_name = BACKEND_REGISTRY[config.get("backend_type", name)]
+                    try:
+                        backend_cls = getattr(importlib.import_module(module_path), class_name)
+                        backend = backend_cls(config)
+                        if self._wrap is not None:
+                            backend = self._wrap(name, backend)
+                        self._instances[name] = backend
+                    except Exception as e:
+                        logger.error(f"❌ 后端加载失败 {name}: {e}")
+                        raise
+                    logger.info(f"✅ 加载后端: {name}")
+        return self._instances[name]
+    
+    def __contains__(self, name) -> bool:
+        # Mapping 默认实现会走 __getitem__，从而触发实例化
+        return name in self._configs
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._configs)
+    
+    def __len__(self) -> int:
+        return len(self._configs)
+    
+    def config(self, name: str) -> Dict:
+        return self._configs[name]
+    
+    def type_name(self, name: str) -> str:
+        """后端类名（不触发实例化）"""
+        return BACKEND_REGISTRY[self._configs[name].get("backend_type", name)][1]
+    
+    def loaded(self) -> Dict[str, ModelBackend]:
+        """已构建的后端实例"""
+        return dict(self._instances)
+
 
 class BackendManager:
-    """后端管理器 - 动态切换Ollama/vLLM"""
+    """后端管理器 - 动态切换Ollama/vLLM/Mock
+    
+    构造时不做任何IO：配置在首次使用时解析，后端实例在首次访问时构建。
+    """
     
     def __init__(self):
-        self._backends: Dict[str, ModelBackend] = {}
+        self._backends = LazyBackends(wrap=self._wrap_backend)
         self._active_backend_name: Optional[str] = None
-        self._load_backends()
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._admission: Dict[str, Optional[AdmissionController]] = {}
+        self._admission_lock = threading.Lock()
+        self._rate_limiters: Dict[str, Optional[RateLimiter]] = {}
+        self._coalescing_config: Dict = {}
+        self._singleflights: Dict[str, SingleFlight] = {}
+        self._residency: Dict[str, object] = {}
+        # 独立的锁：构建后端时 _wrap_backend 会获取 _admission_lock
+        self._residency_lock = threading.Lock()
+        self._response_cache = None
+        self._cassette = None
+        self._health_config: Dict = {}
+        self._health_monitor: Optional[HealthMonitor] = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+    
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load_backends()
+                    self._loaded = True
     
     def _load_backends(self):
-        """加载所有后端配置"""
+        """加载所有后端配置（仅登记，不实例化）"""
         # Adjust paths to be relative to the project root or absolute
         base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         backend_configs = [
             ("ollama", os.path.join(base_path, "configs/backends/ollama.yaml")),
             ("vllm", os.path.join(base_path, "configs/backends/vllm.yaml")),
+            ("mock", os.path.join(base_path, "configs/backends/mock.yaml")),
         ]
         
         for backend_name, config_path in backend_configs:
@@ -31,37 +123,60 @@ class BackendManager:
                 if os.path.exists(config_path):
                     with open(config_path, "r", encoding="utf-8") as f:
                         config = yaml.safe_load(f)
-                    
-                    if backend_name == "ollama":
-                        self._backends[backend_name] = OllamaBackend(config)
-                    elif backend_name == "vllm":
-                        self._backends[backend_name] = VLLMBackend(config)
-                    
-                    logger.info(f"✅ 加载后端: {backend_name}")
+                    self._backends.register(backend_name, config)
                 else:
                     logger.warning(f"⚠️ 后端配置不存在: {config_path}")
             except Exception as e:
-                logger.error(f"❌ 后端加载失败 {backend_name}: {e}")
+                logger.error(f"❌ 后端配置加载失败 {backend_name}: {e}")
         
         # Load active backend from models.yaml or default to ollama
         try:
-            models_config_path = os.path.join(base_path, "configs/models.yaml")
-            if os.path.exists(models_config_path):
-                 with open(models_config_path, "r", encoding="utf-8") as f:
-                    models_config = yaml.safe_load(f)
-                    preferred = models_config.get("active_backend", "ollama")
-                    if preferred in self._backends:
-                        self._active_backend_name = preferred
+            from src.utils.config_registry import models_registry
+            models_config = models_registry.raw
+            preferred = models_config.get("active_backend", "ollama")
+            if preferred in self._backends:
+                self._active_backend_name = preferred
+            self._health_config = models_config.get("health_monitor", {})
+            self._coalescing_config = models_config.get("coalescing", {})
         except Exception:
-            pass
+            models_config = {}
+        
+        # 响应缓存与录制/回放：配置错误或文件无法打开时记录并以未启用继续
+        try:
+            cache_config = models_config.get("response_cache", {})
+            if cache_config.get("enabled", False):
+                from src.utils.response_cache import ResponseCache
+                self._response_cache = ResponseCache.from_config(cache_config, base_path)
+        except Exception as e:
+            logger.error(f"❌ 响应缓存初始化失败: {e}")
+        try:
+            cassette_config = models_config.get("cassette", {})
+            if cassette_config.get("enabled", False):
+                from src.utils.cassette import Cassette
+                self._cassette = Cassette.from_config(cassette_config, base_path)
+        except Exception as e:
+            logger.error(f"❌ 录制/回放初始化失败: {e}")
 
         # Fallback
         if not self._active_backend_name and "ollama" in self._backends:
             self._active_backend_name = "ollama"
     
+    @property
+    def response_cache(self):
+        """共享的LLM响应缓存（未启用时为None）"""
+        self._ensure_loaded()
+        return self._response_cache
+    
+    @property
+    def cassette(self):
+        """录制/回放文件（未启用时为None）"""
+        self._ensure_loaded()
+        return self._cassette
+    
     @property
     def active_backend(self) -> ModelBackend:
         """获取当前激活后端实例"""
+        self._ensure_loaded()
         if self._active_backend_name is None:
             raise ValueError("无可用后端")
         return self._backends[self._active_backend_name]
@@ -69,33 +184,248 @@ class BackendManager:
     @property
     def active_backend_name(self) -> str:
         """获取当前激活后端名称"""
+        self._ensure_loaded()
         return self._active_backend_name
 
+    @property
+    def health(self) -> HealthMonitor:
+        """后端健康监控器（首次访问时启动后台探测）"""
+        self._ensure_loaded()
+        if self._health_monitor is None:
+            self._health_monitor = HealthMonitor.from_config(self._backends, self._health_config,
+                                                             targets=self._probe_targets,
+                                                             on_available=self._on_backend_available)
+            self._health_monitor.start()
+        return self._health_monitor
+
+    def _probe_targets(self) -> List[str]:
+        """健康探测的对象：已构建的后端与当前激活后端（不为探测而构建其他后端）"""
+        return [*self._backends.loaded(), self._active_backend_name]
+
+    def _on_backend_available(self, name: str) -> None:
+        """健康探测发现后端可用时（探测线程）：激活后端开始显存预加载"""
+        if name == self._active_backend_name:
+            self._start_preload(name)
+
+    def _start_preload(self, name: str) -> None:
+        """在驻留管理器的后台线程中预加载 residency.preload 中的模型（留空则为 active_model；幂等）"""
+        manager = self.get_residency(name)
+        options = self._backends.config(name).get("residency", {})
+        if manager is None or not options.get("preload_on_start", True):
+            return
+        from src.utils.config_registry import models_registry
+        models = models_registry.config.models
+        preload = options.get("preload") or [models_registry.config.active_model]
+        manager.start_preload(
+            models[m].backend_repos[name] for m in preload
+            if m in models and name in models[m].backend_repos
+        )
+
     def switch_backend(self, backend_name: str) -> bool:
         """切换后端"""
+        self._ensure_loaded()
         if backend_name not in self._backends:
             available = list(self._backends.keys())
             logger.error(f"后端 {backend_name} 不存在。可用: {available}")
             return False
         
-        # 检查后端健康状态 (Optional: can be skipped if we want to force switch)
-        if not self._backends[backend_name].is_available():
+        # 检查后端健康状态（读取缓存，不阻塞；未探测过则跳过）
+        if self.health.get_status(backend_name).available is False:
             logger.warning(f"后端 {backend_name} 服务似乎不可用，但仍尝试切换")
         
         self._active_backend_name = backend_name
         logger.info(f"🔄 切换到后端: {backend_name}")
+        # 已知可用时直接开始预加载，否则立即发起一轮探测（可用后由 _on_backend_available 触发）
+        if self.health.get_status(backend_name).available:
+            self._start_preload(backend_name)
+        else:
+            self.health.refresh(wait_for_results=False)
         return True
     
     def list_backends(self) -> Dict[str, Dict]:
-        """列出所有后端及其状态"""
+        """列出所有后端及其状态（健康信息来自后台监控缓存，available 为 None 表示尚未探测：
+        探测完成前，或后端既未构建也未激活）"""
+        self._ensure_loaded()
         result = {}
-        for name, backend in self._backends.items():
+        for name in self._backends:
+            status = self.health.get_status(name)
             result[name] = {
-                "available": backend.is_available(),
+                "available": status.available,
+                "checked_at": status.checked_at,
+                "latency": status.latency,
                 "active": name == self._active_backend_name,
-                "type": type(backend).__name__
+                "type": self._backends.type_name(name)
             }
         return result
 
+    def get_backend_config(self, backend_name: Optional[str] = None) -> Dict:
+        """后端YAML配置（不会实例化后端；共享字典，不要修改）"""
+        self._ensure_loaded()
+        name = backend_name or self._active_backend_name
+        if name not in self._backends:
+            raise ValueError(f"后端 {name} 不存在")
+        return self._backends.config(name)
+
+    def get_admission(self, backend_name: Optional[str] = None) -> Optional[AdmissionController]:
+        """获取后端的准入控制器（按后端YAML的 admission 段配置，未启用时为None）
+        
+        后端实例与 load_llm 构建的LangChain模型共用同一个控制器，并发上限对两条调用路径合并计算。
+        """
+        self._ensure_loaded()
+        name = backend_name or self._active_backend_name
+        if name not in self._backends:
+            raise ValueError(f"后端 {name} 不存在")
+        return self._admission_for(name)
+
+    def _admission_for(self, name: str) -> Optional[AdmissionController]:
+        if name not in self._admission:
+            with self._admission_lock:
+                if name not in self._admission:
+                    self._admission[name] = AdmissionController.from_config(name, self._backends.config(name))
+        return self._admission[name]
+
+    def get_rate_limiter(self, backend_name: Optional[str] = None) -> Optional[RateLimiter]:
+        """获取后端的令牌桶限流器（后端YAML的 rate_limits 段，未启用时为None），与LangChain模型共用"""
+        self._ensure_loaded()
+        name = backend_name or self._active_backend_name
+        if name not in self._backends:
+            raise ValueError(f"后端 {name} 不存在")
+        return self._rate_limiter_for(name)
+
+    def _rate_limiter_for(self, name: str) -> Optional[RateLimiter]:
+        if name not in self._rate_limiters:
+            with self._admission_lock:
+                if name not in self._rate_limiters:
+                    from src.utils.tokenizer import tokenizer_service
+                    self._rate_limiters[name] = RateLimiter.from_config(
+                        name, self._backends.config(name), count_tokens=tokenizer_service.count)
+        return self._rate_limiters[name]
+
+    def get_singleflight(self, backend_name: Optional[str] = None) -> Optional[SingleFlight]:
+        """获取后端的请求合并组（models.yaml 的 coalescing 段，未启用时为None）"""
+        self._ensure_loaded()
+        name = backend_name or self._active_backend_name
+        if name not in self._backends:
+            raise ValueError(f"后端 {name} 不存在")
+        return self._singleflight_for(name)
+
+    def _singleflight_for(self, name: str) -> Optional[SingleFlight]:
+        if not self._coalescing_config.get("enabled", False):
+            return None
+        with self._admission_lock:
+            if name not in self._singleflights:
+                self._singleflights[name] = SingleFlight(
+                    name, allow_sampled=self._coalescing_config.get("allow_sampled", True))
+        return self._singleflights[name]
+
+    def _wrap_backend(self, name: str, backend: ModelBackend) -> ModelBackend:
+        # 合并在外层：被合并的请求不再占用准入名额
+        controller = self._admission_for(name)
+        if controller is not None:
+            backend = AdmittedBackend(backend, controller)
+        # 限流在准入之外：等待令牌时不占用并发名额
+        limiter = self._rate_limiter_for(name)
+        if limiter is not None:
+            backend = RateLimitedBackend(backend, limiter)
+        # 回放命中不占准入名额与限流配额
+        if self._cassette is not None:
+            from src.utils.cassette import CassetteBackend
+            backend = CassetteBackend(backend, self._cassette, namespace=name)
+        group = self._singleflight_for(name)
+        if group is not None:
+            backend = CoalescingBackend(backend, group)
+        return backend
+
+    def admission_stats(self) -> Dict[str, Dict]:
+        """各后端的准入统计（在途数、队列深度、等待时间）"""
+        return {name: c.get_stats() for name, c in self._admission.items() if c is not None}
+
+    def rate_limit_stats(self) -> Dict[str, Dict]:
+        """各后端按模型/租户的限流统计（请求数、token数、被限流次数、桶内余量）"""
+        return {name: r.get_stats() for name, r in self._rate_limiters.items() if r is not None}
+
+    def get_residency(self, backend_name: Optional[str] = None):
+        """获取后端的显存驻留管理器（后端YAML的 residency 段；后端不支持或未启用时为None）
+        
+        只构建管理器、不做网络调用。预加载在激活后端的健康探测成功时开始（见 _on_backend_available），
+        这里确保健康监控已启动。
+        """
+        self._ensure_loaded()
+        name = backend_name or self._active_backend_name
+        if name not in self._backends:
+            raise ValueError(f"后端 {name} 不存在")
+        config = self._backends.config(name)
+        options = config.get("residency", {})
+        if not options.get("enabled", False):
+            return None
+        if name in self._residency:
+            return self._residency[name]
+        # 先在锁外构建（或取出）后端
+        backend = self._backends[name]
+        with self._residency_lock:
+            if name not in self._residency:
+                if not hasattr(backend, "load_resident"):
+                    self._residency[name] = None
+                else:
+                    from src.utils.config_registry import models_registry
+                    from src.utils.residency import ResidencyManager
+                    self._residency[name] = ResidencyManager.from_config(backend, name, config, models_registry)
+        manager = self._residency[name]
+        if manager is not None:
+            self.health  # 启动后台探测（幂等）
+        return manager
+
+    def coalescing_stats(self) -> Dict[str, Dict]:
+        """各后端的请求合并统计（saved_calls 为被合并、未发往后端的调用数）"""
+        return {name: group.get_stats() for name, group in self._singleflights.items()}
+
+    def get_batcher(self, backend_name: Optional[str] = None) -> MicroBatcher:
+        """获取后端的微批处理器（按后端YAML的 features.supports_batching 与 batching 段配置）"""
+        self._ensure_loaded()
+        name = backend_name or self._active_backend_name
+        if name not in self._backends:
+            raise ValueError(f"后端 {name} 不存在")
+        if name not in self._batchers:
+            # 后端实例在锁外构建（构建时会获取准入控制器等，同样需要 _admission_lock）
+            backend = self._backends[name]
+            with self._admission_lock:
+                if name not in self._batchers:
+                    self._batchers[name] = MicroBatcher.from_config(backend, self._backends.config(name))
+        return self._batchers[name]
+
+    def _close_services(self):
+        if self._health_monitor is not None:
+            self._health_monitor.stop()
+            self._health_monitor = None
+        for batcher in self._batchers.values():
+            batcher.close()
+        self._batchers.clear()
+        for manager in self._residency.values():
+            if manager is not None:
+                manager.close()
+        self._residency.clear()
+        if self._response_cache is not None:
+            self._response_cache.close()
+        if self._cassette is not None:
+            self._cassette.close()
+
+    def close(self):
+        """关闭所有后端的连接池"""
+        self._close_services()
+        for name, backend in self._backends.loaded().items():
+            try:
+                backend.close()
+            except Exception as e:
+                logger.warning(f"后端 {name} 关闭失败: {e}")
+
+    async def aclose(self):
+        """在事件循环内关闭所有后端的连接池"""
+        self._close_services()
+        for name, backend in self._backends.loaded().items():
+            try:
+                await backend.aclose()
+            except Exception as e:
+                logger.warning(f"后端 {name} 关闭失败: {e}")
+
 # 全局单例
 backend_manager = BackendManager()
@@ -0,0 +1,140 @@
+"""
+倒排索引 + BM25 关键词检索
+
+文档在写入/删除时增量更新倒排表（词 -> {文档ID: 词频}），查询只遍历查询词的倒排表，
+开销与命中的倒排表长度成正比，与语料总量无关；前 k 个结果用堆选出，不对全部候选排序。
+
+分词：拉丁字母/数字按词切分并转小写；CJK 没有空格分词，连续的 CJK 字符切成相邻二元组
+（单字时保留单字），与 Lucene CJKAnalyzer 的做法一致。
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from operator import itemgetter
+from typing import AbstractSet, Any, Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+|[A-Za-z0-9_]+")
+_CJK_START = "぀"
+
+
+def analyze(text: str) -> List[str]:
+    """把文本切分为索引词"""
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token[0] < _CJK_START:
+            terms.append(token)
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+class BM25Index:
+    """
+    增量维护的 BM25 倒排索引
+
+    - k1: 词频饱和参数
+    - b: 文档长度归一化强度
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # 正排：删除时据此清理倒排表
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_lengths
+
+    def add(self, doc_id: str, text: str) -> None:
+        """写入文档（已存在时先删除旧内容）"""
+        terms = analyze(text)
+        counts = dict(Counter(terms))
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+            self.doc_terms[doc_id] = counts
+            self.doc_lengths[doc_id] = len(terms)
+            self.total_length += len(terms)
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> bool:
+        counts = self.doc_terms.pop(doc_id, None)
+        if counts is None:
+            return False
+        for term in counts:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        return True
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str, candidates: Optional[AbstractSet[str]] = None) -> Dict[str, float]:
+        """
+        所有至少命中一个查询词的文档的 BM25 分数
+        给定 candidates 时只对其中的文档打分：候选集合比倒排表短时遍历候选集合
+        """
+        scores: Dict[str, float] = {}
+        with self._lock:
+            if not self.doc_lengths:
+                return scores
+            avgdl = self.total_length / len(self.doc_lengths) or 1.0
+            k1, lengths = self.k1, self.doc_lengths
+            base, slope = k1 * (1 - self.b), k1 * self.b / avgdl
+            for term, qtf in Counter(analyze(query)).items():
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                weight = self.idf(term) * qtf * (k1 + 1)
+                if candidates is None:
+                    items = postings.items()
+                elif len(candidates) < len(postings):
+                    items = ((d, postings[d]) for d in candidates if d in postings)
+                else:
+                    items = ((d, tf) for d, tf in postings.items() if d in candidates)
+                for doc_id, tf in items:
+                    score = weight * tf / (tf + base + slope * lengths[doc_id])
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return scores
+
+    def search(self, query: str, top_k: int = 5,
+               candidates: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        """按 BM25 分数返回前 top_k 个 (文档ID, 分数)"""
+        return top_k_items(self.scores(query, candidates).items(), top_k)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = len(self.doc_lengths)
+            return {
+                "documents": n,
+                "terms": len(self.postings),
+                "postings": sum(len(p) for p in self.postings.values()),
+                "avg_doc_length": round(self.total_length / n, 2) if n else 0.0,
+            }
+
+
+def top_k_items(items: Iterable[Tuple[str, float]], top_k: int) -> List[Tuple[str, float]]:
+    """用堆选出分数最高的 top_k 个（分数相同时按插入顺序）"""
+    return heapq.nlargest(top_k, items, key=itemgetter(1))
@@ -0,0 +1,333 @@
+"""
+模型级联（cascade）
+
+先用最便宜的模型回答，按置信度决定是否升级到更大的模型：
+- logprobs: 按回复 token 的平均对数概率（几何平均概率）打分，需要后端返回 logprobs
+- verifier: 用校验提示让模型（默认为本级模型）给回答打 0-10 分
+- format: 按格式校验打分（候选标签 / JSON 及必需字段 / 正则），不额外调用模型
+最后一级总是被接受。策略写在 configs/models.yaml 的 cascade.policies 下，
+通过 ModelLoader.load_cascade(策略名) 获取，返回值可像普通聊天模型一样放进 LCEL 链。
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from loguru import logger
+from pydantic import ConfigDict, PrivateAttr
+
+from src.utils.langchain_adapters import render_messages
+
+VERIFIER_PROMPT = """Rate how likely it is that the ANSWER correctly and completely responds to the REQUEST.
+Reply with a single integer from 0 (certainly wrong) to 10 (certainly correct) and nothing else.
+
+REQUEST:
+{request}
+
+ANSWER:
+{answer}"""
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_JSON_BLOCK = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+def score_logprobs(message: BaseMessage) -> Optional[float]:
+    """回复 token 的几何平均概率；后端未返回 logprobs 时为 None
+
+    兼容 OpenAI 格式（{"content": [{"token", "logprob"}, ...]}）与 Ollama 格式（token 列表）。
+    """
+    logprobs = message.response_metadata.get("logprobs")
+    if isinstance(logprobs, dict):
+        logprobs = logprobs.get("content")
+    values = [t["logprob"] for t in logprobs or [] if isinstance(t, dict) and t.get("logprob") is not None]
+    if not values:
+        return None
+    return math.exp(sum(values) / len(values))
+
+
+def parse_json(text: str) -> Any:
+    """解析回复中的 JSON（允许包在 ``` 代码块中），失败抛出 ValueError"""
+    match = _JSON_BLOCK.search(text)
+    candidate = match.group(1) if match else text
+    start = min((i for i in (candidate.find("{"), candidate.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("回复中没有 JSON")
+    value, _ = json.JSONDecoder().raw_decode(candidate[start:])
+    return value
+
+
+class FormatScorer:
+    """
+    格式校验：满足为 1.0，否则为 0.0
+
+    - choices: 回复（去掉空白、标点并转小写后）必须是其中之一
+    - json: 回复必须包含可解析的 JSON；required 为必需字段
+    - regex: 回复必须匹配该正则
+    """
+
+    def __init__(self, choices: Optional[List[str]] = None, json: bool = False,
+                 required: Optional[List[str]] = None, regex: Optional[str] = None):
+        self.choices = {c.lower() for c in choices} if choices else None
+        self.json = json or bool(required)
+        self.required = required or []
+        self.regex = re.compile(regex, re.DOTALL) if regex else None
+
+    def check(self, text: str) -> bool:
+        if self.choices is not None and text.strip().strip(".,!?:;\"'`").lower() not in self.choices:
+            return False
+        if self.json:
+            try:
+                value = parse_json(text)
+            except ValueError:
+                return False
+            if self.required and not (isinstance(value, dict) and all(k in value for k in self.required)):
+                return False
+        if self.regex is not None and not self.regex.search(text):
+            return False
+        return True
+
+    def score(self, messages: List[BaseMessage], message: BaseMessage,
+              usage: Optional[Dict[str, int]] = None) -> Optional[float]:
+        return 1.0 if self.check(_text(message)) else 0.0
+
+    async def ascore(self, messages: List[BaseMessage], message: BaseMessage,
+                     usage: Optional[Dict[str, int]] = None) -> Optional[float]:
+        return self.score(messages, message)
+
+
+class LogprobScorer:
+    """按 logprobs 打分（阶段模型需以 logprobs=True 调用）"""
+
+    def score(self, messages: List[BaseMessage], message: BaseMessage,
+              usage: Optional[Dict[str, int]] = None) -> Optional[float]:
+        return score_logprobs(message)
+
+    async def ascore(self, messages: List[BaseMessage], message: BaseMessage,
+                     usage: Optional[Dict[str, int]] = None) -> Optional[float]:
+        return score_logprobs(message)
+
+
+class VerifierScorer:
+    """
+    用校验提示让 verifier 模型给回答打分（0-10 映射为 0-1），解析失败时为 None
+
+    传入 usage 字典时把校验调用的 token 用量累加进去（计入该级的用量统计）。
+    """
+
+    def __init__(self, llm, prompt: str = VERIFIER_PROMPT):
+        self.llm = llm
+        self.prompt = prompt
+
+    def _messages(self, messages: List[BaseMessage], message: BaseMessage) -> List[BaseMessage]:
+        return [HumanMessage(content=self.prompt.format(request=render_messages(messages), answer=_text(message)))]
+
+    @staticmethod
+    def _parse(reply: BaseMessage, usage: Optional[Dict[str, int]]) -> Optional[float]:
+        if usage is not None:
+            for k, v in (getattr(reply, "usage_metadata", None) or {}).items():
+                if isinstance(v, int):
+                    usage[k] = usage.get(k, 0) + v
+        match = _NUMBER.search(_text(reply))
+        if not match:
+            return None
+        return min(1.0, max(0.0, float(match.group()) / 10))
+
+    def score(self, messages: List[BaseMessage], message: BaseMessage,
+              usage: Optional[Dict[str, int]] = None) -> Optional[float]:
+        return self._parse(self.llm.invoke(self._messages(messages, message)), usage)
+
+    async def ascore(self, messages: List[BaseMessage], message: BaseMessage,
+                     usage: Optional[Dict[str, int]] = None) -> Optional[float]:
+        return self._parse(await self.llm.ainvoke(self._messages(messages, message)), usage)
+
+
+class CascadeStage:
+    """级联中的一级：模型、打分器与接受阈值（scorer 为 None 表示总是接受）"""
+
+    def __init__(self, name: str, llm, scorer=None, threshold: float = 0.5):
+        self.name = name
+        self.llm = llm
+        self.scorer = scorer
+        self.threshold = threshold
+
+    @classmethod
+    def from_config(cls, spec: Dict[str, Any], load_llm: Callable[[str], Any], last: bool) -> "CascadeStage":
+        """根据 cascade.policies.<策略>.stages 中的一项构建"""
+        model_id = spec["model"]
+        llm = load_llm(model_id)
+        kind = spec.get("scorer")
+        if kind is None and not last:
+            raise ValueError(f"级联阶段 {model_id} 不是最后一级，必须配置 scorer")
+        if kind == "logprobs":
+            llm = llm.bind(logprobs=True)
+            scorer = LogprobScorer()
+        elif kind == "verifier":
+            options = spec.get("verifier", {})
+            verifier = load_llm(options["model"]) if options.get("model") else llm
+            scorer = VerifierScorer(verifier, options.get("prompt", VERIFIER_PROMPT))
+        elif kind == "format":
+            scorer = FormatScorer(**spec.get("format", {}))
+        elif kind is None:
+            scorer = None
+        else:
+            raise ValueError(f"未知的级联打分方式: {kind}，可用: logprobs / verifier / format")
+        return cls(model_id, llm, scorer, spec.get("threshold", 0.5))
+
+
+class CascadeChatModel(BaseChatModel):
+    """
+    级联聊天模型
+
+    依次调用各级模型，置信度达到阈值即返回；某一级出错或置信度无法计算时视为不通过并升级。
+    返回消息的 response_metadata["cascade"] 记录被接受的阶段与每一级的耗时（含打分）、用量和置信度，
+    累计统计见 get_stats()。verifier 打分调用的用量记在该级的 scorer_usage 中，并计入返回消息的总用量。
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    policy: str = "default"
+    stages: List[Any]
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, policy: str, spec: Dict[str, Any], load_llm: Callable[[str], Any]) -> "CascadeChatModel":
+        specs = spec.get("stages", [])
+        if not specs:
+            raise ValueError(f"级联策略 {policy} 没有配置 stages")
+        stages = [CascadeStage.from_config(s, load_llm, i == len(specs) - 1) for i, s in enumerate(specs)]
+        logger.info(f"🪜 级联策略 {policy}: {' -> '.join(s.name for s in stages)}")
+        return cls(policy=policy, stages=stages)
+
+    @property
+    def _llm_type(self) -> str:
+        return "cascade"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"policy": self.policy, "stages": [s.name for s in self.stages]}
+
+    # ---- 统计 ----
+
+    def _record(self, trace: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._stats["requests"] = self._stats.get("requests", 0) + 1
+            for step in trace:
+                stage = self._stats.setdefault(step["model"], {
+                    "calls": 0, "accepted": 0, "escalated": 0, "errors": 0, "latency": 0.0,
+                    "input_tokens": 0, "output_tokens": 0, "scorer_input_tokens": 0, "scorer_output_tokens": 0,
+                })
+                stage["calls"] += 1
+                stage["latency"] += step["latency"]
+                stage["input_tokens"] += step["usage"].get("input_tokens", 0)
+                stage["output_tokens"] += step["usage"].get("output_tokens", 0)
+                stage["scorer_input_tokens"] += step["scorer_usage"].get("input_tokens", 0)
+                stage["scorer_output_tokens"] += step["scorer_usage"].get("output_tokens", 0)
+                if step.get("error"):
+                    stage["errors"] += 1
+                stage["accepted" if step["accepted"] else "escalated"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各级调用次数、接受/升级次数、平均耗时与 token 用量"""
+        with self._lock:
+            stages = {}
+            for stage in self.stages:
+                data = dict(self._stats.get(stage.name, {}))
+                if data.get("calls"):
+                    data["avg_latency"] = data["latency"] / data["calls"]
+                    data["accept_rate"] = data["accepted"] / data["calls"]
+                stages[stage.name] = data
+            return {"policy": self.policy, "requests": self._stats.get("requests", 0), "stages": stages}
+
+    # ---- 生成 ----
+
+    @staticmethod
+    def _step(stage: CascadeStage, start: float, message: Optional[BaseMessage],
+              confidence: Optional[float], accepted: bool, error: Optional[BaseException] = None,
+              scorer_usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        usage = dict(getattr(message, "usage_metadata", None) or {})
+        step = {"model": stage.name, "latency": time.perf_counter() - start, "usage": usage,
+                "scorer_usage": dict(scorer_usage or {}), "confidence": confidence, "accepted": accepted}
+        if error is not None:
+            step["error"] = repr(error)
+        return step
+
+    @staticmethod
+    def _child_config(run_manager: Any) -> Optional[Dict[str, Any]]:
+        """把调用方的 metadata（如 priority）与 tags 传给各级模型"""
+        if run_manager is None:
+            return None
+        return {"metadata": dict(run_manager.metadata or {}), "tags": list(run_manager.tags or [])}
+
+    def _accepts(self, index: int, confidence: Optional[float]) -> bool:
+        stage = self.stages[index]
+        if index == len(self.stages) - 1 or stage.scorer is None:
+            return True
+        return confidence is not None and confidence >= stage.threshold
+
+    def _finish(self, message: BaseMessage, trace: List[Dict[str, Any]]) -> ChatResult:
+        accepted = len(trace) - 1
+        self._record(trace)
+        if accepted:
+            logger.debug(f"🪜 级联 {self.policy} 升级到 {trace[-1]['model']}")
+        usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        for step in trace:
+            for k in usage:
+                usage[k] += step["usage"].get(k, 0) + step["scorer_usage"].get(k, 0)
+        metadata = {**message.response_metadata,
+                    "cascade": {"policy": self.policy, "stage": accepted, "model": trace[-1]["model"], "trace": trace}}
+        result = AIMessage(content=message.content, additional_kwargs=message.additional_kwargs,
+                           response_metadata=metadata, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=result)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        config = self._child_config(run_manager)
+        trace = []
+        for i, stage in enumerate(self.stages):
+            start = time.perf_counter()
+            scoring: Dict[str, int] = {}
+            try:
+                message = stage.llm.invoke(messages, config, stop=stop, **kwargs)
+                confidence = stage.scorer.score(messages, message, scoring) if stage.scorer else None
+            except Exception as e:
+                trace.append(self._step(stage, start, None, None, False, e, scoring))
+                if i == len(self.stages) - 1:
+                    self._record(trace)
+                    raise
+                logger.warning(f"⚠️ 级联阶段 {stage.name} 失败，升级到下一级: {e}")
+                continue
+            accepted = self._accepts(i, confidence)
+            trace.append(self._step(stage, start, message, confidence, accepted, scorer_usage=scoring))
+            if accepted:
+                return self._finish(message, trace)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        config = self._child_config(run_manager)
+        trace = []
+        for i, stage in enumerate(self.stages):
+            start = time.perf_counter()
+            scoring: Dict[str, int] = {}
+            try:
+                message = await stage.llm.ainvoke(messages, config, stop=stop, **kwargs)
+                confidence = await stage.scorer.ascore(messages, message, scoring) if stage.scorer else None
+            except Exception as e:
+                trace.append(self._step(stage, start, None, None, False, e, scoring))
+                if i == len(self.stages) - 1:
+                    self._record(trace)
+                    raise
+                logger.warning(f"⚠️ 级联阶段 {stage.name} 失败，升级到下一级: {e}")
+                continue
+            accepted = self._accepts(i, confidence)
+            trace.append(self._step(stage, start, message, confidence, accepted, scorer_usage=scoring))
+            if accepted:
+                return self._finish(message, trace)
@@ -0,0 +1,238 @@
+"""
+录制/回放（cassette）
+
+把 (提示, 参数) → 响应 写入磁盘上的紧凑文件（每行一条 JSON，路径以 .gz 结尾时 gzip 压缩），
+回放时直接从文件返回，不发任何网络请求，用于快速、可复现地重跑评估基准、练习脚本与回归测试。
+
+- record: 全部走真实后端并重新录制（清空原文件）
+- replay: 只从文件回放；未命中时按 on_miss 处理：fail（抛出 CassetteMiss）/ live（走真实后端，不录制）/
+  record（走真实后端并追加录制）
+同一个键录制了多条响应时（如重复的采样请求），回放按录制顺序循环返回。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+from loguru import logger
+
+from src.backends.base import DelegatingBackend, ModelBackend, ModelResponse
+from src.utils.response_cache import LangChainResponseCache
+
+# 不影响生成结果的调用参数，不参与键计算
+_NON_SEMANTIC_KWARGS = {"priority", "hedge", "tenant"}
+
+
+class CassetteMiss(LookupError):
+    """回放模式下请求未被录制"""
+    pass
+
+
+def cassette_key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    录制文件
+
+    - mode: record / replay
+    - on_miss: fail / live / record（仅 replay 模式）
+    """
+
+    MODES = ("record", "replay")
+    MISS_POLICIES = ("fail", "live", "record")
+
+    def __init__(self, path: str, mode: str = "replay", on_miss: str = "fail"):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的 cassette 模式: {mode}，可用: {self.MODES}")
+        if on_miss not in self.MISS_POLICIES:
+            raise ValueError(f"未知的未命中策略: {on_miss}，可用: {self.MISS_POLICIES}")
+        self.path = path
+        self.mode = mode
+        self.on_miss = on_miss
+        self._entries: Dict[str, List[Any]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._file = None
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        if mode == "replay" and os.path.exists(path):
+            self._load()
+        elif mode == "record" and os.path.exists(path):
+            os.remove(path)
+        logger.info(f"📼 Cassette {mode}: {path} ({len(self._entries)} 个键)")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], base_path: str = "") -> "Cassette":
+        """根据 models.yaml 的 cassette 段构建"""
+        path = config.get("path", ".cache/cassettes/default.jsonl.gz")
+        if not os.path.isabs(path):
+            path = os.path.join(base_path, path)
+        return cls(path, mode=config.get("mode", "replay"), on_miss=config.get("on_miss", "fail"))
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def _load(self) -> None:
+        with self._open("r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry["value"])
+
+    def lookup(self, key: str) -> Optional[Any]:
+        """回放：命中返回录制的值（多条时循环），未命中返回 None"""
+        if self.mode != "replay":
+            return None
+        with self._lock:
+            values = self._entries.get(key)
+            if not values:
+                self.stats["misses"] += 1
+                return None
+            index = self._cursors[key] % len(values)
+            self._cursors[key] += 1
+            self.stats["hits"] += 1
+            return values[index]
+
+    def miss(self, key: str) -> bool:
+        """处理未命中：fail 时抛出 CassetteMiss，否则返回是否需要录制真实响应"""
+        if self.mode == "record":
+            return True
+        if self.on_miss == "fail":
+            raise CassetteMiss(f"cassette {self.path} 中没有该请求的录制 (key={key[:12]})")
+        return self.on_miss == "record"
+
+    def record(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key].append(value)
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = self._open("a")
+            self._file.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.stats["recorded"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "mode": self.mode, "keys": len(self._entries)}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CassetteBackend(DelegatingBackend):
+    """为任意 ModelBackend 录制/回放 generate、agenerate、generate_batch 与 generate_stream"""
+
+    def __init__(self, inner: ModelBackend, cassette: Cassette, namespace: str = ""):
+        super().__init__(inner)
+        self.cassette = cassette
+        self.namespace = namespace
+
+    def _key(self, kind: str, prompt: str, kwargs: Dict[str, Any]) -> str:
+        params = {k: v for k, v in kwargs.items() if k not in _NON_SEMANTIC_KWARGS}
+        return cassette_key(self.namespace, kind, prompt, params)
+
+    @staticmethod
+    def _dump(response: ModelResponse) -> Dict[str, Any]:
+        return response.model_dump()
+
+    @staticmethod
+    def _load(value: Dict[str, Any]) -> ModelResponse:
+        return ModelResponse.model_validate(value)
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        key = self._key("generate", prompt, kwargs)
+        value = self.cassette.lookup(key)
+        if value is not None:
+            return self._load(value)
+        record = self.cassette.miss(key)
+        response = self.inner.generate(prompt, **kwargs)
+        if record:
+            self.cassette.record(key, self._dump(response))
+        return response
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        key = self._key("generate", prompt, kwargs)
+        value = self.cassette.lookup(key)
+        if value is not None:
+            return self._load(value)
+        record = self.cassette.miss(key)
+        response = await self.inner.agenerate(prompt, **kwargs)
+        if record:
+            self.cassette.record(key, self._dump(response))
+        return response
+
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[ModelResponse]:
+        """逐条查找，只把未命中的提示作为一批发给真实后端"""
+        keys = [self._key("generate", p, kwargs) for p in prompts]
+        values = [self.cassette.lookup(k) for k in keys]
+        missing = [i for i, v in enumerate(values) if v is None]
+        record = [self.cassette.miss(keys[i]) for i in missing]
+        results = [None if v is None else self._load(v) for v in values]
+        if missing:
+            live = self.inner.generate_batch([prompts[i] for i in missing], **kwargs)
+            for i, should_record, response in zip(missing, record, live):
+                results[i] = response
+                if should_record:
+                    self.cassette.record(keys[i], self._dump(response))
+        return results
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[ModelResponse]:
+        key = self._key("stream", prompt, kwargs)
+        value = self.cassette.lookup(key)
+        if value is not None:
+            for chunk in value:
+                yield self._load(chunk)
+            return
+        record = self.cassette.miss(key)
+        chunks = []
+        async for chunk in self.inner.generate_stream(prompt, **kwargs):
+            chunks.append(self._dump(chunk))
+            yield chunk
+        if record:
+            self.cassette.record(key, chunks)
+
+
+class LangChainCassette(BaseCache):
+    """
+    LangChain 缓存接口上的录制/回放
+
+    挂在 ModelLoader.load_llm 返回的 LLM 上（替代响应缓存），Agent 代码无需改动。
+    """
+
+    def __init__(self, cassette: Cassette, backend: str, repo: str, parameters: Dict[str, Any]):
+        self.cassette = cassette
+        self.backend = backend
+        self.repo = repo
+        self.parameters = parameters
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return cassette_key(self.backend, self.repo, self.parameters, prompt, llm_string)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self._key(prompt, llm_string)
+        value = self.cassette.lookup(key)
+        if value is not None:
+            return LangChainResponseCache._loads(json.dumps(value))
+        # 未命中：fail 时在此抛出，否则返回 None 让 LangChain 走真实调用并回调 update
+        self.cassette.miss(key)
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = self._key(prompt, llm_string)
+        if self.cassette.mode == "record" or self.cassette.on_miss == "record":
+            self.cassette.record(key, json.loads(LangChainResponseCache._dumps(return_val)))
+
+    def clear(self, **kwargs: Any) -> None:
+        pass
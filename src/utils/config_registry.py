@@ -0,0 +1,106 @@
+"""
+配置注册表 - models.yaml 只解析一次
+
+解析结果校验为 Pydantic 模型并缓存；文件 mtime 变化（节流检查）或显式 reload() 时重新加载，
+热路径上只剩字典查找，同时仍支持运行中修改 active_model 热切换。
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import yaml
+from loguru import logger
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class ModelConfig(BaseModel):
+    """单个模型定义"""
+    model_config = ConfigDict(extra="allow", protected_namespaces=())
+
+    name: str
+    model_id: str
+    supported_backends: List[str] = Field(default_factory=list)
+    backend_repos: Dict[str, str] = Field(default_factory=dict)
+    resources: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+    capabilities: Dict[str, bool] = Field(default_factory=dict)
+
+
+class ModelsConfig(BaseModel):
+    """configs/models.yaml 整体结构（其余段落如 response_cache 原样保留）"""
+    model_config = ConfigDict(extra="allow")
+
+    active_model: str = "qwen2.5:3b"
+    active_backend: str = "ollama"
+    models: Dict[str, ModelConfig] = Field(default_factory=dict)
+
+
+class ConfigRegistry:
+    """
+    带失效检测的配置缓存
+
+    - check_interval: 两次 mtime 检查的最小间隔（秒），0 表示每次访问都检查
+    - 解析或校验失败时保留上一份有效配置并记录错误
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._raw: Optional[Dict[str, Any]] = None
+        self._config: Optional[ModelsConfig] = None
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _load(self) -> None:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f) or {}
+        config = ModelsConfig.model_validate(raw)
+        self._raw, self._config, self._mtime = raw, config, mtime
+        self.reloads += 1
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._config is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                if self._config is not None and os.stat(self.path).st_mtime == self._mtime:
+                    return
+                self._load()
+                if self.reloads > 1:
+                    logger.info(f"🔄 配置已重新加载: {self.path}")
+            except Exception as e:
+                if self._config is None:
+                    raise
+                logger.error(f"❌ 配置重新加载失败，继续使用上一份配置: {e}")
+
+    def reload(self) -> ModelsConfig:
+        """强制重新解析"""
+        with self._lock:
+            self._load()
+            self._last_check = time.monotonic()
+        return self._config
+
+    @property
+    def config(self) -> ModelsConfig:
+        """校验后的配置"""
+        self._refresh()
+        return self._config
+
+    @property
+    def raw(self) -> Dict[str, Any]:
+        """原始字典（共享对象，调用方不应修改）"""
+        self._refresh()
+        return self._raw
+
+
+_base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+# 全局单例（ModelLoader 与 BackendManager 共用）
+models_registry = ConfigRegistry(os.path.join(_base_path, "configs/models.yaml"))
@@ -0,0 +1,170 @@
+"""
+上下文窗口约束
+
+请求发出前用 TokenizerService 计数，超出 (上下文长度 - 生成预留) 时按策略处理，
+而不是把超长提示交给后端（Ollama 会在 num_ctx 处静默截断，白白消耗 GPU 时间）：
+- truncate_oldest: 丢弃最早的非 system 消息（保留最后一条）；仍超长时再压缩剩余消息
+- compress: 从最长的消息中间截去内容（保留首尾），不额外调用模型
+- reject: 抛出 ContextOverflowError
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from loguru import logger
+
+from src.utils.tokenizer import MESSAGE_OVERHEAD, TokenizerService, message_text, tokenizer_service
+
+DEFAULT_CONTEXT_LENGTH = 2048
+
+
+class ContextOverflowError(ValueError):
+    """提示超出模型上下文窗口（reject 策略）"""
+    pass
+
+
+def context_length(backend_config: Dict[str, Any], parameters: Optional[Dict[str, Any]] = None) -> int:
+    """模型的上下文长度：模型参数 num_ctx > 后端 num_ctx / max_model_len > 默认 2048"""
+    parameters = parameters or {}
+    if parameters.get("num_ctx"):
+        return int(parameters["num_ctx"])
+    for section, key in (("ollama_specific", "num_ctx"), ("vllm_specific", "max_model_len")):
+        value = backend_config.get(section, {}).get(key)
+        if value:
+            return int(value)
+    return DEFAULT_CONTEXT_LENGTH
+
+
+def max_output_tokens(backend_config: Dict[str, Any], parameters: Optional[Dict[str, Any]] = None) -> int:
+    """
+    模型单次生成的 token 上限（0 表示未配置）
+
+    vLLM（OpenAI 兼容接口）读取 max_tokens；Ollama 等其他后端只认 num_predict（-1 表示不限）。
+    """
+    parameters = parameters or {}
+    key = "max_tokens" if "vllm_specific" in backend_config else "num_predict"
+    return max(0, int(parameters.get(key) or 0))
+
+
+class ContextGuard:
+    """
+    单个模型的上下文窗口守卫
+
+    - context_length: 上下文长度（token）
+    - reserve_tokens: 为生成预留的 token 数（不超过上下文长度）
+    - policy: truncate_oldest / compress / reject
+    """
+
+    POLICIES = ("truncate_oldest", "compress", "reject")
+
+    def __init__(self, model: str, context_length: int = DEFAULT_CONTEXT_LENGTH, reserve_tokens: int = 512,
+                 policy: str = "truncate_oldest", tokenizer: TokenizerService = tokenizer_service):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的上下文策略: {policy}，可用: {self.POLICIES}")
+        self.model = model
+        self.context_length = context_length
+        self.reserve_tokens = max(0, min(reserve_tokens, context_length))
+        self.policy = policy
+        self.tokenizer = tokenizer
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "overflows": 0, "truncated": 0, "compressed": 0, "rejected": 0,
+                      "tokens_removed": 0}
+
+    @classmethod
+    def from_config(cls, model: str, config: Dict[str, Any], backend_config: Dict[str, Any],
+                    parameters: Optional[Dict[str, Any]] = None,
+                    tokenizer: TokenizerService = tokenizer_service) -> Optional["ContextGuard"]:
+        """
+        根据 models.yaml 的 context_window 段构建；enabled 为 false 时返回 None
+
+        生成预留取 reserve_tokens 与模型生成上限（max_tokens / num_predict）中的较大者：
+        vLLM 会拒绝 提示 + max_tokens 超过 max_model_len 的请求，只预留 reserve_tokens 不够。
+        """
+        if not config.get("enabled", True):
+            return None
+        return cls(
+            model,
+            context_length=context_length(backend_config, parameters),
+            reserve_tokens=max(config.get("reserve_tokens", 512), max_output_tokens(backend_config, parameters)),
+            policy=config.get("policy", "truncate_oldest"),
+            tokenizer=tokenizer,
+        )
+
+    @property
+    def budget(self) -> int:
+        """提示可用的 token 数"""
+        return self.context_length - self.reserve_tokens
+
+    def count(self, messages: Sequence[BaseMessage]) -> int:
+        return self.tokenizer.count_messages(messages, self.model)
+
+    def available(self, *texts: str) -> int:
+        """扣除 texts（如提示模板、问题）后剩余可用于其他内容的 token 数"""
+        used = sum(self.tokenizer.count(t, self.model) + MESSAGE_OVERHEAD for t in texts)
+        return max(0, self.budget - used)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def fit(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """按策略把消息约束在预算内；未超出时原样返回"""
+        self._count("checked")
+        total = self.count(messages)
+        if total <= self.budget:
+            return messages
+        self._count("overflows")
+        if self.policy == "reject":
+            self._count("rejected")
+            raise ContextOverflowError(
+                f"提示 {total} tokens 超出模型 {self.model} 的上下文预算 "
+                f"{self.budget} (= {self.context_length} - 预留 {self.reserve_tokens})"
+            )
+        fitted = list(messages)
+        if self.policy == "truncate_oldest":
+            fitted = self._drop_oldest(fitted)
+        if self.count(fitted) > self.budget:
+            fitted = self._compress(fitted)
+        removed = total - self.count(fitted)
+        self._count("tokens_removed", removed)
+        logger.warning(f"✂️ 提示超出上下文窗口 ({total} > {self.budget} tokens)，按 {self.policy} 处理，移除 {removed} tokens")
+        return fitted
+
+    def _drop_oldest(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        dropped = 0
+        while self.count(messages) > self.budget:
+            index = next((i for i, m in enumerate(messages[:-1]) if not isinstance(m, SystemMessage)), None)
+            if index is None:
+                break
+            del messages[index]
+            dropped += 1
+        if dropped:
+            self._count("truncated")
+        return messages
+
+    def _compress(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """反复把最长的消息从中间截短，直到总量不超过预算"""
+        sizes = [self.tokenizer.count(message_text(m), self.model) for m in messages]
+        excess = self.count(messages) - self.budget
+        while excess > 0:
+            longest = max(range(len(messages)), key=sizes.__getitem__)
+            if sizes[longest] == 0:
+                break
+            target = max(0, sizes[longest] - excess)
+            text = self.tokenizer.truncate(message_text(messages[longest]), target, self.model, keep="middle")
+            messages[longest] = messages[longest].model_copy(update={"content": text})
+            new_size = self.tokenizer.count(text, self.model)
+            # 省略号本身也占 token，截短没有进展时直接清空
+            if new_size >= sizes[longest]:
+                messages[longest] = messages[longest].model_copy(update={"content": ""})
+                new_size = 0
+            excess -= sizes[longest] - new_size
+            sizes[longest] = new_size
+        self._count("compressed")
+        return messages
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "policy": self.policy, "context_length": self.context_length,
+                    "budget": self.budget}
@@ -0,0 +1,80 @@
+"""
+文本向量化（Embedder）
+
+所有 Embedder 返回 float32 矩阵（每行一个文本），供 DenseIndex 使用：
+- HashingEmbedder: 特征哈希，确定性、无模型、离线可用（词面相似度，适合测试与演示）
+- LangChainEmbedder: 包装任意 LangChain Embeddings（如 OllamaEmbeddings、OpenAIEmbeddings）
+"""
+
+import hashlib
+from typing import Any, List, Sequence
+
+import numpy as np
+
+from src.utils.bm25 import analyze
+
+
+class Embedder:
+    """Embedder 基类"""
+
+    dim: int = 0
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        return self.embed_documents(texts)
+
+
+class HashingEmbedder(Embedder):
+    """
+    特征哈希 Embedder
+
+    每个索引词（与 BM25 同一分词）按稳定哈希映射到 dim 维中的一维并带 ±1 符号，
+    结果做 L2 归一化。同一文本在任何进程、任何机器上得到相同向量。
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self._cache: dict = {}
+
+    def _slot(self, term: str):
+        slot = self._cache.get(term)
+        if slot is None:
+            digest = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+            slot = self._cache[term] = (digest % self.dim, 1.0 if digest >> 63 else -1.0)
+        return slot
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in analyze(text):
+                column, sign = self._slot(term)
+                matrix[row, column] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+class LangChainEmbedder(Embedder):
+    """包装 LangChain Embeddings 对象"""
+
+    def __init__(self, embeddings: Any):
+        self.embeddings = embeddings
+        self.dim = 0
+
+    def _matrix(self, vectors: List[List[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        self.dim = matrix.shape[1] if matrix.ndim == 2 else self.dim
+        return matrix
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        return self._matrix(self.embeddings.embed_documents(list(texts)))
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._matrix([self.embeddings.embed_query(text)])[0]
+
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        return self._matrix([self.embeddings.embed_query(t) for t in texts])
@@ -0,0 +1,199 @@
+"""
+后端健康监控
+
+后台线程按固定间隔并发探测后端，缓存结果（时间戳、延迟直方图），
+使 list_backends / 状态面板 / verify_system.py 只读缓存，不会因为某个主机宕机而阻塞。
+可通过 targets 限定每轮探测的后端（BackendManager 只探测已构建的后端与当前激活后端，不为探测而构建实例）。
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+from loguru import logger
+
+from src.backends.base import ModelBackend
+
+# 延迟直方图桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+
+@dataclass
+class HealthStatus:
+    """单个后端的健康状态"""
+    available: Optional[bool] = None  # None 表示尚未完成探测
+    checked_at: Optional[float] = None
+    latency: Optional[float] = None
+    error: Optional[str] = None
+    consecutive_failures: int = 0
+    probes: int = 0
+    latency_histogram: Dict[str, int] = field(
+        default_factory=lambda: {f"le_{b}": 0 for b in LATENCY_BUCKETS}
+    )
+
+    def observe(self, latency: float) -> None:
+        for bound in LATENCY_BUCKETS:
+            if latency <= bound:
+                self.latency_histogram[f"le_{bound}"] += 1
+                break
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "checked_at": self.checked_at,
+            "latency": self.latency,
+            "error": self.error,
+            "consecutive_failures": self.consecutive_failures,
+            "probes": self.probes,
+            "latency_histogram": dict(self.latency_histogram),
+        }
+
+
+class HealthMonitor:
+    """
+    健康监控器
+
+    - interval: 探测间隔（秒）
+    - probe_timeout: 单轮探测的等待上限，超时的后端记为不可用，且在其探测返回前不会重复发起
+    - targets: 返回本轮需要探测的后端名（默认全部）；未探测的后端状态保持 available=None
+    - on_available: 后端由未知/不可用变为可用时在探测线程中回调（参数为后端名）
+    """
+
+    def __init__(self, backends: Mapping[str, ModelBackend], interval: float = 15.0,
+                 probe_timeout: float = 3.0, targets: Optional[Callable[[], Iterable[str]]] = None,
+                 on_available: Optional[Callable[[str], None]] = None):
+        self._backends = backends
+        self._targets = targets
+        self._on_available = on_available
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self._status: Dict[str, HealthStatus] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(backends)) * 2,
+                                            thread_name_prefix="health-probe")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, backends: Mapping[str, ModelBackend], config: Dict[str, Any],
+                    targets: Optional[Callable[[], Iterable[str]]] = None,
+                    on_available: Optional[Callable[[str], None]] = None) -> "HealthMonitor":
+        """根据 models.yaml 的 health_monitor 段构建"""
+        return cls(
+            backends,
+            interval=config.get("interval", 15.0),
+            probe_timeout=config.get("probe_timeout", 3.0),
+            targets=targets,
+            on_available=on_available,
+        )
+
+    def start(self) -> None:
+        """启动后台探测（幂等）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval):
+                return
+
+    def targets(self) -> List[str]:
+        """本轮需要探测的后端"""
+        if self._targets is None:
+            return list(self._backends)
+        selected = set(self._targets())
+        return [name for name in self._backends if name in selected]
+
+    def refresh(self, wait_for_results: bool = True) -> Dict[str, HealthStatus]:
+        """并发探测 targets 中的后端；wait_for_results 为 False 时只发起探测立即返回"""
+        names = self.targets()
+        futures, running = {}, []
+        with self._lock:
+            for name in names:
+                if name in self._inflight and not self._inflight[name].done():
+                    # 尚未返回的探测（如切换后端时发起的）：一并等待，但不重复发起
+                    running.append(self._inflight[name])
+                    continue
+                # 探测状态：超时已计为一次失败后，迟到的结果只更新状态，不再计数
+                probe = {"timed_out": False, "recorded": False}
+                future = self._executor.submit(self._probe, name, probe)
+                self._inflight[name] = future
+                futures[future] = (name, probe)
+        if wait_for_results and (futures or running):
+            _, pending = wait([*futures, *running], timeout=self.probe_timeout)
+            for future in pending:
+                if future in futures:
+                    name, probe = futures[future]
+                    self._record(name, False, self.probe_timeout, "probe timeout", probe, timed_out=True)
+        return self.snapshot_status()
+
+    def _probe(self, name: str, probe: Optional[Dict[str, bool]] = None) -> None:
+        start = time.perf_counter()
+        try:
+            # 激活后端可能尚未构建，在探测线程内取实例，构建耗时同样不阻塞调用方
+            ok, error = self._backends[name].is_available(), None
+        except Exception as e:
+            ok, error = False, str(e)
+        self._record(name, ok, time.perf_counter() - start, error, probe)
+
+    def _record(self, name: str, ok: bool, latency: float, error: Optional[str],
+                probe: Optional[Dict[str, bool]] = None, timed_out: bool = False) -> None:
+        with self._lock:
+            late = False
+            if probe is not None:
+                if timed_out:
+                    if probe["recorded"]:
+                        # 探测恰好在等待超时后完成，结果已记录
+                        return
+                    probe["timed_out"] = True
+                else:
+                    late = probe["timed_out"]
+                probe["recorded"] = True
+            status = self._status.setdefault(name, HealthStatus())
+            was_available = status.available
+            status.available = ok
+            status.checked_at = time.time()
+            status.latency = latency
+            status.error = error
+            if late:
+                # 超时的探测迟到返回：只替换状态（已按超时计过一次）
+                if ok:
+                    status.consecutive_failures = 0
+            else:
+                status.probes += 1
+                status.consecutive_failures = 0 if ok else status.consecutive_failures + 1
+                status.observe(latency)
+        if was_available is not None and was_available != ok:
+            logger.info(f"{'✅' if ok else '⚠️'} 后端 {name} 状态变化: {'可用' if ok else '不可用'}")
+        if ok and not was_available and self._on_available is not None:
+            try:
+                self._on_available(name)
+            except Exception as e:
+                logger.warning(f"⚠️ 后端 {name} 可用回调失败: {e}")
+
+    def get_status(self, name: str) -> HealthStatus:
+        """立即返回缓存状态（未探测过则 available 为 None）"""
+        with self._lock:
+            return self._status.get(name, HealthStatus())
+
+    def snapshot_status(self) -> Dict[str, HealthStatus]:
+        with self._lock:
+            return {name: self._status.get(name, HealthStatus()) for name in self._backends}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """所有后端状态的字典形式（供状态面板使用）"""
+        return {name: status.to_dict() for name, status in self.snapshot_status().items()}
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
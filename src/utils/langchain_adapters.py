@@ -0,0 +1,289 @@
+"""
+LangChain 适配层
+
+Agent 直接调用 ModelLoader.load_llm 返回的 LangChain 聊天模型，不经过 ModelBackend，
+后端层的增强（显存驻留、限流、准入控制、请求合并）与上下文窗口约束需要在这里为聊天模型类补上同样的钩子；
+没有现成 LangChain 集成的后端（如 mock）则通过 BackendChatModel 直接包装 ModelBackend。
+"""
+
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, Field
+
+from src.backends.admission import AdmissionController
+from src.backends.rate_limit import RateLimiter, usage_tokens
+from src.backends.singleflight import SingleFlight
+
+_subclasses: Dict[Tuple[str, type, int], type] = {}
+
+
+def _finalize(prefix: str, base_cls: Type, cls: Type, key: Tuple[str, type, int]) -> Type:
+    # 基类未实现流式时保持默认实现，LangChain 据此判断是否退化为整段生成
+    for name in ("_stream", "_astream"):
+        if name in cls.__dict__ and getattr(base_cls, name) is getattr(BaseChatModel, name):
+            delattr(cls, name)
+    cls.__name__ = f"{prefix}{base_cls.__name__}"
+    cls.__qualname__ = cls.__name__
+    _subclasses[key] = cls
+    return cls
+
+
+def _priority(run_manager: Any) -> int:
+    """优先级通过调用配置传入：llm.invoke(..., config={"metadata": {"priority": -1}})"""
+    metadata = getattr(run_manager, "metadata", None) or {}
+    return metadata.get("priority", 0)
+
+
+def _tenant(run_manager: Any) -> Optional[str]:
+    """租户通过调用配置传入：llm.invoke(..., config={"metadata": {"tenant": "team-a"}})"""
+    metadata = getattr(run_manager, "metadata", None) or {}
+    return metadata.get("tenant")
+
+
+def _model_name(llm: Any) -> str:
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or "default"
+
+
+def rate_limited_chat_model(base_cls: Type, limiter: RateLimiter) -> Type:
+    """返回 base_cls 的子类，调用前按模型与租户等待令牌，结束后按 usage_metadata 扣除 token"""
+    key = ("rate_limited", base_cls, id(limiter))
+    if key in _subclasses:
+        return _subclasses[key]
+
+    def result_tokens(result: ChatResult) -> int:
+        return sum(usage_tokens(getattr(g.message, "usage_metadata", None)) for g in result.generations)
+
+    def stream_tokens(messages, model: str, chunks: int) -> int:
+        # 流式分片不带 usage_metadata：提示 token 估算 + 分片数
+        return limiter.prompt_tokens(render_messages(messages), model) + chunks
+
+    class RateLimitedChatModel(base_cls):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            model, tenant = _model_name(self), _tenant(run_manager)
+            limiter.acquire(model, tenant)
+            result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            limiter.record(model, tenant, result_tokens(result))
+            return result
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            model, tenant = _model_name(self), _tenant(run_manager)
+            await limiter.aacquire(model, tenant)
+            result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            limiter.record(model, tenant, result_tokens(result))
+            return result
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            model, tenant = _model_name(self), _tenant(run_manager)
+            limiter.acquire(model, tenant)
+            chunks = tokens = 0
+            try:
+                for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    chunks += 1
+                    tokens += usage_tokens(getattr(chunk.message, "usage_metadata", None))
+                    yield chunk
+            finally:
+                limiter.record(model, tenant, tokens or stream_tokens(messages, model, chunks))
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            model, tenant = _model_name(self), _tenant(run_manager)
+            await limiter.aacquire(model, tenant)
+            chunks = tokens = 0
+            try:
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    chunks += 1
+                    tokens += usage_tokens(getattr(chunk.message, "usage_metadata", None))
+                    yield chunk
+            finally:
+                limiter.record(model, tenant, tokens or stream_tokens(messages, model, chunks))
+
+    return _finalize("RateLimited", base_cls, RateLimitedChatModel, key)
+
+
+def admitted_chat_model(base_cls: Type, controller: AdmissionController) -> Type:
+    """返回 base_cls 的子类，其同步/异步/流式生成都先经过 controller 申请名额"""
+    key = ("admitted", base_cls, id(controller))
+    if key in _subclasses:
+        return _subclasses[key]
+
+    class AdmittedChatModel(base_cls):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            with controller.slot(_priority(run_manager)):
+                return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            async with controller.aslot(_priority(run_manager)):
+                return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            with controller.slot(_priority(run_manager)):
+                yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            async with controller.aslot(_priority(run_manager)):
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    yield chunk
+
+    return _finalize("Admitted", base_cls, AdmittedChatModel, key)
+
+
+def coalesced_chat_model(base_cls: Type, group: SingleFlight) -> Type:
+    """返回 base_cls 的子类，键相同（模型配置、消息、stop）的并发调用合并为一次请求
+
+    同步流式（_stream）不合并；异步流式的分片广播给所有调用方。
+    """
+    key = ("coalesced", base_cls, id(group))
+    if key in _subclasses:
+        return _subclasses[key]
+
+    def flight_key(llm, messages, stop, kwargs) -> str:
+        return json.dumps(
+            [llm._get_llm_string(stop=stop, **kwargs), [message_to_dict(m) for m in messages]],
+            sort_keys=True, default=str,
+        )
+
+    class CoalescedChatModel(base_cls):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            result = group.do(
+                flight_key(self, messages, stop, kwargs),
+                lambda: super(CoalescedChatModel, self)._generate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs),
+            )
+            # LangChain 会在返回的消息上补写元数据，各调用方拿到独立副本
+            return result.model_copy(deep=True)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            result = await group.ado(
+                flight_key(self, messages, stop, kwargs),
+                lambda: super(CoalescedChatModel, self)._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs),
+            )
+            return result.model_copy(deep=True)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            stream = group.stream(
+                flight_key(self, messages, stop, kwargs),
+                # 只有发起者会调用：底层流的回调（如 on_llm_new_token）上报给发起者的 run_manager
+                lambda: super(CoalescedChatModel, self)._astream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs),
+            )
+            async for chunk in stream:
+                yield chunk.model_copy(deep=True)
+
+    return _finalize("Coalesced", base_cls, CoalescedChatModel, key)
+
+
+def resident_chat_model(base_cls: Type, residency) -> Type:
+    """返回 base_cls 的子类，每次调用前向 ResidencyManager 记录模型使用（维护LRU顺序）"""
+    key = ("resident", base_cls, id(residency))
+    if key in _subclasses:
+        return _subclasses[key]
+
+    class ResidentChatModel(base_cls):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            residency.touch(self.model)
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            residency.touch(self.model)
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            residency.touch(self.model)
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            residency.touch(self.model)
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+
+    return _finalize("Resident", base_cls, ResidentChatModel, key)
+
+
+def context_guarded_chat_model(base_cls: Type, guard) -> Type:
+    """返回 base_cls 的子类，调用前用 ContextGuard 把消息约束在上下文窗口内"""
+    key = ("context_guarded", base_cls, id(guard))
+    if key in _subclasses:
+        return _subclasses[key]
+
+    class ContextGuardedChatModel(base_cls):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            return super()._generate(guard.fit(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            return await super()._agenerate(guard.fit(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            yield from super()._stream(guard.fit(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            async for chunk in super()._astream(guard.fit(messages), stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+
+    return _finalize("ContextGuarded", base_cls, ContextGuardedChatModel, key)
+
+
+def render_messages(messages: List[BaseMessage]) -> str:
+    """把消息列表渲染为单个提示（ModelBackend 接口只接受字符串提示）"""
+    if len(messages) == 1:
+        return str(messages[0].content)
+    return "\n\n".join(f"{m.type}: {m.content}" for m in messages)
+
+
+class BackendChatModel(BaseChatModel):
+    """把任意 ModelBackend 包装为 LangChain 聊天模型"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    backend: Any
+    model: str
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "backend-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, **self.parameters}
+
+    def _backend_kwargs(self, stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        parameters = {**self.parameters, **kwargs}
+        if stop:
+            parameters["stop"] = stop
+        return {"model": self.model, "parameters": parameters}
+
+    @staticmethod
+    def _to_result(response) -> ChatResult:
+        usage = response.usage or {}
+        message = AIMessage(
+            content=response.content,
+            usage_metadata={
+                "input_tokens": usage.get("prompt_tokens", 0),
+                "output_tokens": usage.get("completion_tokens", 0),
+                "total_tokens": usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0),
+            },
+            response_metadata={
+                "latency": response.latency,
+                "time_to_first_token": response.time_to_first_token,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        response = self.backend.generate(render_messages(messages), **self._backend_kwargs(stop, kwargs))
+        return self._to_result(response)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        response = await self.backend.agenerate(render_messages(messages), **self._backend_kwargs(stop, kwargs))
+        return self._to_result(response)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        stream = self.backend.generate_stream(render_messages(messages), **self._backend_kwargs(stop, kwargs))
+        async for response in stream:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=response.content))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(response.content, chunk=chunk)
+            yield chunk
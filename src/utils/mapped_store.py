@@ -0,0 +1,390 @@
+"""
+内存映射的向量存储文件格式
+
+目录结构：
+- CURRENT          当前快照的代号（指向 snapshots/<代号>/）
+- snapshots/<代号>/ 一代快照：
+- manifest.json    版本、文档数、向量维度
+- embeddings.f32   归一化后的 float32 向量矩阵（行优先，无文件头），用 np.memmap 只读映射
+- documents.jsonl  每行一个文档 {"id", "content", "metadata"}
+- offsets.u64      documents.jsonl 中每行的起始偏移（n + 1 个 uint64），按行号随机读取
+- ids.json         按行号排列的文档ID（首次按ID访问时才读取）
+- wal.jsonl        快照之后的追加日志（add / delete），启动时重放，checkpoint 后清空
+
+打开快照只做 mmap，不复制数据：冷启动耗时与语料规模无关；多个进程只读映射同一组文件时共享操作系统页缓存。
+每一代快照写在独立目录中，写完后用 os.replace 原子替换 CURRENT 切换过去：任何时刻崩溃，
+CURRENT 都指向一代完整的快照（读者也只会看到某一代的全部文件）；未切换的暂存目录在下次写入时清理。
+"""
+
+import json
+import mmap
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import AbstractSet, Any, Callable, Dict, Iterable, Iterator, List, MutableMapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.utils.vector_index import DenseIndex, normalize, top_k_rows
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+EMBEDDINGS = "embeddings.f32"
+DOCUMENTS = "documents.jsonl"
+OFFSETS = "offsets.u64"
+IDS = "ids.json"
+WAL = "wal.jsonl"
+CURRENT = "CURRENT"
+SNAPSHOTS = "snapshots"
+STAGING = ".staging"
+
+
+def write_snapshot(path: Path, records: Iterable[Dict[str, Any]], dim: Optional[int]) -> int:
+    """写入新一代快照并切换过去，返回文档数"""
+    count = stage_snapshot(path, records, dim)
+    commit_snapshot(path)
+    return count
+
+
+def current_generation(path: Path) -> Optional[str]:
+    """CURRENT 指向的快照代号（尚无快照时为 None）"""
+    try:
+        return (Path(path) / CURRENT).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def stage_snapshot(path: Path, records: Iterable[Dict[str, Any]], dim: Optional[int]) -> int:
+    """
+    把快照写到暂存目录（此前崩溃遗留的暂存目录会被清除），records 为 {"id", "content", "metadata", "embedding"}
+    （embedding 可为 None，对应零向量，不会被稠密检索命中）。返回文档数。
+    """
+    tmp = Path(path) / SNAPSHOTS / STAGING
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    ids: List[str] = []
+    offsets = [0]
+    vectors: List[np.ndarray] = []
+    with open(tmp / DOCUMENTS, "wb") as f:
+        for record in records:
+            line = json.dumps({"id": record["id"], "content": record["content"],
+                               "metadata": record.get("metadata") or {}}, ensure_ascii=False).encode() + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+            ids.append(record["id"])
+            embedding = record.get("embedding")
+            if embedding is not None and dim is None:
+                dim = len(embedding)
+            vectors.append(embedding)
+    dim = dim or 0
+    matrix = np.zeros((len(ids), dim), dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        if vector is not None:
+            matrix[row] = vector
+    normalize(matrix).tofile(tmp / EMBEDDINGS)
+    np.asarray(offsets, dtype=np.uint64).tofile(tmp / OFFSETS)
+    (tmp / IDS).write_text(json.dumps(ids, ensure_ascii=False), encoding="utf-8")
+    (tmp / MANIFEST).write_text(json.dumps({"version": FORMAT_VERSION, "count": len(ids), "dim": dim}),
+                                encoding="utf-8")
+    return len(ids)
+
+
+def commit_snapshot(path: Path) -> str:
+    """把暂存目录提升为新一代快照并原子切换 CURRENT，随后清理旧的各代；返回新代号"""
+    path = Path(path)
+    snapshots = path / SNAPSHOTS
+    existing = [int(p.name) for p in snapshots.iterdir() if p.name.isdigit()]
+    generation = f"{max(existing, default=0) + 1:08d}"
+    os.replace(snapshots / STAGING, snapshots / generation)
+    pointer = path / (CURRENT + ".tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, path / CURRENT)
+    # 其他进程可能仍映射着旧的一代：POSIX 上删除不影响已有映射，Windows 上删除失败则留到下次
+    for old in snapshots.iterdir():
+        if old.name.isdigit() and old.name != generation:
+            shutil.rmtree(old, ignore_errors=True)
+    return generation
+
+
+class MappedSnapshot:
+    """只读映射的快照"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.generation = current_generation(self.path)
+        if self.generation is None:
+            raise FileNotFoundError(f"{self.path} 中没有向量存储快照")
+        self.directory = self.path / SNAPSHOTS / self.generation
+        manifest = json.loads((self.directory / MANIFEST).read_text(encoding="utf-8"))
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的向量存储格式版本: {manifest.get('version')}")
+        self.count = manifest["count"]
+        self.dim = manifest["dim"]
+        self._ids: Optional[List[str]] = None
+        self._rows: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+        if self.count == 0:
+            self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.uint64)
+            self._file, self._documents = None, b""
+            return
+        self.embeddings = np.memmap(self.directory / EMBEDDINGS, dtype=np.float32, mode="r",
+                                    shape=(self.count, self.dim)) if self.dim else \
+            np.zeros((self.count, 0), dtype=np.float32)
+        self.offsets = np.memmap(self.directory / OFFSETS, dtype=np.uint64, mode="r")
+        self._file = open(self.directory / DOCUMENTS, "rb")
+        self._documents = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        return current_generation(path) is not None
+
+    def record(self, row: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._documents[start:end])
+
+    def records(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for row in range(self.count):
+            yield row, self.record(row)
+
+    @property
+    def ids(self) -> List[str]:
+        """行号 -> 文档ID（首次访问时读取 ids.json）"""
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = json.loads((self.directory / IDS).read_text(encoding="utf-8")) if self.count else []
+        return self._ids
+
+    @property
+    def rows(self) -> Dict[str, int]:
+        if self._rows is None:
+            ids = self.ids
+            with self._lock:
+                if self._rows is None:
+                    self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        return self._rows
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._documents.close()
+            self._file.close()
+            self._file = None
+        # memmap 随引用释放
+        self.embeddings = self.offsets = None
+
+
+class MappedDocuments(MutableMapping):
+    """
+    文档ID -> 文档 的映射：快照中的文档按需从映射文件解析（factory 把记录转为文档对象），
+    新写入的文档保存在内存中；快照中被删除或覆盖的ID记入 deleted
+    """
+
+    def __init__(self, snapshot: MappedSnapshot, factory: Callable[[Dict[str, Any]], Any]):
+        self.snapshot = snapshot
+        self.factory = factory
+        self.overlay: Dict[str, Any] = {}
+        self.deleted: Set[str] = set()
+
+    def _in_snapshot(self, doc_id: str) -> bool:
+        return doc_id not in self.deleted and doc_id in self.snapshot.rows
+
+    def __getitem__(self, doc_id: str) -> Any:
+        if doc_id in self.overlay:
+            return self.overlay[doc_id]
+        if not self._in_snapshot(doc_id):
+            raise KeyError(doc_id)
+        return self.factory(self.snapshot.record(self.snapshot.rows[doc_id]))
+
+    def __setitem__(self, doc_id: str, doc: Any) -> None:
+        if self._in_snapshot(doc_id):
+            self.deleted.add(doc_id)
+        self.overlay[doc_id] = doc
+
+    def __delitem__(self, doc_id: str) -> None:
+        if doc_id in self.overlay:
+            del self.overlay[doc_id]
+        elif self._in_snapshot(doc_id):
+            self.deleted.add(doc_id)
+        else:
+            raise KeyError(doc_id)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self.overlay or self._in_snapshot(doc_id)
+
+    def __iter__(self) -> Iterator[str]:
+        for doc_id in self.snapshot.ids:
+            if doc_id not in self.deleted:
+                yield doc_id
+        yield from list(self.overlay)
+
+    def __len__(self) -> int:
+        return self.snapshot.count - len(self.deleted) + len(self.overlay)
+
+    def values(self) -> Iterator[Any]:
+        """顺序读取快照（不构建ID索引），再返回内存中的文档"""
+        for _, record in self.snapshot.records():
+            if record["id"] not in self.deleted:
+                yield self.factory(record)
+        yield from list(self.overlay.values())
+
+
+class WriteAheadLog:
+    """追加写日志：每行一个操作 {"op": "add", "doc": {...}} / {"op": "delete", "id": ...}"""
+
+    def __init__(self, path: Path, fsync: bool = False):
+        self.path = Path(path)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程崩溃时最后一行可能只写了一半
+                    break
+
+    def append(self, ops: Sequence[Dict[str, Any]]) -> None:
+        if not ops:
+            return
+        data = b"".join(json.dumps(op, ensure_ascii=False).encode() + b"\n" for op in ops)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def truncate(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path.unlink(missing_ok=True)
+
+    def size(self) -> int:
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class MappedDenseIndex:
+    """
+    快照矩阵（只读映射）+ 内存增量 DenseIndex
+
+    快照中被删除或被覆盖的行记入墓碑位图；查询时两部分分别取前 k 再合并。
+    接口与 DenseIndex 一致。
+    """
+
+    def __init__(self, snapshot: MappedSnapshot):
+        self.snapshot = snapshot
+        self.overlay = DenseIndex(dim=snapshot.dim or None)
+        self.deleted = np.zeros(snapshot.count, dtype=bool)
+        self._deleted_count = 0
+        self._lock = threading.RLock()
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.overlay.dim
+
+    def __len__(self) -> int:
+        return self.snapshot.count - self._deleted_count + len(self.overlay)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.overlay or self._base_row(doc_id) is not None
+
+    def _base_row(self, doc_id: str) -> Optional[int]:
+        row = self.snapshot.rows.get(doc_id)
+        return None if row is None or self.deleted[row] else row
+
+    def _delete_base(self, doc_id: str) -> bool:
+        row = self._base_row(doc_id)
+        if row is None:
+            return False
+        self.deleted[row] = True
+        self._deleted_count += 1
+        return True
+
+    def add_batch(self, doc_ids: Sequence[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                self._delete_base(doc_id)
+            self.overlay.add_batch(doc_ids, vectors)
+
+    def add(self, doc_id: str, vector: Sequence[float]) -> None:
+        self.add_batch([doc_id], np.asarray(vector, dtype=np.float32)[None, :])
+
+    def get(self, doc_id: str) -> Optional[np.ndarray]:
+        vector = self.overlay.get(doc_id)
+        if vector is not None:
+            return vector
+        row = self._base_row(doc_id)
+        return None if row is None else np.array(self.snapshot.embeddings[row])
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            return self.overlay.remove(doc_id) | self._delete_base(doc_id)
+
+    def search(self, query: Sequence[float], top_k: int = 5,
+               candidates: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        return self.search_batch(np.asarray(query, dtype=np.float32)[None, :], top_k, candidates)[0]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5,
+                     candidates: Optional[AbstractSet[str]] = None) -> List[List[Tuple[str, float]]]:
+        queries = normalize(queries)
+        with self._lock:
+            results = self.overlay.search_batch(queries, top_k, candidates)
+            if self.snapshot.count == 0 or not self.snapshot.dim:
+                return results
+            if candidates is None:
+                scores = queries @ self.snapshot.embeddings.T
+                if self._deleted_count:
+                    scores[:, self.deleted] = -np.inf
+                columns, selected = top_k_rows(scores, top_k)
+            else:
+                # 只读取候选行（按行号排序，顺序访问映射页）
+                rows = np.sort(np.fromiter(
+                    (r for r in map(self._base_row, candidates) if r is not None), dtype=np.int64))
+                if len(rows) == 0:
+                    return results
+                columns, selected = top_k_rows(queries @ self.snapshot.embeddings[rows].T, top_k)
+                columns = rows[columns]
+            ids = self.snapshot.ids
+            merged = []
+            for overlay_hits, row_columns, row_scores in zip(results, columns, selected):
+                base_hits = [(ids[c], float(s)) for c, s in zip(row_columns, row_scores) if s != -np.inf]
+                merged.append(sorted(overlay_hits + base_hits, key=lambda hit: -hit[1])[:top_k])
+            return merged
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        """所有有效 (文档ID, 向量)，用于写入新快照"""
+        ids = self.snapshot.ids
+        for row in range(self.snapshot.count):
+            if not self.deleted[row]:
+                yield ids[row], self.snapshot.embeddings[row]
+        for doc_id in self.overlay.ids:
+            yield doc_id, self.overlay.get(doc_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "vectors": len(self),
+            "dim": self.dim,
+            "mapped_vectors": self.snapshot.count,
+            "mapped_bytes": self.snapshot.count * (self.snapshot.dim or 0) * 4,
+            "deleted_mapped": self._deleted_count,
+            "overlay_vectors": len(self.overlay),
+        }
@@ -0,0 +1,98 @@
+"""
+元数据二级索引
+
+对指定字段维护 字段 -> 值 -> 文档ID集合 的倒排表，带过滤条件的检索先求候选集合（按集合从小到大求交），
+再只对候选文档打分，而不是对全量语料打分后再过滤（那样既浪费又可能凑不满 k 个结果）。
+未建索引的字段、不可哈希的值以及 None（缺少该字段的文档也算匹配，倒排表里没有它们）作为剩余条件，
+在候选集合上逐个检查。
+"""
+
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Set, Tuple
+
+DEFAULT_FIELDS = ("source", "topic", "chunk_index")
+
+
+def matches(metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """元数据是否满足全部等值条件"""
+    return all(metadata.get(k) == v for k, v in filters.items())
+
+
+class MetadataIndex:
+    """元数据字段的等值倒排索引"""
+
+    def __init__(self, fields: Iterable[str] = DEFAULT_FIELDS):
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[Hashable, Set[str]]] = {f: {} for f in self.fields}
+        # 正排：删除时据此清理倒排表
+        self.doc_values: Dict[str, Dict[str, Hashable]] = {}
+        self._lock = threading.RLock()
+
+    def add(self, doc_id: str, metadata: Dict[str, Any]) -> None:
+        """写入文档（已存在时先删除旧值）"""
+        values = {f: metadata[f] for f in self.fields if f in metadata and isinstance(metadata[f], Hashable)}
+        with self._lock:
+            self._remove(doc_id)
+            for field, value in values.items():
+                self.postings[field].setdefault(value, set()).add(doc_id)
+            self.doc_values[doc_id] = values
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> bool:
+        values = self.doc_values.pop(doc_id, None)
+        if values is None:
+            return False
+        for field, value in values.items():
+            ids = self.postings[field][value]
+            ids.discard(doc_id)
+            if not ids:
+                del self.postings[field][value]
+        return True
+
+    def split(self, filters: Dict[str, Any]) -> Tuple[List[Tuple[str, Hashable]], Dict[str, Any]]:
+        """把过滤条件拆成 (可用索引的条件, 剩余条件)"""
+        indexed, residual = [], {}
+        for field, value in filters.items():
+            if field in self.postings and value is not None and isinstance(value, Hashable):
+                indexed.append((field, value))
+            else:
+                residual[field] = value
+        return indexed, residual
+
+    def lookup(self, conditions: List[Tuple[str, Hashable]]) -> Set[str]:
+        """满足全部索引条件的文档ID（从最小的集合开始求交）"""
+        with self._lock:
+            sets = sorted((self.postings[f].get(v, set()) for f, v in conditions), key=len)
+            if not sets:
+                return set()
+            result = set(sets[0])
+            for ids in sets[1:]:
+                if not result:
+                    break
+                result &= ids
+            return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self.doc_values),
+                "fields": {f: len(values) for f, values in self.postings.items()},
+            }
+
+
+def filter_candidates(index: MetadataIndex, filters: Dict[str, Any], documents: Any) -> Set[str]:
+    """
+    过滤条件对应的候选文档ID集合
+
+    documents 为 文档ID -> 文档 的映射；只有剩余条件时需要顺序检查全部文档的元数据（不打分）。
+    """
+    indexed, residual = index.split(filters)
+    if indexed:
+        candidates = index.lookup(indexed)
+        if residual:
+            candidates = {i for i in candidates if matches(documents[i].metadata, residual)}
+        return candidates
+    return {doc.id for doc in documents.values() if matches(doc.metadata, residual)}
@@ -1,38 +1,56 @@
 from src.utils.backend_manager import backend_manager
-import yaml
-import os
-from typing import Optional, Any, Dict
+from src.utils.config_registry import models_registry, ConfigRegistry, ModelConfig
+from typing import Optional, Any, Dict, List, Set, Tuple
+from loguru import logger
+from concurrent.futures import Future
+import json
+import threading
+import time
 
 class ModelLoader:
     """模型加载器 - 通过后端抽象层加载模型"""
     
-    def __init__(self):
+    def __init__(self, registry: ConfigRegistry = models_registry):
         # We access the backend manager dynamically to get the current state
-        pass
+        # 配置由注册表缓存，文件修改后自动失效
+        self.registry = registry
+        # LLM实例池：(后端, 仓库, 参数) -> 共享的LLM客户端
+        self._llm_pool: Dict[Tuple[str, str, str], Any] = {}
+        # 本进程内已完成拉取/校验的 (后端, 仓库)
+        self._verified: Set[Tuple[str, str]] = set()
+        # 正在拉取/校验的 (后端, 仓库) -> 共享结果
+        self._verifying: Dict[Tuple[str, str], Future] = {}
+        self._pool_lock = threading.RLock()
+        # 上下文窗口守卫：(后端, 仓库) -> ContextGuard
+        self._guards: Dict[Tuple[str, str], Any] = {}
+        self.pool_stats = {"hits": 0, "misses": 0, "verifications": 0}
     
     def get_full_config(self) -> Dict[str, Any]:
-        base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        config_path = os.path.join(base_path, "configs/models.yaml")
-        
-        with open(config_path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+        """models.yaml 原始内容（缓存的共享字典，不要修改）"""
+        return self.registry.raw
 
-    def get_model_config(self, model_id: str) -> Any:
-        full_config = self.get_full_config()
+    def get_model_config(self, model_id: str) -> ModelConfig:
+        models = self.registry.config.models
             
-        if model_id not in full_config.get("models", {}):
+        if model_id not in models:
             raise ValueError(f"Model {model_id} not found in configuration.")
             
-        return full_config["models"][model_id]
+        return models[model_id]
 
     @property
     def active_model_id(self) -> str:
         """获取当前激活的模型ID"""
-        full_config = self.get_full_config()
-        return full_config.get("active_model", "qwen2.5:3b")
+        return self.registry.config.active_model
+
+    def reload_config(self):
+        """强制重新加载 models.yaml"""
+        self.registry.reload()
 
     def load_llm(self, model_id: Optional[str] = None):
-        """加载LLM（通过当前后端）。如果未指定model_id，则使用配置中的active_model"""
+        """加载LLM（通过当前后端）。如果未指定model_id，则使用配置中的active_model
+        
+        相同 (后端, 仓库, 参数) 返回池中共享的实例；模型拉取校验每个进程只做一次。
+        """
         if model_id is None:
             model_id = self.active_model_id
             
@@ -43,39 +61,230 @@ class ModelLoader:
         model_info = self.get_model_config(model_id)
         
         # 验证模型是否支持当前后端
-        if backend_name not in model_info.get("supported_backends", []):
+        if backend_name not in model_info.supported_backends:
             raise ValueError(
                 f"模型 {model_id} 不支持后端 {backend_name}"
             )
         
         # 通过后端的repo加载
-        repo = model_info["backend_repos"][backend_name]
-        parameters = model_info.get("parameters", {})
+        repo = model_info.backend_repos[backend_name]
+        parameters = dict(model_info.parameters)
+        key = (backend_name, repo, json.dumps(parameters, sort_keys=True, default=str))
+        
+        verify_key = (backend_name, repo)
+        with self._pool_lock:
+            llm = self._llm_pool.get(key)
+            if llm is not None:
+                self.pool_stats["hits"] += 1
+                return llm
+            self.pool_stats["misses"] += 1
+            verifying, owner = None, False
+            if verify_key not in self._verified:
+                verifying = self._verifying.get(verify_key)
+                if verifying is None:
+                    verifying = self._verifying[verify_key] = Future()
+                    owner = True
+        
+        # 拉取/校验在池锁外进行：同一 (后端, 仓库) 的并发未命中共享一次拉取，其他模型的查找不受阻塞
+        if owner:
+            self._verify(backend, verify_key, parameters, verifying)
+        elif verifying is not None:
+            verifying.result()
+        
+        # 切换模型时提前开始显存腾挪与加载（提交到驻留管理器的后台线程，立即返回）
+        residency = backend_manager.get_residency(backend_name)
+        if residency is not None:
+            residency.schedule(repo)
+        
+        llm = self._build_llm(backend, backend_name, repo, parameters)
+        with self._pool_lock:
+            # 并发构建时以先放入池中的实例为准
+            return self._llm_pool.setdefault(key, llm)
+
+    def _verify(self, backend, verify_key: Tuple[str, str], parameters: Dict[str, Any], future: Future) -> None:
+        """调用后端加载方法（backend implementation might just pull or verify），结果通过 future 共享给并发的调用方"""
+        repo = verify_key[1]
+        try:
+            if not backend.load_model(repo, parameters):
+                raise RuntimeError(f"模型加载失败: {repo}")
+        except BaseException as e:
+            with self._pool_lock:
+                self._verifying.pop(verify_key, None)
+            future.set_exception(e)
+            raise
+        with self._pool_lock:
+            self._verified.add(verify_key)
+            self.pool_stats["verifications"] += 1
+            self._verifying.pop(verify_key, None)
+        future.set_result(None)
+
+    def load_cascade(self, policy: str = "default"):
+        """按 models.yaml 的 cascade.policies.<policy> 构建级联LLM（各级模型复用 load_llm 的实例池）
+        
+        级联未启用或没有该策略时返回 None，调用方应退回 load_llm。
+        """
+        options = self.get_full_config().get("cascade", {})
+        spec = options.get("policies", {}).get(policy)
+        if not options.get("enabled", False) or spec is None:
+            return None
+        model_ids = [s["model"] for s in spec.get("stages", [])]
+        model_ids += [s["verifier"]["model"] for s in spec.get("stages", []) if s.get("verifier", {}).get("model")]
+        llms = {m: self.load_llm(m) for m in model_ids}
+        # 以各级实例为键：池中模型被移除重建后级联随之重建
+        key = ("cascade", policy, json.dumps([spec, sorted((m, id(l)) for m, l in llms.items())],
+                                             sort_keys=True, default=str))
+        with self._pool_lock:
+            llm = self._llm_pool.get(key)
+            if llm is None:
+                from src.utils.cascade import CascadeChatModel
+                llm = CascadeChatModel.from_config(policy, spec, llms.__getitem__)
+                self._llm_pool[key] = llm
+            return llm
+
+    def generate_batch(self, prompts: List[str], model_id: Optional[str] = None) -> List[str]:
+        """批量生成多条互相独立的提示，返回文本
+
+        后端支持批处理（features.supports_batching）时经微批处理器合并为少量 generate_batch 调用，
+        提示先经上下文窗口守卫约束；否则退回 LangChain 的 batch（线程池并发）。
+        """
+        llm = self.load_llm(model_id)
+        backend_name = backend_manager.active_backend_name
+        batcher = backend_manager.get_batcher(backend_name)
+        if not batcher.enabled:
+            return [message.content for message in llm.batch(list(prompts))]
+        from langchain_core.messages import HumanMessage
+        model_info = self.get_model_config(model_id or self.active_model_id)
+        repo = model_info.backend_repos[backend_name]
+        parameters = dict(model_info.parameters)
+        guard = self._context_guard(backend_name, repo, parameters)
+        if guard is not None:
+            prompts = [guard.fit([HumanMessage(content=p)])[0].content for p in prompts]
+        futures = [batcher.submit(p, model=repo, parameters=parameters) for p in prompts]
+        return [future.result().content for future in futures]
+
+    def context_guard(self, model_id: Optional[str] = None):
+        """模型在当前后端上的上下文窗口守卫（供Agent计算提示预算；context_window 未启用时为None）"""
+        model_info = self.get_model_config(model_id or self.active_model_id)
+        backend_name = backend_manager.active_backend_name
+        repo = model_info.backend_repos.get(backend_name, model_info.model_id)
+        return self._context_guard(backend_name, repo, dict(model_info.parameters))
+
+    def _context_guard(self, backend_name: str, repo: str, parameters: Dict[str, Any]):
+        key = (backend_name, repo)
+        if key not in self._guards:
+            from src.utils.context_window import ContextGuard
+            with self._pool_lock:
+                if key not in self._guards:
+                    self._guards[key] = ContextGuard.from_config(
+                        repo, self.get_full_config().get("context_window", {}),
+                        backend_manager.get_backend_config(backend_name), parameters)
+        return self._guards[key]
+
+    def context_stats(self) -> Dict[str, Dict]:
+        """各模型的上下文窗口统计（检查次数、超限次数、截断/压缩/拒绝次数）"""
+        return {f"{b}:{r}": g.get_stats() for (b, r), g in self._guards.items() if g is not None}
+
+    def warmup(self, model_ids: Optional[List[str]] = None) -> Dict[str, float]:
+        """预先构建LLM实例（默认仅active_model），返回每个模型的构建耗时（秒）"""
+        timings = {}
+        for model_id in model_ids or [self.active_model_id]:
+            start = time.perf_counter()
+            self.load_llm(model_id)
+            timings[model_id] = time.perf_counter() - start
+            logger.info(f"🔥 预热模型 {model_id}: {timings[model_id]:.3f}s")
+        return timings
+
+    def evict(self, model_id: Optional[str] = None) -> int:
+        """移除池中的LLM实例（默认全部），被移除的模型下次加载时会重新校验。返回移除数量"""
+        with self._pool_lock:
+            if model_id is None:
+                count = len(self._llm_pool)
+                self._llm_pool.clear()
+                self._verified.clear()
+                self._guards.clear()
+                return count
+            repos = set(self.get_model_config(model_id).backend_repos.values())
+            # 级联持有各级模型的实例，一并移除
+            keys = [k for k in self._llm_pool if k[1] in repos or k[0] == "cascade"]
+            for k in keys:
+                del self._llm_pool[k]
+            self._verified = {v for v in self._verified if v[1] not in repos}
+            return len(keys)
+
+    def _build_llm(self, backend, backend_name: str, repo: str, parameters: Dict[str, Any]):
+        """构建LangChain适配的LLM实例"""
+        # 录制/回放优先于响应缓存（两者都挂在 LangChain 的 cache 钩子上）
+        if backend_manager.cassette is not None:
+            from src.utils.cassette import LangChainCassette
+            cassette = LangChainCassette(backend_manager.cassette, backend_name, repo, parameters)
+            parameters = {**parameters, "cache": cassette}
+        # 响应缓存（由BackendManager统一持有，所有Agent共享）
+        elif backend_manager.response_cache is not None:
+            from src.utils.response_cache import LangChainResponseCache
+            cache = LangChainResponseCache(backend_manager.response_cache, backend_name, repo, parameters)
+            parameters = {**parameters, "cache": cache}
         
-        # 调用后端加载方法 (backend implementation might just pull or verify)
-        success = backend.load_model(repo, parameters)
-        if not success:
-            raise RuntimeError(f"模型加载失败: {repo}")
+        guard = self._context_guard(backend_name, repo, parameters)
         
         # 返回适配的LLM实例
         if backend_name == "ollama":
             from langchain_ollama import ChatOllama
             # Using ChatOllama for chat models
-            return ChatOllama(
+            return self._llm_class(ChatOllama, backend_name, parameters, guard)(
                 model=repo,
                 base_url=backend.base_url,
+                keep_alive=getattr(backend, "keep_alive", None),
                 **parameters
             )
         elif backend_name == "vllm":
             from langchain_openai import ChatOpenAI
             # vLLM兼容OpenAI API
-            return ChatOpenAI(
+            return self._llm_class(ChatOpenAI, backend_name, parameters, guard)(
                 base_url=f"{backend.base_url}/v1",
                 api_key="EMPTY", # vLLM usually doesn't require key
                 model=repo,
                 **parameters
             )
+        elif backend_name == "mock":
+            from src.utils.langchain_adapters import BackendChatModel
+            # 直接包装后端实例（BackendManager 已为其套上准入控制与请求合并）
+            options = {k: v for k, v in parameters.items() if k != "cache"}
+            llm_cls = BackendChatModel
+            if guard is not None:
+                from src.utils.langchain_adapters import context_guarded_chat_model
+                llm_cls = context_guarded_chat_model(llm_cls, guard)
+            return llm_cls(backend=backend, model=repo, parameters=options, cache=parameters.get("cache"))
         else:
              raise ValueError(f"Unsupported backend for LangChain adaptation: {backend_name}")
 
+    @staticmethod
+    def _llm_class(llm_cls, backend_name: str, parameters: Dict[str, Any], guard=None):
+        """按后端配置为LLM类套上显存驻留记录、限流、准入控制与请求合并（与后端实例共用同一组对象）
+        
+        上下文窗口约束在最外层：超长提示在排队和合并之前就被截断或拒绝。
+        """
+        residency = backend_manager.get_residency(backend_name)
+        if residency is not None:
+            from src.utils.langchain_adapters import resident_chat_model
+            llm_cls = resident_chat_model(llm_cls, residency)
+        admission = backend_manager.get_admission(backend_name)
+        if admission is not None:
+            from src.utils.langchain_adapters import admitted_chat_model
+            llm_cls = admitted_chat_model(llm_cls, admission)
+        # 限流在准入外层：等待令牌时不占用并发名额
+        limiter = backend_manager.get_rate_limiter(backend_name)
+        if limiter is not None:
+            from src.utils.langchain_adapters import rate_limited_chat_model
+            llm_cls = rate_limited_chat_model(llm_cls, limiter)
+        group = backend_manager.get_singleflight(backend_name)
+        if group is not None:
+            from src.backends.base import is_sampled
+            if group.allow_sampled or not is_sampled(parameters):
+                from src.utils.langchain_adapters import coalesced_chat_model
+                llm_cls = coalesced_chat_model(llm_cls, group)
+        if guard is not None:
+            from src.utils.langchain_adapters import context_guarded_chat_model
+            llm_cls = context_guarded_chat_model(llm_cls, guard)
+        return llm_cls
+
 model_loader = ModelLoader()
@@ -0,0 +1,231 @@
+"""
+模型显存驻留管理
+
+按 configs/models.yaml 中 resources.<后端>.min_vram 估算每个模型的显存占用：
+- 预加载配置的模型（默认 active_model）并标记为常驻（不会被淘汰）；由 BackendManager 在激活后端
+  健康探测成功时启动
+- 新模型放不下时按最近最少使用（LRU）卸载其他模型，再把新模型加载进显存
+- 卸载与加载都是对后端的网络调用，统一在单个后台线程中串行执行：load_llm 切换模型时只提交任务，
+  请求路径上已驻留的模型只做一次 LRU 记录，未驻留时腾挪显存同样交给后台线程
+后端需提供 load_resident / unload / list_resident（目前为 OllamaBackend）。
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from src.utils.config_registry import ConfigRegistry, models_registry
+
+_SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+def parse_size(value: Any) -> int:
+    """'6GB' / '4.3GB' / '512MB' / 字节数 -> 字节数"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", str(value).upper())
+    if not match:
+        raise ValueError(f"无法解析的容量: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+class ResidencyManager:
+    """
+    显存驻留管理器
+
+    - vram_budget: 可用于模型的显存（字节），None 表示不做淘汰，只负责预加载与 keep_alive
+    - requirements: 模型仓库 -> 显存需求（字节）
+    - keep_alive: 加载模型时使用的 keep_alive
+    """
+
+    def __init__(self, backend, vram_budget: Optional[int], requirements: Dict[str, int],
+                 keep_alive: Optional[str] = None):
+        self.backend = backend
+        self.vram_budget = vram_budget
+        self.requirements = requirements
+        self.keep_alive = keep_alive
+        self.pinned: set = set()
+        self._resident: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.RLock()
+        # 串行化对后端的卸载/加载调用（不与 _lock 嵌套持有网络调用，请求路径只取 _lock）
+        self._io_lock = threading.Lock()
+        # 卸载/加载任务的后台线程（单线程：任务按提交顺序执行，不会并发腾挪显存）
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[Tuple[str, bool], Future] = {}
+        self._preload_future: Optional[Future] = None
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "preloaded": 0}
+
+    @classmethod
+    def from_config(cls, backend, backend_name: str, config: Dict[str, Any],
+                    registry: ConfigRegistry = models_registry) -> "ResidencyManager":
+        """根据后端YAML的 residency 段与 models.yaml 的 resources 构建"""
+        options = config.get("residency", {})
+        budget = options.get("vram_budget")
+        requirements = {}
+        for model in registry.config.models.values():
+            repo = model.backend_repos.get(backend_name)
+            min_vram = model.resources.get(backend_name, {}).get("min_vram")
+            if repo and min_vram:
+                requirements[repo] = parse_size(min_vram)
+        return cls(
+            backend,
+            vram_budget=parse_size(budget) if budget else None,
+            requirements=requirements,
+            keep_alive=config.get("ollama_specific", {}).get("keep_alive"),
+        )
+
+    @property
+    def used(self) -> int:
+        return sum(self._resident.values())
+
+    def resident(self) -> List[str]:
+        """驻留的模型，按最近使用从旧到新"""
+        with self._lock:
+            return list(self._resident)
+
+    def sync(self) -> None:
+        """以后端实际驻留的模型为准（如服务重启或被其他进程加载/卸载）"""
+        try:
+            actual = self.backend.list_resident()
+        except Exception as e:
+            logger.warning(f"⚠️ 读取驻留模型失败: {e}")
+            return
+        with self._lock:
+            for repo in list(self._resident):
+                if repo not in actual:
+                    del self._resident[repo]
+            for repo, size in actual.items():
+                if repo not in self._resident:
+                    self._resident[repo] = self.requirements.get(repo, size)
+                    self._resident.move_to_end(repo, last=False)
+
+    def _pick_victims(self, repo: str, need: int) -> List[str]:
+        """按LRU选出需要卸载的模型（调用方持有 _lock；只做计算，不调用后端）"""
+        if self.vram_budget is None:
+            return []
+        victims, used = [], self.used
+        for victim in self._resident:
+            if used + need <= self.vram_budget:
+                break
+            if victim == repo or victim in self.pinned:
+                continue
+            victims.append(victim)
+            used -= self._resident[victim]
+        return victims
+
+    def ensure_resident(self, repo: str, load: bool = True) -> None:
+        """
+        确保模型驻留：已驻留则只更新LRU；否则先按LRU腾出显存，load 为 True 时立即加载
+        （load 为 False 时由随后的请求触发加载）
+
+        _lock 只保护驻留表，卸载/加载的网络调用在锁外进行（由 _io_lock 串行），不阻塞 touch。
+        """
+        with self._io_lock:
+            with self._lock:
+                if repo in self._resident:
+                    self._resident.move_to_end(repo)
+                    self.stats["hits"] += 1
+                    return
+                need = self.requirements.get(repo, 0)
+                victims = self._pick_victims(repo, need)
+            for victim in victims:
+                try:
+                    self.backend.unload(victim)
+                except Exception as e:
+                    logger.warning(f"⚠️ 卸载模型失败 {victim}: {e}")
+                    continue
+                with self._lock:
+                    self._resident.pop(victim, None)
+                    self.stats["evictions"] += 1
+                logger.info(f"📤 显存不足，卸载最久未使用的模型: {victim}")
+            with self._lock:
+                over_budget = self.vram_budget is not None and self.used + need > self.vram_budget
+            if over_budget:
+                logger.warning(f"⚠️ 模型 {repo} 需要 {need / 1024 ** 3:.1f}GB，超出剩余显存预算（常驻模型无法卸载）")
+            if load:
+                self.backend.load_resident(repo, self.keep_alive)
+                logger.info(f"📥 模型已加载进显存: {repo}")
+            with self._lock:
+                if load:
+                    self.stats["loads"] += 1
+                self._resident[repo] = need
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="residency")
+            return self._executor.submit(fn, *args)
+
+    def schedule(self, repo: str, load: bool = True) -> Future:
+        """在后台线程中执行 ensure_resident，立即返回；同一模型未完成的相同任务直接复用"""
+        key = (repo, load)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None or future.done():
+                future = self._pending[key] = self._submit(self._ensure_logged, repo, load)
+            return future
+
+    def _ensure_logged(self, repo: str, load: bool) -> None:
+        try:
+            self.ensure_resident(repo, load)
+        except Exception as e:
+            logger.warning(f"⚠️ 模型驻留失败 {repo}: {e}")
+            raise
+
+    def touch(self, repo: str) -> Optional[Future]:
+        """
+        请求路径上调用：已驻留时只更新LRU（一次字典操作）；
+        未驻留时把腾挪显存（可能卸载其他模型）提交到后台线程，返回该任务
+        """
+        with self._lock:
+            if repo in self._resident:
+                self._resident.move_to_end(repo)
+                self.stats["hits"] += 1
+                return None
+        return self.schedule(repo, load=False)
+
+    def preload(self, repos: Iterable[str], pin: bool = True) -> None:
+        """加载并（默认）常驻指定模型"""
+        self.sync()
+        for repo in repos:
+            if pin:
+                self.pinned.add(repo)
+            try:
+                self.ensure_resident(repo)
+                self.stats["preloaded"] += 1
+            except Exception as e:
+                logger.warning(f"⚠️ 预加载模型失败 {repo}: {e}")
+
+    def start_preload(self, repos: Iterable[str]) -> None:
+        """后台预加载（不阻塞调用方，幂等）"""
+        repos = list(repos)
+        with self._lock:
+            if not repos or self._preload_future is not None:
+                return
+            self._preload_future = self._submit(self.preload, repos)
+
+    def wait_preloaded(self, timeout: Optional[float] = None) -> None:
+        if self._preload_future is not None:
+            wait([self._preload_future], timeout)
+
+    def close(self) -> None:
+        """停止后台线程（未开始的任务被取消）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "resident": list(self._resident),
+                "pinned": sorted(self.pinned),
+                "used_vram": self.used,
+                "vram_budget": self.vram_budget,
+                "pending": sum(not f.done() for f in self._pending.values()),
+            }
@@ -0,0 +1,243 @@
+"""
+LLM响应缓存 - 内容寻址
+
+缓存键由 (后端, 模型仓库, 渲染后的提示, 采样参数) 哈希得到。
+两级存储：内存 LRU（进程内）+ 可选的 SQLite 磁盘层（跨进程/重启）。
+temperature > 0 的请求默认绕过缓存（采样输出本就不应复用），可通过 allow_sampled 显式开启。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+from loguru import logger
+
+from src.backends.base import is_sampled
+
+
+def make_cache_key(backend: str, repo: str, prompt: str, parameters: Dict[str, Any]) -> str:
+    """生成内容寻址的缓存键"""
+    payload = json.dumps([backend, repo, prompt, parameters], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+
+    - 内存层：OrderedDict 实现的 LRU，超过 max_entries 淘汰最久未使用项
+    - 磁盘层（可选）：SQLite，超过 disk_max_entries 按最近访问时间淘汰
+    - 两层共用 ttl_seconds（<=0 表示永不过期）
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 disk_path: Optional[str] = None, disk_max_entries: int = 100000,
+                 allow_sampled: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self.allow_sampled = allow_sampled
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0,
+            "bypassed": 0, "evictions": 0, "expired": 0,
+        }
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], base_path: str = "") -> "ResponseCache":
+        """根据 models.yaml 的 response_cache 段构建"""
+        disk = config.get("disk", {})
+        disk_path = None
+        if disk.get("enabled", False):
+            disk_path = disk.get("path", ".cache/llm_responses.sqlite")
+            if not os.path.isabs(disk_path):
+                disk_path = os.path.join(base_path, disk_path)
+        return cls(
+            max_entries=config.get("max_entries", 1024),
+            ttl_seconds=config.get("ttl_seconds", 3600),
+            disk_path=disk_path,
+            disk_max_entries=disk.get("max_entries", 100000),
+            allow_sampled=config.get("allow_sampled", False),
+        )
+
+    def _open_disk(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed)")
+        self._db.commit()
+        logger.info(f"💾 响应缓存磁盘层: {path}")
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    def should_bypass(self, parameters: Dict[str, Any]) -> bool:
+        """是否因随机采样而绕过缓存"""
+        return not self.allow_sampled and is_sampled(parameters)
+
+    def record_bypass(self) -> None:
+        """记录一次因随机采样而绕过缓存的请求"""
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created, now):
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._put_memory(key, value, created)
+                        self.stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.stats["expired"] += 1
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_max_entries
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (overflow,)
+                    )
+                    self.stats["evictions"] += overflow
+                self._db.commit()
+
+    def _put_memory(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中/未命中计数与命中率"""
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hit_rate = (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0
+        return {**self.stats, "memory_entries": len(self._memory), "hit_rate": hit_rate}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class LangChainResponseCache(BaseCache):
+    """
+    LangChain 缓存适配器
+
+    挂在 ModelLoader.load_llm 返回的 LLM 上（cache=...），所有 Agent 的调用都会透明经过缓存。
+    每个 LLM 实例绑定自己的 (后端, 仓库, 参数)，共享同一个 ResponseCache。
+    是否因采样绕过缓存按每次调用的实际参数判断：invoke(..., temperature=0) 或 bind(temperature=0)
+    覆盖了实例的 temperature 时以覆盖值为准。
+    """
+
+    # LangChain 把调用参数以 [(键, 值), ...] 的形式附在 llm_string 末尾
+    _TEMPERATURE = re.compile(r"\('temperature', ([^)]*)\)")
+
+    def __init__(self, cache: ResponseCache, backend: str, repo: str, parameters: Dict[str, Any]):
+        self.cache = cache
+        self.backend = backend
+        self.repo = repo
+        self.parameters = parameters
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return make_cache_key(self.backend, self.repo, prompt, {"parameters": self.parameters, "llm": llm_string})
+
+    def _bypass(self, llm_string: str) -> bool:
+        """按本次调用的实际 temperature 判断是否绕过缓存"""
+        parameters = self.parameters
+        overrides = self._TEMPERATURE.findall(llm_string.rpartition("---")[2])
+        if overrides:
+            try:
+                parameters = {**parameters, "temperature": float(overrides[-1])}
+            except ValueError:
+                pass
+        return self.cache.should_bypass(parameters)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if self._bypass(llm_string):
+            self.cache.record_bypass()
+            return None
+        value = self.cache.get(self._key(prompt, llm_string))
+        return None if value is None else self._loads(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self._bypass(llm_string):
+            return
+        self.cache.put(self._key(prompt, llm_string), self._dumps(return_val))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
+
+    @staticmethod
+    def _dumps(generations: Sequence[Generation]) -> str:
+        items = []
+        for g in generations:
+            if isinstance(g, ChatGeneration):
+                items.append({"type": "chat", "message": message_to_dict(g.message)})
+            else:
+                items.append({"type": "text", "text": g.text})
+        return json.dumps(items, ensure_ascii=False)
+
+    @staticmethod
+    def _loads(value: str) -> Sequence[Generation]:
+        generations = []
+        for item in json.loads(value):
+            if item["type"] == "chat":
+                generations.append(ChatGeneration(message=messages_from_dict([item["message"]])[0]))
+            else:
+                generations.append(Generation(text=item["text"]))
+        return generations
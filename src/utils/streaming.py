@@ -0,0 +1,20 @@
+"""
+Agent 流式输出工具
+
+透传 LCEL 链的 astream 分块，同时记录首token延迟（感知延迟）与分块间隔。
+"""
+
+from typing import AsyncIterator, Dict
+
+from src.backends.base import StreamTimer
+
+
+async def track_stream(stream: AsyncIterator[str], metrics: Dict[str, float]) -> AsyncIterator[str]:
+    """透传非空分块，并把 latency / time_to_first_token / inter_token_latency / chunks 写入 metrics"""
+    timer = StreamTimer()
+    async for chunk in stream:
+        if not chunk:
+            continue
+        metrics.update(timer.tick())
+        metrics["chunks"] = timer.chunks
+        yield chunk
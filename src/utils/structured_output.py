@@ -0,0 +1,96 @@
+"""
+LangChain 侧的结构化输出
+
+Agent 使用 load_llm 返回的 LangChain 聊天模型，这里提供与 ModelBackend.generate_structured 相同的语义：
+- ChatOllama / ChatOpenAI（vLLM）：绑定原生约束解码参数（format=<JSON Schema> / response_format=json_schema）
+- 其他模型：流式读取输出并增量校验，格式出错立即中止，JSON 闭合后立即停止
+"""
+
+from typing import Any, AsyncIterator, Optional, Type, TypeVar
+
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from src.backends.structured import IncrementalJSONValidator, StructuredOutputError, parse_structured, \
+    schema_instruction
+
+T = TypeVar("T", bound=BaseModel)
+
+__all__ = ["StructuredOutputError", "schema_instruction", "json_mode", "structured_llm", "avalidate_json_stream"]
+
+
+def _native_binding(llm: Any, schema: Type[BaseModel]) -> Optional[Runnable]:
+    json_schema = schema.model_json_schema()
+    # 按类名判断，避免在导入期加载 langchain_ollama / langchain_openai
+    for cls in type(llm).__mro__:
+        if cls.__name__ == "ChatOllama":
+            return llm.bind(format=json_schema)
+        if cls.__name__ == "ChatOpenAI":
+            return llm.bind(response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema.__name__, "schema": json_schema},
+            })
+    return None
+
+
+def json_mode(llm: Any, schema: Type[BaseModel]) -> Runnable:
+    """支持约束解码时返回绑定了 schema 的模型，否则原样返回（输出仍为消息，可流式）"""
+    return _native_binding(llm, schema) or llm
+
+
+def _content(chunk: Any) -> str:
+    content = getattr(chunk, "content", chunk)
+    return content if isinstance(content, str) else ""
+
+
+def structured_llm(llm: Any, schema: Type[T]) -> Runnable:
+    """返回输入同 llm、输出为 schema 实例的 Runnable（不符合时抛出 StructuredOutputError）"""
+    native = _native_binding(llm, schema)
+    if native is not None:
+        return native | RunnableLambda(lambda message: parse_structured(_content(message), schema))
+
+    def run(value: Any) -> T:
+        validator = IncrementalJSONValidator(schema=schema)
+        stream = llm.stream(value)
+        try:
+            for chunk in stream:
+                if validator.feed(_content(chunk)):
+                    break
+        finally:
+            stream.close()
+        return _finish(validator, schema)
+
+    async def arun(value: Any) -> T:
+        validator = IncrementalJSONValidator(schema=schema)
+        stream = llm.astream(value)
+        try:
+            async for chunk in stream:
+                if validator.feed(_content(chunk)):
+                    break
+        finally:
+            await stream.aclose()
+        return _finish(validator, schema)
+
+    return RunnableLambda(run, afunc=arun, name=f"Structured[{schema.__name__}]")
+
+
+def _finish(validator: IncrementalJSONValidator, schema: Type[T]) -> T:
+    if not validator.complete:
+        raise StructuredOutputError(f"输出在 JSON 完整之前结束: {validator.text[-80:]!r}")
+    return parse_structured(validator.text, schema)
+
+
+async def avalidate_json_stream(tokens: AsyncIterator[str], schema: Type[BaseModel]) -> AsyncIterator[str]:
+    """边转发 token 边校验：格式出错时抛出 StructuredOutputError，JSON 闭合后停止，结束时按 schema 校验"""
+    validator = IncrementalJSONValidator(schema=schema)
+    try:
+        async for token in tokens:
+            complete = validator.feed(token)
+            yield token
+            if complete:
+                break
+    finally:
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    _finish(validator, schema)
@@ -0,0 +1,148 @@
+"""
+分词服务 - 请求发出前的 token 计数
+
+每个模型的编码器只构建一次并缓存。编码器由 models.yaml 中模型的 tokenizer 字段指定
+（未指定时取 tokenizer.default）：
+- heuristic: 无依赖的近似分词（CJK 每字一个 token，拉丁字母每段至多 5 个字符），略微高估，适合做上限检查
+- tiktoken:<编码名>: 需要安装 tiktoken（首次使用需下载编码表）
+- hf:<仓库名>: 需要安装 transformers，与模型实际分词一致
+可选依赖缺失或加载失败时退回 heuristic。
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+from loguru import logger
+
+from src.utils.config_registry import ConfigRegistry, models_registry
+
+DEFAULT_ENCODING = "heuristic"
+# 每条消息的格式开销（角色标记、分隔符）
+MESSAGE_OVERHEAD = 4
+
+_HEURISTIC_PATTERN = re.compile(
+    r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]"  # CJK 每字一个
+    r"|\s?[A-Za-z]{1,5}"
+    r"|\s?\d{1,3}"
+    r"|\s+"
+    r"|[^\sA-Za-z\d]"
+)
+
+
+class HeuristicEncoder:
+    """近似分词：token 为原文片段，decode 为直接拼接"""
+
+    name = DEFAULT_ENCODING
+
+    def encode(self, text: str) -> List[str]:
+        return _HEURISTIC_PATTERN.findall(text)
+
+    def decode(self, tokens: Sequence[Any]) -> str:
+        return "".join(tokens)
+
+    def count(self, text: str) -> int:
+        return sum(1 for _ in _HEURISTIC_PATTERN.finditer(text))
+
+
+class _WrappedEncoder:
+    """tiktoken / transformers 分词器的统一接口"""
+
+    def __init__(self, name: str, encode, decode):
+        self.name = name
+        self._encode = encode
+        self._decode = decode
+
+    def encode(self, text: str) -> List[Any]:
+        return self._encode(text)
+
+    def decode(self, tokens: Sequence[Any]) -> str:
+        return self._decode(list(tokens))
+
+    def count(self, text: str) -> int:
+        return len(self._encode(text))
+
+
+def _load_encoder(spec: str):
+    kind, _, name = spec.partition(":")
+    if kind == "tiktoken":
+        import tiktoken
+        encoding = tiktoken.get_encoding(name)
+        return _WrappedEncoder(spec, lambda t: encoding.encode(t, disallowed_special=()), encoding.decode)
+    if kind == "hf":
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        return _WrappedEncoder(spec, lambda t: tokenizer.encode(t, add_special_tokens=False), tokenizer.decode)
+    if spec != DEFAULT_ENCODING:
+        raise ValueError(f"未知的分词器: {spec}，可用: heuristic / tiktoken:<编码名> / hf:<仓库名>")
+    return HeuristicEncoder()
+
+
+def message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    # 多模态内容只计文本部分
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class TokenizerService:
+    """按模型缓存编码器的 token 计数服务"""
+
+    def __init__(self, registry: ConfigRegistry = models_registry):
+        self.registry = registry
+        self._encoders: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def encoding_for(self, model: Optional[str] = None) -> str:
+        """模型使用的编码器（model 可以是模型ID或任一后端的仓库名）"""
+        config = self.registry.config
+        default = (self.registry.raw.get("tokenizer") or {}).get("default", DEFAULT_ENCODING)
+        for model_id, info in config.models.items():
+            if model in (model_id, *info.backend_repos.values()):
+                return getattr(info, "tokenizer", None) or default
+        return default
+
+    def get_encoder(self, model: Optional[str] = None):
+        spec = self.encoding_for(model)
+        encoder = self._encoders.get(spec)
+        if encoder is not None:
+            return encoder
+        with self._lock:
+            if spec not in self._encoders:
+                try:
+                    self._encoders[spec] = _load_encoder(spec)
+                except Exception as e:
+                    logger.warning(f"⚠️ 分词器 {spec} 加载失败，改用近似分词: {e}")
+                    self._encoders[spec] = HeuristicEncoder()
+            return self._encoders[spec]
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        return self.get_encoder(model).count(text)
+
+    def count_messages(self, messages: Sequence[BaseMessage], model: Optional[str] = None) -> int:
+        encoder = self.get_encoder(model)
+        return sum(encoder.count(message_text(m)) + MESSAGE_OVERHEAD for m in messages)
+
+    def truncate(self, text: str, max_tokens: int, model: Optional[str] = None, keep: str = "head") -> str:
+        """截断到 max_tokens：keep 为 head（保留开头）/ tail（保留结尾）/ middle（保留首尾，去掉中间）"""
+        encoder = self.get_encoder(model)
+        tokens = encoder.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        if keep == "tail":
+            return encoder.decode(tokens[-max_tokens:])
+        if keep == "middle":
+            marker = " … "
+            budget = max(0, max_tokens - encoder.count(marker))
+            head = (budget + 1) // 2
+            tail = budget - head
+            return encoder.decode(tokens[:head]) + marker + (encoder.decode(tokens[-tail:]) if tail else "")
+        return encoder.decode(tokens[:max_tokens])
+
+
+# 全局单例
+tokenizer_service = TokenizerService()
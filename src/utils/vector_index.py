@@ -0,0 +1,147 @@
+"""
+稠密向量索引（精确余弦相似度）
+
+向量写入时做 L2 归一化，存放在一块连续的 float32 矩阵中（容量按倍数增长，避免每次写入都复制），
+文档ID与行号双向映射；删除时把最后一行移到被删除的位置，矩阵始终保持紧凑。
+查询即归一化向量与矩阵的点积，用 argpartition 取前 k 个（O(n) 而非整体排序的 O(n log n)）；
+多个查询合并为一次矩阵乘法。
+"""
+
+import threading
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（零向量保持为零）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """对分数矩阵的每一行取前 top_k 列，返回 (列号, 分数)，均按分数降序"""
+    k = min(top_k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(k), (scores.shape[0], k))
+    selected = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-selected, axis=1, kind="stable")
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(selected, order, axis=1)
+
+
+class DenseIndex:
+    """
+    精确向量索引
+
+    - dim: 向量维度（None 表示由第一次写入决定）
+    - initial_capacity: 初始行数，写满时容量翻倍
+    """
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024):
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self._matrix: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """有效行的视图（不复制）"""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:len(self.ids)]
+
+    def _reserve(self, rows: int) -> None:
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, self.initial_capacity)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        if self._matrix is not None:
+            matrix[:len(self.ids)] = self._matrix[:len(self.ids)]
+        self._matrix = matrix
+
+    def add(self, doc_id: str, vector: Sequence[float]) -> None:
+        self.add_batch([doc_id], np.asarray(vector, dtype=np.float32)[None, :])
+
+    def add_batch(self, doc_ids: Sequence[str], vectors: np.ndarray) -> None:
+        """批量写入（已存在的ID原地覆盖）"""
+        vectors = normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(doc_ids):
+            raise ValueError(f"向量形状 {vectors.shape} 与 {len(doc_ids)} 个文档ID不匹配")
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+            self._reserve(len(self.ids) + len(doc_ids))
+            for doc_id, vector in zip(doc_ids, vectors):
+                row = self.rows.get(doc_id)
+                if row is None:
+                    row = self.rows[doc_id] = len(self.ids)
+                    self.ids.append(doc_id)
+                self._matrix[row] = vector
+
+    def get(self, doc_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self.rows.get(doc_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def remove(self, doc_id: str) -> bool:
+        """删除：最后一行移入空位"""
+        with self._lock:
+            row = self.rows.pop(doc_id, None)
+            if row is None:
+                return False
+            last = len(self.ids) - 1
+            if row != last:
+                moved = self.ids[last]
+                self._matrix[row] = self._matrix[last]
+                self.ids[row] = moved
+                self.rows[moved] = row
+            self.ids.pop()
+            return True
+
+    def search(self, query: Sequence[float], top_k: int = 5,
+               candidates: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        """按余弦相似度返回前 top_k 个 (文档ID, 分数)"""
+        return self.search_batch(np.asarray(query, dtype=np.float32)[None, :], top_k, candidates)[0]
+
+    def candidate_rows(self, candidates: AbstractSet[str]) -> np.ndarray:
+        return np.fromiter((self.rows[d] for d in candidates if d in self.rows), dtype=np.int64)
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5,
+                     candidates: Optional[AbstractSet[str]] = None) -> List[List[Tuple[str, float]]]:
+        """多个查询一次矩阵乘法；给定 candidates 时只与这些文档的向量相乘"""
+        queries = normalize(queries)
+        with self._lock:
+            rows = None if candidates is None else self.candidate_rows(candidates)
+            if not self.ids or (rows is not None and len(rows) == 0):
+                return [[] for _ in range(len(queries))]
+            scores = queries @ (self.vectors if rows is None else self._matrix[rows]).T
+            columns, selected = top_k_rows(scores, top_k)
+            if rows is not None:
+                columns = rows[columns]
+            return [
+                [(self.ids[c], float(s)) for c, s in zip(row_columns, row_scores)]
+                for row_columns, row_scores in zip(columns, selected)
+            ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            capacity = 0 if self._matrix is None else self._matrix.shape[0]
+            return {"vectors": len(self.ids), "dim": self.dim, "capacity": capacity,
+                    "memory_bytes": 0 if self._matrix is None else self._matrix.nbytes}
@@ -0,0 +1,133 @@
+import sys
+import os
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+
+class StubVLLMServer:
+    """本地桩服务，模拟vLLM的OpenAI兼容接口，用于不依赖GPU的后端测试"""
+
+    def __init__(self, reply: str = "stub reply", delay: float = 0.0):
+        self.reply = reply
+        self.delay = delay
+        self.healthy = True
+        self.failing = False
+        self.requests = []
+        self.client_ports = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                # 对冲等场景下落败的连接被客户端直接断开：忽略，不打印回溯
+                try:
+                    super().handle()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.client_ports.add(self.client_address[1])
+                if self.path == "/health":
+                    self._send_json(200 if stub.healthy else 503, {})
+                elif self.path == "/v1/models":
+                    self._send_json(200, {"data": [{"id": "stub-model"}]})
+                else:
+                    self._send_json(404, {})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.client_ports.add(self.client_address[1])
+                    stub.requests.append((self.path, data))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.failing:
+                    self._send_json(503, {"error": "replica failure"})
+                elif self.path == "/v1/chat/completions" and data.get("stream"):
+                    self._stream(data)
+                elif self.path == "/v1/chat/completions":
+                    self._send_json(200, {
+                        "choices": [{"message": {"content": stub.reply}}],
+                        "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+                    })
+                elif self.path == "/v1/completions":
+                    prompts = data["prompt"] if isinstance(data["prompt"], list) else [data["prompt"]]
+                    choices = [{"index": i, "text": f"echo:{p}"} for i, p in enumerate(prompts)]
+                    self._send_json(200, {
+                        "choices": list(reversed(choices)),
+                        "usage": {"prompt_tokens": len(prompts), "completion_tokens": len(prompts)},
+                    })
+                else:
+                    self._send_json(404, {})
+
+            def _stream(self, data: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in stub.reply.split(" "):
+                    chunk = {"choices": [{"delta": {"content": token + " "}}]}
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, payload: bytes):
+                self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+@pytest.fixture
+def vllm_stub():
+    server = StubVLLMServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def vllm_stubs():
+    servers = [StubVLLMServer(reply=f"replica-{i}").start() for i in range(2)]
+    yield servers
+    for server in servers:
+        server.stop()
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.backends.admission import AdmissionController, AdmissionRejected, AdmittedBackend
+from src.backends.base import ModelBackend, ModelResponse
+from src.utils.langchain_adapters import admitted_chat_model
+
+
+class ConcurrencyProbeBackend(ModelBackend):
+    """记录同时执行的请求数峰值的测试后端"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.order: List[str] = []
+        self._lock = threading.Lock()
+
+    def _enter(self, prompt):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.order.append(prompt)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
+        return True
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        self._enter(prompt)
+        time.sleep(self.delay)
+        self._exit()
+        return ModelResponse(content=prompt)
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        self._enter(prompt)
+        await asyncio.sleep(self.delay)
+        self._exit()
+        return ModelResponse(content=prompt)
+
+    async def generate_stream(self, prompt: str, **kwargs):
+        self._enter(prompt)
+        for token in prompt.split():
+            await asyncio.sleep(self.delay / 4)
+            yield ModelResponse(content=token)
+        self._exit()
+
+    def is_available(self) -> bool:
+        return True
+
+    def get_model_info(self, model_id: str) -> Dict[str, Any]:
+        return {}
+
+    def list_loaded_models(self) -> List[str]:
+        return []
+
+
+def test_from_config_uses_backend_yaml():
+    ollama = AdmissionController.from_config("ollama", {
+        "features": {"supports_concurrent": False},
+        "benchmarks": {"max_concurrent_users": 1},
+        "admission": {"max_queue": 4},
+    })
+    assert ollama.max_concurrent == 1 and ollama.max_queue == 4
+    vllm = AdmissionController.from_config("vllm", {
+        "features": {"supports_concurrent": True},
+        "benchmarks": {"max_concurrent_users": 8},
+    })
+    assert vllm.max_concurrent == 8
+    assert AdmissionController.from_config("x", {"admission": {"enabled": False}}) is None
+
+
+def test_sync_callers_respect_limit():
+    inner = ConcurrencyProbeBackend()
+    backend = AdmittedBackend(inner, AdmissionController("t", max_concurrent=2))
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(backend.generate, [f"p{i}" for i in range(8)]))
+    assert [r.content for r in results] == [f"p{i}" for i in range(8)]
+    assert inner.peak == 2
+    stats = backend.admission.get_stats()
+    assert stats["admitted"] == 8 and stats["in_flight"] == 0
+    assert stats["max_queue_depth"] >= 1 and stats["max_wait"] > 0
+
+
+def test_async_and_stream_callers_respect_limit():
+    inner = ConcurrencyProbeBackend()
+    backend = AdmittedBackend(inner, AdmissionController("t", max_concurrent=1))
+
+    async def consume(prompt):
+        return [c.content async for c in backend.generate_stream(prompt)]
+
+    async def main():
+        return await asyncio.gather(
+            *(backend.agenerate(f"a{i}") for i in range(3)),
+            *(consume(f"s{i} x y") for i in range(3)),
+        )
+
+    results = asyncio.run(main())
+    assert results[3] == ["s0", "x", "y"]
+    assert inner.peak == 1
+
+
+def test_priority_orders_queue():
+    inner = ConcurrencyProbeBackend(delay=0.02)
+    controller = AdmissionController("t", max_concurrent=1)
+    backend = AdmittedBackend(inner, controller)
+    gate = threading.Event()
+
+    def hold():
+        with controller.slot():
+            gate.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while controller.in_flight == 0:
+        time.sleep(0.001)
+    threads = []
+    for prompt, priority in [("low", 5), ("high", 0), ("mid", 1)]:
+        t = threading.Thread(target=backend.generate, args=(prompt,), kwargs={"priority": priority})
+        t.start()
+        threads.append(t)
+        while controller.queue_depth < len(threads):
+            time.sleep(0.001)
+    gate.set()
+    for t in [holder, *threads]:
+        t.join()
+    assert inner.order == ["high", "mid", "low"]
+
+
+def test_full_queue_rejects_immediately():
+    controller = AdmissionController("t", max_concurrent=1, max_queue=1)
+    backend = AdmittedBackend(ConcurrencyProbeBackend(delay=0.2), controller)
+    with ThreadPoolExecutor(2) as pool:
+        running = [pool.submit(backend.generate, "a"), pool.submit(backend.generate, "b")]
+        while controller.queue_depth < 1:
+            time.sleep(0.001)
+        start = time.perf_counter()
+        with pytest.raises(AdmissionRejected):
+            backend.generate("c")
+        assert time.perf_counter() - start < 0.05
+        for f in running:
+            f.result()
+    assert controller.get_stats()["rejected"] == 1
+
+
+def test_queue_timeout_rejects_and_frees_queue():
+    controller = AdmissionController("t", max_concurrent=1, max_wait=0.05)
+    backend = AdmittedBackend(ConcurrencyProbeBackend(delay=0.3), controller)
+
+    async def main():
+        first = asyncio.create_task(backend.agenerate("slow"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected):
+            await backend.agenerate("late")
+        assert controller.queue_depth == 0
+        await first
+
+    asyncio.run(main())
+    stats = controller.get_stats()
+    assert stats["timed_out"] == 1 and stats["in_flight"] == 0
+
+
+def test_langchain_model_shares_controller():
+    controller = AdmissionController("t", max_concurrent=1)
+    llm_cls = admitted_chat_model(FakeListChatModel, controller)
+    assert admitted_chat_model(FakeListChatModel, controller) is llm_cls
+    llm = llm_cls(responses=["ok"] * 4, sleep=0.05)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: llm.invoke("hi").content, range(4)))
+    assert results == ["ok"] * 4
+    stats = controller.get_stats()
+    assert stats["admitted"] == 4 and stats["max_queue_depth"] >= 1
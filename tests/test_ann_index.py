@@ -0,0 +1,79 @@
+import numpy as np
+
+from src.agents.patterns.rag import Document, Retriever, SimpleVectorStore
+from src.utils.ann_index import IVFIndex
+from src.utils.vector_index import DenseIndex
+
+
+def clustered(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    return (centers[rng.integers(20, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_untrained_index_is_exact():
+    data = clustered(50)
+    index = IVFIndex(min_train_size=100)
+    index.add_batch([str(i) for i in range(50)], data)
+    assert not index.trained
+    exact = DenseIndex()
+    exact.add_batch([str(i) for i in range(50)], data)
+    assert [d for d, _ in index.search(data[7], 5)] == [d for d, _ in exact.search(data[7], 5)]
+
+
+def test_recall_improves_with_nprobe():
+    data = clustered(2000)
+    ids = [str(i) for i in range(2000)]
+    index = IVFIndex(nlist=32, min_train_size=1000)
+    index.add_batch(ids, data)
+    assert index.trained and index.get_stats()["nlist"] == 32
+    exact = DenseIndex()
+    exact.add_batch(ids, data)
+    queries = clustered(50, seed=1)
+
+    def recall(nprobe):
+        hits = 0
+        for q in queries:
+            truth = {d for d, _ in exact.search(q, 10)}
+            hits += len(truth & {d for d, _ in index.search(q, 10, nprobe=nprobe)})
+        return hits / (10 * len(queries))
+
+    assert recall(1) <= recall(8) <= recall(32) == 1.0
+    assert recall(8) > 0.9
+
+
+def test_incremental_insert_and_tombstone_delete():
+    data = clustered(300)
+    index = IVFIndex(nlist=8, min_train_size=200, compact_ratio=0.5)
+    index.add_batch([str(i) for i in range(250)], data[:250])
+    index.add("new", data[260])
+    assert index.search(data[260], 1, nprobe=1)[0][0] == "new"
+    assert index.remove("new") and not index.remove("new")
+    assert "new" not in [d for d, _ in index.search(data[260], 5, nprobe=8)]
+    assert index.get_stats()["tombstones"] == 1
+    for i in range(150):
+        index.remove(str(i))
+    stats = index.get_stats()
+    assert stats["compactions"] == 1 and stats["vectors"] == 100
+    assert index.search(data[200], 1, nprobe=8)[0][0] == "200"
+
+
+def test_reinsert_replaces_vector_and_retrains_on_growth():
+    data = clustered(900)
+    index = IVFIndex(nlist=4, min_train_size=100, retrain_factor=4)
+    index.add_batch([str(i) for i in range(100)], data[:100])
+    index.add("0", data[500])
+    assert len(index) == 100 and np.allclose(index.get("0"), data[500] / np.linalg.norm(data[500]))
+    index.add_batch([f"x{i}" for i in range(400)], data[500:900])
+    assert index.get_stats()["trainings"] == 2
+
+
+def test_retriever_passes_search_params_to_ann_index():
+    store = SimpleVectorStore(search_mode="dense", dense_index=IVFIndex(nlist=2, min_train_size=4))
+    store.add_documents([Document(id=str(i), content=text) for i, text in enumerate([
+        "python web framework", "python data analysis", "rust memory safety", "go concurrency model",
+        "machine learning models", "deep learning networks",
+    ])])
+    retriever = Retriever(store, top_k=2, search_params={"nprobe": 2})
+    assert retriever.retrieve("python framework")[0].document.id == "0"
+    assert store.dense_index.get_stats()["trained"]
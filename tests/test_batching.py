@@ -0,0 +1,137 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import src.agents.patterns.evaluation as evaluation_module
+import src.agents.patterns.parallelization as parallelization_module
+import src.utils.model_loader as model_loader_module
+from src.agents.patterns.evaluation import Evaluator
+from src.agents.patterns.parallelization import ParallelizationWithMap
+from src.backends.batching import MicroBatcher
+from src.backends.vllm_backend import VLLMBackend
+from src.utils.backend_manager import BackendManager
+from src.utils.model_loader import ModelLoader
+
+
+def _config(url: str, supports_batching: bool = True) -> dict:
+    return {
+        "connection": {"host": url, "timeout": 5},
+        "features": {"supports_batching": supports_batching},
+        "batching": {"max_batch_size": 8, "window_ms": 50},
+    }
+
+
+def test_concurrent_requests_are_merged_into_one_call(vllm_stub):
+    config = _config(vllm_stub.url)
+    backend = VLLMBackend(config)
+    batcher = MicroBatcher.from_config(backend, config)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda i: batcher.generate(f"p{i}").content, range(8)))
+    finally:
+        batcher.close()
+        backend.close()
+
+    assert results == [f"echo:p{i}" for i in range(8)]
+    completions = [r for r in vllm_stub.requests if r[0] == "/v1/completions"]
+    assert len(completions) == 1
+    assert batcher.get_stats()["max_batch"] == 8
+    assert batcher.get_stats()["requests"] == 8
+
+
+def test_batches_split_by_parameters(vllm_stub):
+    config = _config(vllm_stub.url)
+    backend = VLLMBackend(config)
+    batcher = MicroBatcher.from_config(backend, config)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.agenerate("a", parameters={"temperature": 0}),
+            batcher.agenerate("b", parameters={"temperature": 0}),
+            batcher.agenerate("c", parameters={"temperature": 1}),
+        )
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        batcher.close()
+        backend.close()
+
+    assert [r.content for r in responses] == ["echo:a", "echo:b", "echo:c"]
+    batched = sorted(len(r[1]["prompt"]) for r in vllm_stub.requests)
+    assert batched == [1, 2]
+
+
+def test_missing_batch_responses_fail_leftover_requests():
+    from src.backends.base import ModelResponse
+
+    class ShortBackend:
+        def generate_batch(self, prompts, **kwargs):
+            return [ModelResponse(content=p) for p in prompts[:-1]]
+
+    batcher = MicroBatcher(ShortBackend(), max_batch_size=3, window_ms=50)
+    try:
+        futures = [batcher.submit(p) for p in ("a", "b", "c")]
+        assert [f.result(timeout=5).content for f in futures[:2]] == ["a", "b"]
+        assert isinstance(futures[2].exception(timeout=5), RuntimeError)
+    finally:
+        batcher.close()
+
+
+def test_disabled_batcher_passes_through(vllm_stub):
+    config = _config(vllm_stub.url, supports_batching=False)
+    backend = VLLMBackend(config)
+    batcher = MicroBatcher.from_config(backend, config)
+    try:
+        assert not batcher.enabled
+        assert batcher.generate("x").content == "stub reply"
+    finally:
+        batcher.close()
+        backend.close()
+    assert vllm_stub.requests[0][0] == "/v1/chat/completions"
+
+
+def test_batch_prompts_use_chat_template(vllm_stub):
+    config = _config(vllm_stub.url)
+    config["batching"]["prompt_template"] = "<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
+    backend = VLLMBackend(config)
+    try:
+        backend.generate_batch(["hi {x}"])
+    finally:
+        backend.close()
+    # /v1/completions 不套用聊天模板，由客户端包装（提示中的花括号原样保留）
+    assert vllm_stub.requests[0][1]["prompt"] == ["<|im_start|>user\nhi {x}<|im_end|>\n<|im_start|>assistant\n"]
+
+
+def _mock_loader(monkeypatch, *modules):
+    manager = BackendManager()
+    assert manager.switch_backend("mock")
+    monkeypatch.setattr(model_loader_module, "backend_manager", manager)
+    loader = ModelLoader()
+    for module in modules:
+        monkeypatch.setattr(module, "model_loader", loader)
+    return manager
+
+
+def test_parallelization_map_goes_through_micro_batcher(monkeypatch):
+    manager = _mock_loader(monkeypatch, parallelization_module)
+    try:
+        results = ParallelizationWithMap("qwen3:4b").run_batch(["a", "b", "c", "d"])
+        stats = manager.get_batcher().get_stats()
+    finally:
+        manager.close()
+    assert results == [f"[mock] Provide a brief analysis of: {x}" for x in "abcd"]
+    assert stats["requests"] == 4 and stats["batches"] < 4
+
+
+def test_evaluator_batches_model_calls(monkeypatch):
+    manager = _mock_loader(monkeypatch, evaluation_module)
+    evaluator = Evaluator("batch")
+    evaluator.add_test_cases([{"id": f"t{i}", "input": f"q{i}", "expected": f"[mock] q{i}"} for i in range(3)])
+    try:
+        results = evaluator.evaluate_model("qwen3:4b")
+        stats = manager.get_batcher().get_stats()
+    finally:
+        manager.close()
+    assert [r.actual_output for r in results] == ["[mock] q0", "[mock] q1", "[mock] q2"]
+    assert all(r.passed for r in results) and len(evaluator.results) == 3
+    assert stats["requests"] == 3 and stats["batches"] < 3
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from src.agents.patterns.rag import Document, SimpleVectorStore
+from src.utils.bm25 import BM25Index, analyze
+
+
+def test_analyze_latin_and_cjk():
+    assert analyze("Python 是一种 GPU-3") == ["python", "是一", "一种", "gpu", "3"]
+    assert analyze("是 a") == ["是", "a"]
+
+
+def test_bm25_ranks_rare_terms_and_short_documents_higher():
+    index = BM25Index()
+    index.add("a", "python python web framework")
+    index.add("b", "python data science with many many extra words here")
+    index.add("c", "rust systems programming")
+    hits = index.search("python framework", top_k=2)
+    assert [doc_id for doc_id, _ in hits] == ["a", "b"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search("golang") == []
+
+
+def test_incremental_update_and_delete():
+    index = BM25Index()
+    index.add("a", "alpha beta")
+    index.add("b", "beta gamma")
+    index.add("a", "delta")
+    assert "alpha" not in index.postings
+    assert {d for d, _ in index.search("beta delta", 5)} == {"a", "b"}
+    assert index.remove("b") and not index.remove("b")
+    assert "gamma" not in index.postings and "beta" not in index.postings
+    assert index.get_stats() == {"documents": 1, "terms": 1, "postings": 1, "avg_doc_length": 1.0}
+
+
+def test_idf_matches_bm25_formula():
+    index = BM25Index()
+    for i in range(9):
+        index.add(str(i), "common")
+    index.add("9", "common rare")
+    assert index.idf("rare") == pytest.approx(math.log(1 + 9.5 / 1.5))
+    assert index.idf("common") < index.idf("rare")
+
+
+def test_vector_store_search_uses_index():
+    store = SimpleVectorStore()
+    store.add_documents([
+        Document(id="", content="机器学习是人工智能的一个分支"),
+        Document(id="", content="深度学习是机器学习的一种"),
+        Document(id="", content="Python 是一种高级编程语言"),
+    ])
+    results = store.search("什么是 Python？", top_k=3)
+    assert results[0].document.content.startswith("Python")
+    assert [r.rank for r in store.search("机器学习", top_k=5)] == [1, 2]
+    doc_id = results[0].document.id
+    assert store.delete_document(doc_id)
+    assert all(r.document.id != doc_id for r in store.search("Python", top_k=5))
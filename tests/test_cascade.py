@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from src.utils.cascade import CascadeChatModel, FormatScorer, parse_json, score_logprobs
+
+ROUTING = {
+    "stages": [
+        {"model": "small", "scorer": "format", "threshold": 1.0, "format": {"choices": ["booker", "info"]}},
+        {"model": "large"},
+    ]
+}
+
+
+def build(spec, responses):
+    llms = {name: FakeListChatModel(responses=r) for name, r in responses.items()}
+    return CascadeChatModel.from_config("test", spec, llms.__getitem__), llms
+
+
+def test_small_model_answer_accepted():
+    cascade, llms = build(ROUTING, {"small": ["Booker."], "large": ["info"]})
+    message = cascade.invoke("book a flight")
+    assert message.content == "Booker."
+    assert message.response_metadata["cascade"]["model"] == "small"
+    assert llms["large"].i == 0
+    stats = cascade.get_stats()["stages"]
+    assert stats["small"]["accepted"] == 1 and stats["large"] == {}
+
+
+def test_escalates_on_invalid_format():
+    cascade, _ = build(ROUTING, {"small": ["I think it's about booking"], "large": ["booker"]})
+    message = cascade.invoke("book a flight")
+    assert message.content == "booker"
+    trace = message.response_metadata["cascade"]["trace"]
+    assert [(s["model"], s["accepted"]) for s in trace] == [("small", False), ("large", True)]
+    stats = cascade.get_stats()
+    assert stats["requests"] == 1
+    assert stats["stages"]["small"]["escalated"] == 1 and stats["stages"]["large"]["accepted"] == 1
+
+
+def test_verifier_scorer_async():
+    spec = {"stages": [
+        {"model": "small", "scorer": "verifier", "threshold": 0.7, "verifier": {"model": "judge"}},
+        {"model": "large"},
+    ]}
+    cascade, _ = build(spec, {"small": ["Paris", "Lyon"], "judge": ["9", "Score: 3"], "large": ["Paris"]})
+
+    async def run():
+        return [await cascade.ainvoke("capital of France?") for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert first.response_metadata["cascade"]["stage"] == 0
+    assert first.response_metadata["cascade"]["trace"][0]["confidence"] == pytest.approx(0.9)
+    assert second.response_metadata["cascade"]["stage"] == 1
+
+
+def test_verifier_usage_is_accounted():
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+
+    usage = {"input_tokens": 40, "output_tokens": 1, "total_tokens": 41}
+    judge = GenericFakeChatModel(messages=iter([AIMessage(content="8", usage_metadata=usage)]))
+    llms = {"small": FakeListChatModel(responses=["Paris"]), "judge": judge, "large": FakeListChatModel(responses=["x"])}
+    spec = {"stages": [
+        {"model": "small", "scorer": "verifier", "threshold": 0.7, "verifier": {"model": "judge"}},
+        {"model": "large"},
+    ]}
+    cascade = CascadeChatModel.from_config("test", spec, llms.__getitem__)
+    message = cascade.invoke("capital of France?")
+    assert message.response_metadata["cascade"]["trace"][0]["scorer_usage"] == usage
+    assert message.usage_metadata["input_tokens"] == 40
+    stats = cascade.get_stats()["stages"]["small"]
+    assert stats["scorer_input_tokens"] == 40 and stats["scorer_output_tokens"] == 1
+
+
+def test_stage_error_escalates():
+    class Broken(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            raise ConnectionError("down")
+
+    llms = {"small": Broken(responses=["x"]), "large": FakeListChatModel(responses=["info"])}
+    cascade = CascadeChatModel.from_config("test", ROUTING, llms.__getitem__)
+    assert cascade.invoke("hi").content == "info"
+    assert cascade.get_stats()["stages"]["small"]["errors"] == 1
+
+
+def test_scorers():
+    assert FormatScorer(json=True, required=["cpu"]).check('```json\n{"cpu": "3.5GHz"}\n```')
+    assert not FormatScorer(required=["cpu", "memory"]).check('{"cpu": "3.5GHz"}')
+    assert not FormatScorer(json=True).check("no json here")
+    assert parse_json('result: [1, 2] trailing') == [1, 2]
+    assert FormatScorer(regex=r"\d+GB").check("16GB RAM")
+
+    openai_style = AIMessage(content="ok", response_metadata={"logprobs": {"content": [
+        {"token": "o", "logprob": -0.1}, {"token": "k", "logprob": -0.3}]}})
+    assert score_logprobs(openai_style) == pytest.approx(0.8187, abs=1e-3)
+    ollama_style = AIMessage(content="ok", response_metadata={"logprobs": [{"token": "ok", "logprob": 0.0}]})
+    assert score_logprobs(ollama_style) == 1.0
+    assert score_logprobs(AIMessage(content="ok")) is None
+
+
+def test_non_final_stage_requires_scorer():
+    with pytest.raises(ValueError):
+        build({"stages": [{"model": "small"}, {"model": "large"}]}, {"small": ["a"], "large": ["b"]})
@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.backends.mock_backend import MockBackend
+from src.utils.cassette import Cassette, CassetteBackend, CassetteMiss, LangChainCassette
+
+
+def _mock() -> MockBackend:
+    return MockBackend({"mock": {"latency": {"distribution": "fixed", "mean": 0.0}, "echo_prefix": "live:"}})
+
+
+def test_record_then_replay_without_backend_calls(tmp_path):
+    path = str(tmp_path / "run.jsonl.gz")
+    recorder = CassetteBackend(_mock(), Cassette(path, mode="record"), namespace="mock")
+    recorded = [recorder.generate(p, model="m") for p in ["a", "b"]]
+    recorder.cassette.close()
+    with gzip.open(path, "rt") as f:
+        assert len(f.readlines()) == 2
+
+    live = _mock()
+    replayer = CassetteBackend(live, Cassette(path, mode="replay"), namespace="mock")
+    assert [replayer.generate(p, model="m", priority=3).content for p in ["a", "b"]] == [r.content for r in recorded]
+    assert live.stats["requests"] == 0
+    assert replayer.cassette.get_stats()["hits"] == 2
+
+
+def test_replay_miss_policies(tmp_path):
+    path = str(tmp_path / "empty.jsonl")
+    with pytest.raises(CassetteMiss):
+        CassetteBackend(_mock(), Cassette(path, on_miss="fail")).generate("x")
+
+    passthrough = CassetteBackend(_mock(), Cassette(path, on_miss="live"))
+    assert passthrough.generate("x").content == "live:x"
+    assert passthrough.cassette.get_stats()["recorded"] == 0
+
+    extending = CassetteBackend(_mock(), Cassette(path, on_miss="record"))
+    extending.generate("x")
+    extending.cassette.close()
+    assert Cassette(path).lookup(extending._key("generate", "x", {})) is not None
+
+
+def test_repeated_requests_replay_in_recorded_order(tmp_path):
+    path = str(tmp_path / "seq.jsonl")
+    cassette = Cassette(path, mode="record")
+    backend = CassetteBackend(_mock(), cassette)
+    for content in ["first", "second"]:
+        backend.inner.echo_prefix = content + ":"
+        backend.generate("q")
+    cassette.close()
+
+    replay = CassetteBackend(_mock(), Cassette(path))
+    assert [replay.generate("q").content for _ in range(3)] == ["first:q", "second:q", "first:q"]
+
+
+def test_streams_and_batches_are_recorded(tmp_path):
+    path = str(tmp_path / "stream.jsonl")
+    recorder = CassetteBackend(_mock(), Cassette(path, mode="record"))
+
+    async def collect(backend):
+        return [c.content async for c in backend.generate_stream("one two three")]
+
+    chunks = asyncio.run(collect(recorder))
+    recorder.generate_batch(["p1", "p2"])
+    recorder.cassette.close()
+
+    live = _mock()
+    replay = CassetteBackend(live, Cassette(path))
+    assert asyncio.run(collect(replay)) == chunks
+    assert [r.content for r in replay.generate_batch(["p1", "p2"])] == ["live:p1", "live:p2"]
+    assert live.stats["requests"] == 0
+
+
+def test_langchain_cassette_replays_llm_calls(tmp_path):
+    path = str(tmp_path / "lc.jsonl")
+    params = {"temperature": 0.7}
+    responses = ["recorded", "live"]
+    recorder = FakeListChatModel(
+        responses=responses, cache=LangChainCassette(Cassette(path, mode="record"), "ollama", "m", params))
+    assert recorder.invoke("hello").content == "recorded"
+    recorder.cache.cassette.close()
+
+    replayer = FakeListChatModel(
+        responses=responses, cache=LangChainCassette(Cassette(path), "ollama", "m", params))
+    assert replayer.invoke("hello").content == "recorded"
+    assert replayer.i == 0  # 未调用底层模型
+    with pytest.raises(CassetteMiss):
+        replayer.invoke("unknown")
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+from pydantic import ValidationError
+
+from src.utils.config_registry import ConfigRegistry
+
+MODELS_YAML = """
+active_model: "{active}"
+active_backend: "ollama"
+models:
+  small:
+    name: "Small"
+    model_id: "small"
+    supported_backends: ["ollama"]
+    backend_repos:
+      ollama: "small:latest"
+    parameters:
+      temperature: 0
+"""
+
+
+def _write(path, active: str, mtime: float):
+    path.write_text(MODELS_YAML.format(active=active), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_parses_once_and_validates(tmp_path):
+    path = tmp_path / "models.yaml"
+    _write(path, "small", 1_000_000)
+    registry = ConfigRegistry(str(path), check_interval=0)
+    for _ in range(100):
+        assert registry.config.active_model == "small"
+    assert registry.reloads == 1
+    assert registry.config.models["small"].backend_repos["ollama"] == "small:latest"
+
+
+def test_mtime_change_hot_swaps_active_model(tmp_path):
+    path = tmp_path / "models.yaml"
+    _write(path, "small", 1_000_000)
+    registry = ConfigRegistry(str(path), check_interval=0)
+    assert registry.config.active_model == "small"
+
+    _write(path, "large", 1_000_100)
+    assert registry.config.active_model == "large"
+    assert registry.reloads == 2
+
+
+def test_check_interval_throttles_stat(tmp_path):
+    path = tmp_path / "models.yaml"
+    _write(path, "small", 1_000_000)
+    registry = ConfigRegistry(str(path), check_interval=3600)
+    registry.config
+    _write(path, "large", 1_000_100)
+    assert registry.config.active_model == "small"
+    assert registry.reload().active_model == "large"
+
+
+def test_broken_edit_keeps_last_good_config(tmp_path):
+    path = tmp_path / "models.yaml"
+    _write(path, "small", 1_000_000)
+    registry = ConfigRegistry(str(path), check_interval=0)
+    registry.config
+    path.write_text("models: [not, a, mapping", encoding="utf-8")
+    os.utime(path, (1_000_100, 1_000_100))
+    assert registry.config.active_model == "small"
+
+
+def test_invalid_model_entry_is_rejected(tmp_path):
+    path = tmp_path / "models.yaml"
+    path.write_text("models:\n  broken:\n    supported_backends: [ollama]\n", encoding="utf-8")
+    with pytest.raises(ValidationError):
+        ConfigRegistry(str(path)).config
@@ -0,0 +1,102 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src.utils.context_window import ContextGuard, ContextOverflowError, context_length
+from src.utils.tokenizer import HeuristicEncoder, TokenizerService, tokenizer_service
+
+
+def test_heuristic_encoder_round_trip():
+    encoder = HeuristicEncoder()
+    text = "Python 创建于 1991 年, by Guido van Rossum!"
+    tokens = encoder.encode(text)
+    assert encoder.decode(tokens) == text
+    assert encoder.count(text) == len(tokens)
+    assert encoder.count("你好世界") == 4
+
+
+def test_service_caches_encoders_and_falls_back(monkeypatch):
+    service = TokenizerService()
+    assert service.get_encoder("qwen2.5:3b") is service.get_encoder("qwen3:4b")
+    monkeypatch.setattr(service, "encoding_for", lambda model=None: "nonexistent")
+    assert isinstance(service.get_encoder("x"), HeuristicEncoder)
+
+
+def test_truncate_modes():
+    text = " ".join(f"w{i}" for i in range(100))
+    assert tokenizer_service.truncate(text, 10).startswith("w0 w1")
+    assert tokenizer_service.truncate(text, 10, keep="tail").endswith("w99")
+    middle = tokenizer_service.truncate(text, 12, keep="middle")
+    assert middle.startswith("w0") and middle.endswith("w99") and "…" in middle
+    assert tokenizer_service.count(middle) <= 13
+
+
+def test_context_length_resolution():
+    assert context_length({"ollama_specific": {"num_ctx": 2048}}) == 2048
+    assert context_length({"vllm_specific": {"max_model_len": 32768}}) == 32768
+    assert context_length({"ollama_specific": {"num_ctx": 2048}}, {"num_ctx": 4096}) == 4096
+    assert context_length({}) == 2048
+
+
+def test_reserve_covers_model_max_tokens():
+    vllm = {"vllm_specific": {"max_model_len": 32768}}
+    guard = ContextGuard.from_config("m", {"reserve_tokens": 512}, vllm, {"max_tokens": 2048})
+    assert guard.reserve_tokens == 2048
+    assert guard.budget == 30720
+    # reserve_tokens 更大时保留配置值；Ollama 只认 num_predict
+    assert ContextGuard.from_config("m", {"reserve_tokens": 4096}, vllm, {"max_tokens": 2048}).budget == 28672
+    ollama = {"ollama_specific": {"num_ctx": 2048}}
+    assert ContextGuard.from_config("m", {}, ollama, {"max_tokens": 2048}).reserve_tokens == 512
+    assert ContextGuard.from_config("m", {}, ollama, {"num_predict": 1024}).reserve_tokens == 1024
+    # 预留不超过上下文长度
+    assert ContextGuard.from_config("m", {}, vllm, {"max_tokens": 65536}).budget == 0
+
+
+def conversation(turns=20):
+    messages = [SystemMessage(content="You are helpful.")]
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i} " + "lorem ipsum " * 10))
+        messages.append(AIMessage(content=f"answer {i} " + "dolor sit amet " * 10))
+    messages.append(HumanMessage(content="final question"))
+    return messages
+
+
+def test_truncate_oldest_keeps_system_and_latest():
+    guard = ContextGuard("m", context_length=300, reserve_tokens=100)
+    messages = conversation()
+    fitted = guard.fit(messages)
+    assert guard.count(fitted) <= guard.budget
+    assert isinstance(fitted[0], SystemMessage)
+    assert fitted[-1].content == "final question"
+    assert fitted[-2].content.startswith("answer 19")
+    assert guard.get_stats()["truncated"] == 1
+
+
+def test_compress_and_reject():
+    long_prompt = [HumanMessage(content="start " + "filler text " * 500 + "end")]
+    guard = ContextGuard("m", context_length=200, reserve_tokens=50, policy="compress")
+    fitted = guard.fit(long_prompt)
+    assert guard.count(fitted) <= guard.budget
+    assert fitted[0].content.startswith("start") and fitted[0].content.endswith("end")
+
+    strict = ContextGuard("m", context_length=200, reserve_tokens=50, policy="reject")
+    with pytest.raises(ContextOverflowError):
+        strict.fit(long_prompt)
+    assert strict.fit([HumanMessage(content="short")])[0].content == "short"
+    assert strict.get_stats()["rejected"] == 1
+
+
+def test_guarded_chat_model_trims_before_dispatch():
+    from src.utils.langchain_adapters import context_guarded_chat_model
+
+    seen = []
+
+    class Recording(FakeListChatModel):
+        def _call(self, messages, *args, **kwargs):
+            seen.append(messages)
+            return super()._call(messages, *args, **kwargs)
+
+    guard = ContextGuard("m", context_length=300, reserve_tokens=100)
+    llm = context_guarded_chat_model(Recording, guard)(responses=["ok"])
+    assert llm.invoke(conversation()).content == "ok"
+    assert guard.count(seen[0]) <= guard.budget
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from src.agents.patterns.rag import Document, SimpleVectorStore
+from src.utils.embeddings import HashingEmbedder, LangChainEmbedder
+from src.utils.vector_index import DenseIndex, top_k_rows
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dim=64)
+    a, b = embedder.embed_documents(["machine learning", "machine learning"])
+    assert a.dtype == np.float32 and a.shape == (64,)
+    assert np.array_equal(a, b)
+    assert np.linalg.norm(a) == pytest.approx(1.0)
+    assert np.array_equal(HashingEmbedder(dim=64).embed_query("machine learning"), a)
+
+
+def test_top_k_rows_sorted_descending():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.4, 0.3, 0.2, 0.1]], dtype=np.float32)
+    columns, selected = top_k_rows(scores, 2)
+    assert columns.tolist() == [[1, 3], [0, 1]]
+    assert selected[0].tolist() == pytest.approx([0.9, 0.7])
+    assert top_k_rows(scores, 10)[0].tolist() == [[1, 3, 2, 0], [0, 1, 2, 3]]
+
+
+def test_dense_index_grows_and_compacts_on_delete():
+    index = DenseIndex(initial_capacity=2)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(5, 8)).astype(np.float32)
+    index.add_batch([f"d{i}" for i in range(5)], vectors)
+    assert index.get_stats()["capacity"] >= 5
+    assert index.search(vectors[3], 1)[0][0] == "d3"
+    assert index.remove("d1") and not index.remove("d1")
+    assert len(index) == 4 and set(index.ids) == {"d0", "d2", "d3", "d4"}
+    assert index.rows[index.ids[1]] == 1
+    assert index.search(vectors[4], 1)[0] == ("d4", pytest.approx(1.0))
+    with pytest.raises(ValueError):
+        index.add("bad", np.ones(3))
+
+
+def test_batch_search_matches_single_queries():
+    index = DenseIndex()
+    rng = np.random.default_rng(1)
+    index.add_batch([str(i) for i in range(100)], rng.normal(size=(100, 16)))
+    queries = rng.normal(size=(4, 16))
+    batch = index.search_batch(queries, 5)
+    for query, hits in zip(queries, batch):
+        assert [d for d, _ in hits] == [d for d, _ in index.search(query, 5)]
+        exact = np.argsort(-(index.vectors @ (query / np.linalg.norm(query))))[:5]
+        assert [d for d, _ in hits] == [index.ids[i] for i in exact]
+
+
+def test_vector_store_dense_mode():
+    store = SimpleVectorStore(search_mode="dense")
+    store.add_documents([
+        Document(id="py", content="Python is a high level programming language"),
+        Document(id="ml", content="machine learning learns from data"),
+        Document(id="given", content="ignored", embedding=[0.0] * 255 + [1.0]),
+    ])
+    assert store.search("programming language python", top_k=1)[0].document.id == "py"
+    first, second = store.search_batch(["python", "machine learning data"], top_k=1)
+    assert first[0].document.id == "py" and second[0].document.id == "ml"
+    assert store.search("python", mode="keyword")[0].document.id == "py"
+    store.delete_document("py")
+    assert all(r.document.id != "py" for r in store.search("python programming", top_k=5))
+
+
+def test_overwrite_without_embedding_drops_old_vector():
+    store = SimpleVectorStore(search_mode="keyword")
+    store.add_documents([Document(id="a", content="old", embedding=[1.0, 0.0])])
+    assert len(store.dense_index) == 1
+    store.add_documents([Document(id="a", content="new")])
+    assert len(store.dense_index) == 0
+    assert store.get_document("a").content == "new"
+
+
+def test_langchain_embedder_wraps_embeddings():
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            return [[float(len(t)), 1.0] for t in texts]
+
+        def embed_query(self, text):
+            return [float(len(text)), 1.0]
+
+    embedder = LangChainEmbedder(FakeEmbeddings())
+    assert embedder.embed_documents(["ab", "abc"]).shape == (2, 2)
+    assert embedder.embed_query("ab").tolist() == [2.0, 1.0]
+    assert embedder.dim == 2
@@ -0,0 +1,102 @@
+import time
+from typing import Any, Dict, List
+
+from src.backends.base import ModelBackend, ModelResponse
+from src.utils.backend_manager import BackendManager
+from src.utils.health_monitor import HealthMonitor
+
+
+class SlowProbeBackend(ModelBackend):
+    """探活耗时可控的测试后端"""
+
+    def __init__(self, delay: float, available: bool = True):
+        self.delay = delay
+        self.available = available
+
+    def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
+        return True
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        return ModelResponse(content=prompt)
+
+    async def generate_stream(self, prompt: str, **kwargs):
+        yield ModelResponse(content=prompt)
+
+    def is_available(self) -> bool:
+        time.sleep(self.delay)
+        return self.available
+
+    def get_model_info(self, model_id: str) -> Dict[str, Any]:
+        return {}
+
+    def list_loaded_models(self) -> List[str]:
+        return []
+
+
+def test_probes_run_concurrently():
+    backends = {f"b{i}": SlowProbeBackend(0.2) for i in range(4)}
+    monitor = HealthMonitor(backends, probe_timeout=2)
+    start = time.time()
+    status = monitor.refresh()
+    assert time.time() - start < 0.6
+    assert all(s.available for s in status.values())
+    assert all(s.latency >= 0.2 for s in status.values())
+    monitor.stop()
+
+
+def test_dead_host_does_not_block_status():
+    backends = {"ok": SlowProbeBackend(0), "dead": SlowProbeBackend(1.0)}
+    monitor = HealthMonitor(backends, probe_timeout=0.1)
+    start = time.time()
+    status = monitor.refresh()
+    assert time.time() - start < 0.5
+    assert status["ok"].available is True
+    assert status["dead"].available is False
+    assert status["dead"].error == "probe timeout"
+    monitor.stop()
+
+
+def test_late_probe_result_is_not_counted_twice():
+    backends = {"slow": SlowProbeBackend(0.3, available=False)}
+    monitor = HealthMonitor(backends, probe_timeout=0.05)
+    assert monitor.refresh()["slow"].error == "probe timeout"
+    time.sleep(0.5)
+    status = monitor.get_status("slow")
+    assert status.error is None and status.available is False
+    assert status.probes == 1 and status.consecutive_failures == 1
+    monitor.stop()
+
+
+def test_cached_status_and_histogram():
+    backends = {"down": SlowProbeBackend(0, available=False)}
+    monitor = HealthMonitor(backends, interval=0.05)
+    assert monitor.get_status("down").available is None
+    monitor.start()
+    time.sleep(0.2)
+    snapshot = monitor.snapshot()["down"]
+    monitor.stop()
+    assert snapshot["available"] is False
+    assert snapshot["consecutive_failures"] >= 2
+    assert sum(snapshot["latency_histogram"].values()) == snapshot["probes"]
+
+
+def test_probes_only_selected_targets():
+    backends = {"built": SlowProbeBackend(0), "idle": SlowProbeBackend(0)}
+    monitor = HealthMonitor(backends, targets=lambda: ["built", "unknown"])
+    status = monitor.refresh()
+    monitor.stop()
+    assert status["built"].available is True
+    assert status["idle"].available is None
+
+
+def test_manager_health_does_not_build_idle_backends():
+    manager = BackendManager()
+    try:
+        assert manager.switch_backend("mock")
+        manager.health.refresh()
+        # 只探测已构建的后端与激活后端，vLLM 既未构建也未激活
+        assert "vllm" not in manager._backends.loaded()
+        assert manager.list_backends()["vllm"]["available"] is None
+        assert manager.list_backends()["mock"]["available"] is True
+    finally:
+        manager.close()
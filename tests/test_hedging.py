@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from src.backends.hedging import HedgePolicy, LatencyTracker
+from src.backends.vllm_backend import VLLMBackend
+
+
+def _backend(urls, **hedging) -> VLLMBackend:
+    return VLLMBackend({
+        "connection": {"host": urls[0], "endpoints": urls, "timeout": 5},
+        "load_balancing": {"health_check_interval": 0},
+        "hedging": {"enabled": True, "initial_delay": 0.05, **hedging},
+    })
+
+
+def test_latency_tracker_percentiles_and_histogram():
+    tracker = LatencyTracker(window=100)
+    for i in range(1, 101):
+        tracker.observe(i / 100)
+    assert tracker.percentile(50) == 0.5
+    assert tracker.percentile(95) == 0.95
+    stats = tracker.to_dict()
+    assert stats["count"] == 100
+    assert sum(stats["histogram"].values()) == 100
+
+
+def test_hedge_delay_follows_recent_percentile():
+    policy = HedgePolicy(enabled=True, percentile=90, min_samples=10, initial_delay=2.0, min_delay=0.01)
+    assert policy.delay("generate") == 2.0
+    for i in range(1, 11):
+        policy.observe("generate", i / 10)
+    assert policy.delay("generate") == 0.9
+    assert HedgePolicy(min_samples=1, min_delay=0.5).delay("x") == 1.0
+
+
+def test_sync_hedge_beats_slow_replica(vllm_stubs):
+    vllm_stubs[0].delay = 0.6
+    backend = _backend([s.url for s in vllm_stubs])
+    try:
+        start = time.perf_counter()
+        replies = [backend.generate("hi").content for _ in range(4)]
+        elapsed = time.perf_counter() - start
+        stats = backend.get_model_info("m")["hedging"]
+    finally:
+        backend.close()
+    assert set(replies) == {"replica-1"}
+    assert elapsed < 0.6 * 2
+    assert stats["hedged"] >= 1 and stats["hedge_wins"] >= 1
+    assert stats["latency"]["generate"]["count"] == 4
+
+
+def test_async_hedge_cancels_loser(vllm_stubs):
+    vllm_stubs[0].delay = 0.6
+    backend = _backend([s.url for s in vllm_stubs])
+
+    async def run():
+        return await asyncio.gather(*(backend.agenerate(f"q{i}") for i in range(4)))
+
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        stats = backend.get_model_info("m")["hedging"]
+        outstanding = [e["outstanding"] for e in backend.get_model_info("m")["endpoints"]]
+    finally:
+        backend.close()
+    assert {r.content for r in results} == {"replica-1"}
+    assert elapsed < 0.5
+    assert stats["cancelled"] == stats["hedged"] >= 1
+    assert outstanding == [0, 0]
+
+
+def test_stream_hedges_on_first_token(vllm_stubs):
+    vllm_stubs[0].delay = 0.6
+    backend = _backend([s.url for s in vllm_stubs])
+
+    async def run():
+        replies = []
+        for _ in range(2):
+            replies.append("".join([c.content async for c in backend.generate_stream("hi")]).strip())
+        return replies
+
+    try:
+        start = time.perf_counter()
+        replies = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+    finally:
+        backend.close()
+    assert replies == ["replica-1", "replica-1"]
+    assert elapsed < 0.6
+
+
+def test_hedging_is_opt_in(vllm_stubs):
+    vllm_stubs[0].delay = 0.3
+    backend = _backend([s.url for s in vllm_stubs], enabled=False)
+    try:
+        for _ in range(2):
+            backend.generate("hi")
+        assert backend.generate("hi", hedge=True).content == "replica-1"
+        stats = backend.get_model_info("m")["hedging"]
+    finally:
+        backend.close()
+    assert stats["requests"] == 1
+    assert stats["latency"]["generate"]["count"] == 3
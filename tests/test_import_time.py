@@ -0,0 +1,61 @@
+"""
+导入耗时预算
+
+用 `python -X importtime` 在独立进程中导入每个模式模块，检查：
+1. 后端客户端库（ollama/aiohttp）及 langchain 后端适配器不会在导入期被加载
+2. 模块累计导入耗时不超过预算
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATTERNS = [
+    'chaining', 'routing', 'parallelization', 'reflection',
+    'tool_use', 'planning', 'multi_agent', 'memory',
+    'learning', 'mcp', 'goal_setting', 'exception_handling',
+    'human_in_loop', 'rag', 'a2a', 'reasoning',
+    'guardrails', 'evaluation', 'prioritization', 'exploration'
+]
+
+# 导入期不应加载的重量级依赖（应在首次使用后端时才导入）
+# requests 不在此列：langchain_core 自身在导入期依赖它
+DEFERRED_MODULES = {"ollama", "aiohttp", "langchain_ollama", "langchain_openai"}
+
+# 单个模式模块的累计导入耗时预算（微秒）
+IMPORT_BUDGET_US = 2_500_000
+
+
+def _importtime(module: str):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120,
+    )
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            timings[name.strip()] = int(cumulative.strip())
+        except ValueError:
+            continue  # 表头行
+    return proc, timings
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_pattern_import_budget(pattern):
+    module = f"src.agents.patterns.{pattern}"
+    proc, timings = _importtime(module)
+    if proc.returncode != 0:
+        pytest.skip(f"{module} 无法导入: {proc.stderr.strip().splitlines()[-1]}")
+
+    loaded_early = DEFERRED_MODULES & set(timings)
+    assert not loaded_early, f"{module} 在导入期加载了 {sorted(loaded_early)}"
+    assert timings[module] <= IMPORT_BUDGET_US, (
+        f"{module} 导入耗时 {timings[module] / 1000:.0f}ms 超出预算 {IMPORT_BUDGET_US / 1000:.0f}ms"
+    )
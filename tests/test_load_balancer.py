@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+from src.backends.load_balancer import EndpointPool
+from src.backends.vllm_backend import VLLMBackend
+
+
+def _backend(urls, **load_balancing) -> VLLMBackend:
+    return VLLMBackend({
+        "connection": {"host": urls[0], "endpoints": urls, "timeout": 5},
+        "load_balancing": {"health_check_interval": 0, **load_balancing},
+    })
+
+
+def test_least_outstanding_spreads_concurrent_requests(vllm_stubs):
+    for stub in vllm_stubs:
+        stub.delay = 0.1
+    backend = _backend([s.url for s in vllm_stubs])
+
+    async def run():
+        return await asyncio.gather(*(backend.agenerate(f"q{i}") for i in range(6)))
+
+    try:
+        asyncio.run(run())
+    finally:
+        backend.close()
+    assert [len(s.requests) for s in vllm_stubs] == [3, 3]
+
+
+def test_token_weighted_prefers_lighter_endpoint():
+    pool = EndpointPool(["http://a", "http://b"], policy="token_weighted")
+    heavy = pool.endpoints[0]
+    with pool.track(heavy, cost=1000):
+        with pool.track(pool.endpoints[1], cost=10):
+            assert pool.select().url == "http://b"
+
+
+def test_failover_ejects_and_retries_on_other_replica(vllm_stubs):
+    vllm_stubs[0].failing = True
+    backend = _backend([s.url for s in vllm_stubs])
+    try:
+        replies = {backend.generate("hi").content for _ in range(4)}
+        stats = {e["url"]: e for e in backend.get_model_info("m")["endpoints"]}
+    finally:
+        backend.close()
+
+    assert replies == {"replica-1"}
+    assert stats[vllm_stubs[0].url]["healthy"] is False
+    # 被摘除后不再接收新请求
+    assert len(vllm_stubs[0].requests) == 1
+
+
+def test_stream_fails_over_before_first_token(vllm_stubs):
+    vllm_stubs[0].failing = True
+    backend = _backend([s.url for s in vllm_stubs])
+
+    async def run():
+        return "".join([c.content async for c in backend.generate_stream("hi")]).strip()
+
+    try:
+        assert asyncio.run(run()) == "replica-1"
+    finally:
+        backend.close()
+
+
+def test_background_probe_readmits_recovered_replica(vllm_stubs):
+    backend = _backend([s.url for s in vllm_stubs], health_check_interval=0.05)
+    try:
+        vllm_stubs[0].healthy = False
+        backend.generate("warm up")  # 首次请求启动后台探测
+        deadline = time.time() + 2
+        while backend._pool.endpoints[0].healthy and time.time() < deadline:
+            time.sleep(0.02)
+        assert not backend._pool.endpoints[0].healthy
+
+        vllm_stubs[0].healthy = True
+        deadline = time.time() + 2
+        while not backend._pool.endpoints[0].healthy and time.time() < deadline:
+            time.sleep(0.02)
+        assert backend._pool.endpoints[0].healthy
+    finally:
+        backend.close()
@@ -0,0 +1,84 @@
+from src.agents.patterns.rag import Document, PersistentVectorStore, Retriever, SimpleVectorStore
+from src.utils.bm25 import BM25Index
+from src.utils.embeddings import HashingEmbedder
+from src.utils.metadata_index import MetadataIndex, filter_candidates
+
+
+def corpus(n=200):
+    # 绝大多数文档来自 web，且与查询更相关；少数来自 manual
+    docs = [Document(id=f"web{i}", content="python python python tutorial", metadata={"source": "web", "chunk_index": i})
+            for i in range(n)]
+    docs += [Document(id=f"man{i}", content=f"python reference chapter {i}",
+                      metadata={"source": "manual", "chunk_index": i, "lang": "en"}) for i in range(5)]
+    return docs
+
+
+def test_metadata_index_intersection_and_updates():
+    index = MetadataIndex()
+    index.add("a", {"source": "web", "topic": "ai"})
+    index.add("b", {"source": "web", "topic": "db", "tags": ["x"]})
+    index.add("c", {"source": "manual", "topic": "ai"})
+    assert index.lookup([("source", "web"), ("topic", "ai")]) == {"a"}
+    index.add("a", {"source": "manual", "topic": "ai"})
+    assert index.lookup([("source", "manual")]) == {"a", "c"}
+    assert index.remove("c") and not index.remove("c")
+    assert index.get_stats() == {"documents": 2, "fields": {"source": 2, "topic": 2, "chunk_index": 0}}
+    indexed, residual = index.split({"source": "web", "tags": ["x"], "lang": "en"})
+    assert indexed == [("source", "web")] and residual == {"tags": ["x"], "lang": "en"}
+
+
+def test_bm25_scores_only_candidates():
+    index = BM25Index()
+    for i in range(10):
+        index.add(str(i), "alpha beta" if i % 2 else "alpha")
+    assert set(index.scores("alpha", {"1", "2", "99"})) == {"1", "2"}
+    assert index.search("beta", 5, candidates={"1", "2"}) == [("1", index.scores("beta")["1"])]
+
+
+def test_filtered_keyword_search_returns_exactly_k():
+    store = SimpleVectorStore()
+    store.add_documents(corpus())
+    retriever = Retriever(store, top_k=3)
+    results = retriever.retrieve("python", filters={"source": "manual"})
+    assert len(results) == 3
+    assert all(r.document.metadata["source"] == "manual" for r in results)
+    assert [r.rank for r in results] == [1, 2, 3]
+    # 未建索引的字段作为剩余条件检查
+    assert len(retriever.retrieve("python", filters={"lang": "en"})) == 3
+    assert retriever.retrieve("python", filters={"source": "manual", "chunk_index": 4})[0].document.id == "man4"
+    assert retriever.retrieve("python", filters={"source": "missing"}) == []
+
+
+def test_filtered_dense_search_and_candidates():
+    store = SimpleVectorStore(search_mode="dense", embedder=HashingEmbedder(dim=64))
+    store.add_documents(corpus())
+    results = store.search("python tutorial", top_k=4, filters={"source": "manual"})
+    assert len(results) == 4 and all(r.document.id.startswith("man") for r in results)
+    assert filter_candidates(store.metadata_index, {"source": "manual", "lang": "en"}, store.documents) == \
+        {f"man{i}" for i in range(5)}
+    store.delete_document("man0")
+    assert len(store.search("python", top_k=10, filters={"source": "manual"})) == 4
+
+
+def test_persistent_store_builds_metadata_index_lazily(tmp_path):
+    store = PersistentVectorStore(tmp_path, embedder=HashingEmbedder(dim=64))
+    store.add_documents(corpus(20))
+    store.checkpoint()
+    store.add_document(Document(id="man9", content="python appendix", metadata={"source": "manual"}))
+    assert store.get_storage_stats()["indexes_built"] == []
+    results = store.search("python", top_k=10, filters={"source": "manual"})
+    assert {r.document.id for r in results} == {f"man{i}" for i in range(5)} | {"man9"}
+    assert store.get_storage_stats()["indexes_built"] == ["metadata_index"]
+    store.delete_document("man9")
+    assert len(store.search("python", top_k=10, filters={"source": "manual"})) == 5
+
+
+def test_none_filter_matches_documents_missing_the_field():
+    store = SimpleVectorStore()
+    store.add_documents(corpus(3))
+    store.add_document(Document(id="bare", content="python notes", metadata={}))
+    # 与无索引时的语义一致：metadata.get("source") == None 命中缺少 source 的文档
+    results = Retriever(store, top_k=5).retrieve("python", filters={"source": None})
+    assert [r.document.id for r in results] == ["bare"]
+    assert filter_candidates(store.metadata_index, {"topic": None, "source": "manual"}, store.documents) == \
+        {f"man{i}" for i in range(5)}
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+import src.utils.model_loader as model_loader_module
+from src.backends.mock_backend import MockBackend, MockBackendError
+from src.utils.backend_manager import BackendManager
+from src.utils.model_loader import ModelLoader
+
+
+def _mock(**options) -> MockBackend:
+    return MockBackend({"mock": {"seed": 7, "latency": {"distribution": "fixed", "mean": 0.0}, **options}})
+
+
+def test_latency_is_deterministic_per_seed():
+    options = {"latency": {"distribution": "lognormal", "mean": 0.02, "stddev": 0.01}}
+    a, b = _mock(**options), _mock(**options)
+    prompts = ["x", "y", "x", "z"]
+    ttfts_a = [a.generate(p).time_to_first_token for p in prompts]
+    ttfts_b = [b.generate(p).time_to_first_token for p in reversed(prompts)]
+    assert ttfts_a[0] != ttfts_a[2]  # 同一提示第二次出现使用新的随机数
+    assert sorted(ttfts_a) == sorted(ttfts_b)
+
+
+def test_echo_and_script_responses():
+    assert _mock(echo_prefix="> ").generate("hello world").content == "> hello world"
+    scripted = _mock(mode="script", script=[{"match": "flight", "response": "booking"}], default_response="?")
+    assert scripted.generate("I want to book a flight").content == "booking"
+    assert scripted.generate("weather").content == "?"
+
+
+def test_stream_follows_tokens_per_second():
+    backend = _mock(latency={"distribution": "fixed", "mean": 0.05}, tokens_per_second=100)
+
+    async def run():
+        return [c async for c in backend.generate_stream("a b c d e f")]
+
+    start = time.perf_counter()
+    chunks = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert "".join(c.content for c in chunks) == "a b c d e f"
+    assert chunks[0].time_to_first_token >= 0.05
+    assert 0.05 + 5 * 0.01 <= elapsed < 0.5
+
+
+def test_error_rate_and_stats():
+    backend = _mock(error_rate=1.0)
+    with pytest.raises(MockBackendError):
+        backend.generate("boom")
+    assert backend.get_model_info("m")["stats"]["errors"] == 1
+    assert backend.stats["in_flight"] == 0
+
+
+def test_concurrency_cap_queues_requests():
+    backend = _mock(latency={"distribution": "fixed", "mean": 0.05}, max_concurrent=2)
+
+    async def run():
+        return await asyncio.gather(*(backend.agenerate(f"q{i}") for i in range(6)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert backend.stats["peak_in_flight"] == 2
+    assert time.perf_counter() - start >= 0.15
+
+
+def test_load_llm_with_mock_backend(monkeypatch):
+    manager = BackendManager()
+    assert manager.switch_backend("mock")
+    monkeypatch.setattr(model_loader_module, "backend_manager", manager)
+    try:
+        llm = ModelLoader().load_llm("qwen3:4b")
+        assert llm.invoke("hello").content == "[mock] hello"
+
+        async def stream():
+            return "".join([c.content async for c in llm.astream("hi there")])
+
+        assert asyncio.run(stream()) == "[mock] hi there"
+    finally:
+        manager.close()
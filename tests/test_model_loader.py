@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+import src.utils.model_loader as model_loader_module
+from src.utils.model_loader import ModelLoader
+
+
+class CountingBackend:
+    """只记录 load_model 调用次数的后端替身"""
+
+    base_url = "http://localhost:11434"
+
+    def __init__(self):
+        self.loads = 0
+
+    def load_model(self, model_id, config):
+        self.loads += 1
+        return True
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    backend = CountingBackend()
+    manager = SimpleNamespace(active_backend=backend, active_backend_name="ollama",
+                              response_cache=None, cassette=None,
+                              get_admission=lambda name: None, get_singleflight=lambda name: None,
+                              get_residency=lambda name: None, get_rate_limiter=lambda name: None,
+                              get_backend_config=lambda name: {})
+    monkeypatch.setattr(model_loader_module, "backend_manager", manager)
+    return ModelLoader(), backend
+
+
+def test_agents_share_pooled_llm(loader):
+    model_loader, backend = loader
+    llms = [model_loader.load_llm() for _ in range(20)]
+    assert all(llm is llms[0] for llm in llms)
+    assert backend.loads == 1
+    assert model_loader.pool_stats == {"hits": 19, "misses": 1, "verifications": 1}
+
+
+def test_distinct_models_get_distinct_clients(loader):
+    model_loader, backend = loader
+    a = model_loader.load_llm("qwen3:4b")
+    b = model_loader.load_llm("qwen2.5:3b")
+    assert a is not b
+    assert backend.loads == 2
+
+
+def test_evict_forces_reverification(loader):
+    model_loader, backend = loader
+    first = model_loader.load_llm("qwen3:4b")
+    model_loader.load_llm("qwen2.5:3b")
+    assert model_loader.evict("qwen3:4b") == 1
+    assert model_loader.load_llm("qwen3:4b") is not first
+    assert backend.loads == 3
+    assert model_loader.evict() == 2
+
+
+def test_warmup_reports_construction_time(loader):
+    model_loader, backend = loader
+    timings = model_loader.warmup(["qwen3:4b"])
+    assert set(timings) == {"qwen3:4b"} and timings["qwen3:4b"] >= 0
+    assert model_loader.pool_stats["misses"] == 1
+    model_loader.load_llm("qwen3:4b")
+    assert model_loader.pool_stats["hits"] == 1
+
+
+def test_concurrent_misses_share_one_pull_outside_pool_lock(loader):
+    import threading
+    import time
+
+    model_loader, backend = loader
+    pulling = threading.Event()
+
+    def slow_pull(model_id, config):
+        backend.loads += 1
+        pulling.set()
+        time.sleep(0.5)
+        return True
+
+    model_loader.load_llm("qwen2.5:3b")
+    backend.load_model = slow_pull
+    threads = [threading.Thread(target=model_loader.load_llm, args=("qwen3:4b",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert pulling.wait(timeout=5)
+    start = time.perf_counter()
+    model_loader.load_llm("qwen2.5:3b")
+    assert time.perf_counter() - start < 0.2
+    for thread in threads:
+        thread.join()
+    assert backend.loads == 2
+    assert model_loader.pool_stats["verifications"] == 2
+    assert len({id(model_loader.load_llm("qwen3:4b")) for _ in range(3)}) == 1
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import ollama
+import pytest
+
+from src.backends.ollama_backend import OllamaBackend
+
+
+def _backend(url: str = "http://127.0.0.1:9") -> OllamaBackend:
+    return OllamaBackend({"connection": {"host": url, "health_check_timeout": 0.5}})
+
+
+async def _client(backend):
+    return backend._get_async_client()
+
+
+@pytest.fixture
+def closed_on(monkeypatch):
+    """记录 AsyncClient.close() 被调用时所在的事件循环"""
+    loops = {}
+
+    async def close(self):
+        loops[id(self)] = asyncio.get_running_loop()
+
+    monkeypatch.setattr(ollama.AsyncClient, "close", close, raising=False)
+    return loops
+
+
+def test_loop_change_closes_previous_client_on_its_loop(closed_on):
+    backend = _backend()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        old = asyncio.run_coroutine_threadsafe(_client(backend), loop).result(timeout=5)
+        # 在另一个循环上使用：重建客户端，旧客户端在其所属（仍在运行的）循环上关闭
+        new = asyncio.run(_client(backend))
+        assert new is not old
+        deadline = time.time() + 5
+        while id(old) not in closed_on and time.time() < deadline:
+            time.sleep(0.01)
+        assert closed_on[id(old)] is loop
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_aclose_releases_async_client(closed_on):
+    backend = _backend()
+
+    async def run():
+        client = backend._get_async_client()
+        await backend.aclose()
+        return client
+
+    client = asyncio.run(run())
+    assert id(client) in closed_on
+    assert backend._async_client is None
+
+
+def test_clients_without_close_are_dropped(monkeypatch):
+    # ollama<0.6 的 AsyncClient 没有 close()：循环变化时只丢弃旧客户端
+    monkeypatch.delattr(ollama.AsyncClient, "close", raising=False)
+    backend = _backend()
+    old = asyncio.run(_client(backend))
+    assert asyncio.run(_client(backend)) is not old
+    asyncio.run(backend.aclose())
+    assert backend._async_client is None
+
+
+def test_is_available_uses_health_endpoint(vllm_stub):
+    # 桩服务对未知路径返回 404，/health 返回 200
+    assert OllamaBackend({"connection": {"host": vllm_stub.url, "health_check_endpoint": "/health"}}).is_available()
+    assert not _backend().is_available()
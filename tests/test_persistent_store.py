@@ -0,0 +1,134 @@
+import multiprocessing
+import time
+
+import numpy as np
+
+from src.agents.patterns.rag import Document, PersistentVectorStore
+from src.utils.embeddings import HashingEmbedder
+from src.utils.mapped_store import MappedSnapshot, write_snapshot
+
+DOCS = [
+    ("py", "Python is a high level programming language", {"topic": "programming"}),
+    ("ml", "machine learning learns patterns from data", {"topic": "ai"}),
+    ("dl", "deep learning uses neural networks", {"topic": "ai"}),
+]
+
+
+def make_store(path):
+    store = PersistentVectorStore(path, embedder=HashingEmbedder(dim=64))
+    store.add_documents([Document(id=i, content=c, metadata=m) for i, c, m in DOCS])
+    return store
+
+
+def test_wal_replay_restores_documents_without_reembedding(tmp_path):
+    store = make_store(tmp_path)
+    store.delete_document("dl")
+    store.close()
+
+    class FailingEmbedder(HashingEmbedder):
+        def embed_documents(self, texts):
+            if len(texts) > 1:
+                raise AssertionError("corpus must not be re-embedded")
+            return super().embed_documents(texts)
+
+    reopened = PersistentVectorStore(tmp_path, embedder=FailingEmbedder(dim=64))
+    assert reopened.count() == 2 and reopened.get_document("dl") is None
+    assert reopened.get_document("ml").metadata == {"topic": "ai"}
+    assert reopened.search("python programming", top_k=1)[0].document.id == "py"
+    assert reopened.search("machine learning", top_k=1, mode="keyword")[0].document.id == "ml"
+
+
+def test_checkpoint_maps_snapshot_and_keeps_accepting_writes(tmp_path):
+    store = make_store(tmp_path)
+    assert store.checkpoint() == 3
+    assert store.get_storage_stats()["wal_bytes"] == 0
+    assert isinstance(store.snapshot.embeddings, np.memmap)
+    store.add_document(Document(id="rs", content="Rust guarantees memory safety"))
+    store.add_document(Document(id="py", content="Python snakes live in tropical forests"))
+    store.delete_document("ml")
+    store.close()
+
+    reopened = PersistentVectorStore(tmp_path, embedder=HashingEmbedder(dim=64))
+    assert reopened.snapshot.count == 3
+    assert sorted(reopened.documents) == ["dl", "py", "rs"]
+    assert "tropical" in reopened.get_document("py").content
+    assert reopened.search("memory safety", top_k=1)[0].document.id == "rs"
+    assert all(r.document.id != "ml" for r in reopened.search("machine learning data", top_k=5))
+    assert reopened.search("tropical forests", top_k=1)[0].document.id == "py"
+    assert reopened.get_storage_stats()["indexes_built"] == []
+    reopened.checkpoint()
+    assert reopened.snapshot.count == 3 and len(reopened.documents.overlay) == 0
+
+
+def test_torn_wal_tail_is_ignored(tmp_path):
+    make_store(tmp_path).close()
+    with open(tmp_path / "wal.jsonl", "ab") as f:
+        f.write(b'{"op": "add", "doc": {"id": "x"')
+    assert PersistentVectorStore(tmp_path, embedder=HashingEmbedder(dim=64)).count() == 3
+
+
+def test_open_is_independent_of_corpus_size(tmp_path):
+    rng = np.random.default_rng(0)
+    records = ({"id": str(i), "content": f"doc {i}", "embedding": v} for i, v in enumerate(rng.normal(size=(20000, 32))))
+    write_snapshot(tmp_path, records, 32)
+    start = time.perf_counter()
+    snapshot = MappedSnapshot(tmp_path)
+    assert time.perf_counter() - start < 0.05
+    assert snapshot.record(12345)["content"] == "doc 12345"
+    assert snapshot.embeddings.shape == (20000, 32)
+
+
+def _search_in_child(path, queue):
+    store = PersistentVectorStore(path, embedder=HashingEmbedder(dim=64))
+    queue.put(store.search("neural networks", top_k=1)[0].document.id)
+
+
+def test_worker_processes_share_store(tmp_path):
+    store = make_store(tmp_path)
+    store.checkpoint()
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_search_in_child, args=(str(tmp_path), queue))
+    process.start()
+    assert queue.get(timeout=60) == "dl"
+    process.join(timeout=60)
+
+
+def test_crash_during_checkpoint_keeps_previous_snapshot(tmp_path, monkeypatch):
+    import os
+
+    from src.utils import mapped_store
+
+    store = make_store(tmp_path)
+    store.checkpoint()
+    store.add_document(Document(id="rs", content="Rust guarantees memory safety"))
+    generation = mapped_store.current_generation(tmp_path)
+
+    real_replace = os.replace
+
+    def crash_on_pointer(src, dst):
+        if str(dst).endswith(mapped_store.CURRENT):
+            raise OSError("simulated crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(mapped_store.os, "replace", crash_on_pointer)
+    try:
+        store.checkpoint()
+    except OSError:
+        pass
+    monkeypatch.setattr(mapped_store.os, "replace", real_replace)
+    store.wal.close()
+
+    # 新一代已写完但 CURRENT 未切换：打开的仍是上一代快照 + WAL
+    assert mapped_store.current_generation(tmp_path) == generation
+    reopened = PersistentVectorStore(tmp_path, embedder=HashingEmbedder(dim=64))
+    assert reopened.snapshot.count == 3 and reopened.count() == 4
+    assert reopened.search("memory safety", top_k=1)[0].document.id == "rs"
+
+    # 中途崩溃遗留的暂存目录在下次 checkpoint 时清理
+    (tmp_path / "snapshots" / ".staging").mkdir()
+    (tmp_path / "snapshots" / ".staging" / "embeddings.f32").write_bytes(b"partial")
+    assert reopened.checkpoint() == 4
+    names = sorted(p.name for p in (tmp_path / "snapshots").iterdir())
+    assert names == [mapped_store.current_generation(tmp_path)]
+    assert PersistentVectorStore(tmp_path, embedder=HashingEmbedder(dim=64)).snapshot.count == 4
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from src.backends.mock_backend import MockBackend
+from src.backends.rate_limit import RateLimitedBackend, RateLimiter, TokenBucket, usage_tokens
+
+
+def test_token_bucket_refill_and_overdraft():
+    bucket = TokenBucket(rate=10, capacity=5)
+    assert bucket.wait_time(5, now=bucket._updated) == 0
+    bucket.consume(8, now=bucket._updated)  # 透支 3
+    assert bucket.wait_time(0, now=bucket._updated) == pytest.approx(0.3)
+    assert bucket.wait_time(1, now=bucket._updated + 0.2) == pytest.approx(0.2)
+
+
+def test_usage_tokens():
+    assert usage_tokens({"prompt_tokens": 3, "completion_tokens": 4}) == 7
+    assert usage_tokens({"input_tokens": 2, "output_tokens": 1, "total_tokens": 3}) == 3
+    assert usage_tokens(None) == 0
+
+
+def test_requests_wait_instead_of_rejecting():
+    # 每分钟 600 请求 = 10/s，容量 0.2 秒 = 2 个
+    limiter = RateLimiter("test", tenants={"*": {"requests_per_minute": 600}}, burst_seconds=0.2)
+    start = time.perf_counter()
+    for _ in range(4):
+        limiter.acquire("m", "team-a")
+    assert time.perf_counter() - start >= 0.15
+    stats = limiter.get_stats()["tenants"]["team-a"]
+    assert stats["requests"] == 4 and stats["throttled"] >= 1
+
+
+def test_tenants_have_separate_buckets():
+    limiter = RateLimiter("test", tenants={"*": {"requests_per_minute": 60}, "vip": {"requests_per_minute": 6000}},
+                          burst_seconds=1)
+    limiter.acquire("m", "a")
+    start = time.perf_counter()
+    limiter.acquire("m", "b")
+    for _ in range(10):
+        limiter.acquire("m", "vip")
+    assert time.perf_counter() - start < 0.1
+    assert set(limiter.get_stats()["tenants"]) == {"a", "b", "vip"}
+
+
+def test_backend_charges_usage_tokens_and_waits_async():
+    backend = MockBackend({"mock": {"mode": "echo"}})
+    # 20 token/s，容量 2；第一次响应用掉 10 个 token 后透支，下一个请求需要等待偿还
+    limiter = RateLimiter("mock", models={"*": {"tokens_per_minute": 60 * 20}}, burst_seconds=0.1)
+    limited = RateLimitedBackend(backend, limiter)
+
+    async def run():
+        await limited.agenerate("one two three four five", model="m", tenant="t")
+        start = time.perf_counter()
+        await limited.agenerate("again", model="m", tenant="t")
+        return time.perf_counter() - start
+
+    waited = asyncio.run(run())
+    stats = limiter.get_stats()["models"]["m"]
+    assert stats["tokens"] == 10 + 2
+    assert waited >= 0.2
+    assert limiter.get_stats()["tenants"] == {}  # 未配置租户限额
+
+
+def test_stream_without_usage_charges_prompt_estimate_and_chunks():
+    backend = MockBackend({"mock": {"mode": "echo"}})
+    limiter = RateLimiter("mock", models={"*": {"tokens_per_minute": 60000}})
+    limited = RateLimitedBackend(backend, limiter)
+
+    async def run():
+        return [c async for c in limited.generate_stream("a b c", model="m")]
+
+    assert len(asyncio.run(run())) == 3
+    # 未配置分词器：提示按约 4 字符一个 token 估算（"a b c" -> 2）
+    assert limiter.get_stats()["models"]["m"]["tokens"] == 2 + 3
+
+    limiter.count_tokens = lambda text, model: len(text.split())
+    asyncio.run(run())
+    assert limiter.get_stats()["models"]["m"]["tokens"] == 5 + 3 + 3
+
+
+def test_langchain_model_reads_tenant_from_metadata():
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from src.utils.langchain_adapters import rate_limited_chat_model
+
+    limiter = RateLimiter("test", tenants={"*": {"requests_per_minute": 600}})
+    llm = rate_limited_chat_model(FakeListChatModel, limiter)(responses=["hello"])
+    llm.invoke("hi", config={"metadata": {"tenant": "team-a"}})
+    llm.invoke("hi")
+    assert {k: v["requests"] for k, v in limiter.get_stats()["tenants"].items()} == {"team-a": 1, "default": 1}
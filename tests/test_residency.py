@@ -0,0 +1,180 @@
+import pytest
+
+from src.utils.residency import ResidencyManager, parse_size
+
+GB = 1024 ** 3
+
+
+class FakeOllama:
+    def __init__(self, resident=None):
+        self.loaded = dict(resident or {})
+        self.calls = []
+
+    def load_resident(self, model_id, keep_alive=None):
+        self.calls.append(("load", model_id, keep_alive))
+        self.loaded[model_id] = 0
+
+    def unload(self, model_id):
+        self.calls.append(("unload", model_id))
+        self.loaded.pop(model_id, None)
+
+    def list_resident(self):
+        return dict(self.loaded)
+
+
+def make_manager(backend, budget=10 * GB):
+    requirements = {"big": 6 * GB, "small": 4 * GB, "other": 4 * GB}
+    return ResidencyManager(backend, budget, requirements, keep_alive="30m")
+
+
+def test_parse_size():
+    assert parse_size("6GB") == 6 * GB
+    assert parse_size("512MB") == 512 * 1024 ** 2
+    assert parse_size("4.5gb") == int(4.5 * GB)
+    assert parse_size(1024) == 1024
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_lru_eviction_when_budget_exceeded():
+    backend = FakeOllama()
+    manager = make_manager(backend)
+    manager.ensure_resident("big")
+    manager.ensure_resident("small")
+    manager.ensure_resident("big")  # big 变为最近使用
+    manager.ensure_resident("other")
+
+    assert ("unload", "small") in backend.calls
+    assert manager.resident() == ["big", "other"]
+    stats = manager.get_stats()
+    assert stats["loads"] == 3 and stats["hits"] == 1 and stats["evictions"] == 1
+    assert stats["used_vram"] == 10 * GB
+
+
+def test_pinned_models_are_never_evicted():
+    backend = FakeOllama()
+    manager = make_manager(backend)
+    manager.preload(["small"])
+    manager.ensure_resident("big")
+    manager.ensure_resident("other")
+
+    assert "small" in manager.resident()
+    assert ("unload", "small") not in backend.calls
+    assert ("unload", "big") in backend.calls
+
+
+def test_touch_records_use_without_loading():
+    backend = FakeOllama()
+    manager = make_manager(backend)
+    manager.touch("small").result(timeout=5)
+    assert backend.calls == []
+    assert manager.resident() == ["small"]
+    assert manager.touch("small") is None  # 已驻留：只更新LRU
+    manager.close()
+
+
+def test_touch_evicts_off_the_request_thread():
+    import threading
+
+    backend = FakeOllama()
+    threads = []
+    backend.unload = lambda model_id: threads.append(threading.current_thread().name)
+    manager = make_manager(backend)
+    manager.ensure_resident("big")
+    manager.ensure_resident("small")
+    manager.touch("other").result(timeout=5)
+    assert threads and all(name.startswith("residency") for name in threads)
+    assert manager.resident() == ["small", "other"]
+    manager.close()
+
+
+def test_touch_does_not_wait_for_background_load():
+    import threading
+    import time
+
+    backend = FakeOllama()
+    manager = make_manager(backend)
+    manager.ensure_resident("small")
+    loading = threading.Event()
+    load = backend.load_resident
+
+    def slow_load(model_id, keep_alive=None):
+        loading.set()
+        time.sleep(1)
+        load(model_id, keep_alive)
+
+    backend.load_resident = slow_load
+    future = manager.schedule("big")
+    assert loading.wait(timeout=5)
+    start = time.perf_counter()
+    assert manager.touch("small") is None
+    manager.schedule("big")
+    assert time.perf_counter() - start < 0.2
+    future.result(timeout=5)
+    assert manager.resident() == ["small", "big"]
+    manager.close()
+
+
+def test_background_preload_syncs_with_backend():
+    backend = FakeOllama(resident={"other": 3 * GB})
+    manager = make_manager(backend)
+    manager.start_preload(["big"])
+    manager.wait_preloaded(timeout=5)
+
+    assert backend.calls == [("load", "big", "30m")]
+    assert manager.resident() == ["other", "big"]
+    assert manager.get_stats()["pinned"] == ["big"]
+
+
+def test_get_residency_on_fresh_manager_does_not_deadlock():
+    import threading
+
+    from src.utils.backend_manager import BackendManager
+
+    manager = BackendManager()
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(residency=manager.get_residency("ollama")), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "get_residency 死锁"
+    assert isinstance(result["residency"], ResidencyManager)
+    assert manager.get_residency("ollama") is result["residency"]
+    manager.close()
+
+
+class FakeOllamaBackend(FakeOllama):
+    """可由 BackendManager 构建的驻留测试后端（替换注册表中的 ollama）"""
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def is_available(self):
+        return True
+
+    def load_model(self, model_id, config):
+        return True
+
+    def close(self):
+        pass
+
+
+def test_preload_starts_from_health_monitor_not_load_llm(monkeypatch):
+    import time
+
+    from src.utils import backend_manager as backend_manager_module
+    from src.utils.backend_manager import BackendManager
+    from src.utils.config_registry import models_registry
+
+    monkeypatch.setitem(backend_manager_module.BACKEND_REGISTRY, "ollama", (__name__, "FakeOllamaBackend"))
+    manager = BackendManager()
+    try:
+        residency = manager.get_residency("ollama")
+        # 健康探测发现激活后端可用后，在驻留管理器的后台线程中预加载
+        deadline = time.time() + 5
+        while residency.get_stats()["preloaded"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        repo = models_registry.config.models[models_registry.config.active_model].backend_repos["ollama"]
+        assert ("load", repo, residency.keep_alive) in manager.active_backend.calls
+    finally:
+        manager.close()
@@ -0,0 +1,87 @@
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.utils.response_cache import LangChainResponseCache, ResponseCache, make_cache_key
+
+
+def test_key_depends_on_parameters():
+    a = make_cache_key("ollama", "qwen3:4b", "hi", {"temperature": 0})
+    b = make_cache_key("ollama", "qwen3:4b", "hi", {"temperature": 0.1})
+    assert a != b
+    assert a == make_cache_key("ollama", "qwen3:4b", "hi", {"temperature": 0})
+
+
+def test_lru_eviction_and_counters():
+    cache = ResponseCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"  # a 变为最近使用
+    cache.put("c", "3")  # 淘汰 b
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["evictions"] == 1
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl_seconds=0.05)
+    cache.put("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats["expired"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = ResponseCache(disk_path=path)
+    first.put("k", "v")
+    first.close()
+
+    second = ResponseCache(disk_path=path, disk_max_entries=1)
+    assert second.get("k") == "v"
+    assert second.stats["disk_hits"] == 1
+    second.put("k2", "v2")  # 超过磁盘容量，淘汰最久未访问的 k
+    second._memory.clear()
+    assert second.get("k") is None
+    second.close()
+
+
+def test_langchain_adapter_serves_repeated_prompts():
+    cache = ResponseCache()
+    adapter = LangChainResponseCache(cache, "ollama", "qwen3:4b", {"temperature": 0})
+    llm = FakeListChatModel(responses=["first", "second"], cache=adapter)
+    assert llm.invoke("same prompt").content == "first"
+    assert llm.invoke("same prompt").content == "first"
+    assert llm.invoke("other prompt").content == "second"
+    assert cache.stats["hits"] == 1
+
+
+def test_sampled_requests_bypass_cache():
+    cache = ResponseCache()
+    adapter = LangChainResponseCache(cache, "ollama", "qwen3:4b", {"temperature": 0.7})
+    llm = FakeListChatModel(responses=["first", "second"], cache=adapter)
+    assert llm.invoke("p").content == "first"
+    assert llm.invoke("p").content == "second"
+    assert cache.stats["bypassed"] == 2
+
+    allowed = ResponseCache(allow_sampled=True)
+    adapter = LangChainResponseCache(allowed, "ollama", "qwen3:4b", {"temperature": 0.7})
+    llm = FakeListChatModel(responses=["first", "second"], cache=adapter)
+    llm.invoke("p")
+    assert llm.invoke("p").content == "first"
+
+
+def test_bypass_follows_per_call_temperature():
+    cache = ResponseCache()
+    # 实例参数与默认配置一致（temperature 0.7），单次调用覆盖为 0 时可以缓存
+    adapter = LangChainResponseCache(cache, "ollama", "qwen3:4b", {"temperature": 0.7})
+    llm = FakeListChatModel(responses=["first", "second", "third"], cache=adapter)
+    assert llm.invoke("p", temperature=0).content == "first"
+    assert llm.bind(temperature=0).invoke("p").content == "first"
+    assert cache.stats["hits"] == 1
+    assert llm.invoke("p").content == "second"
+    assert cache.stats["bypassed"] == 1
+    assert adapter._bypass("...---[('stop', None), ('temperature', 0.7)]")
+    assert not adapter._bypass("...---[('stop', None), ('temperature', 0)]")
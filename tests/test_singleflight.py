@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from src.backends.base import ModelBackend, ModelResponse
+from src.backends.singleflight import CoalescingBackend, SingleFlight
+from src.utils.langchain_adapters import coalesced_chat_model
+
+
+class CountingBackend(ModelBackend):
+    """统计实际发往后端的调用次数"""
+
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+        if self.fail:
+            raise RuntimeError("backend down")
+
+    def load_model(self, model_id: str, config: Dict[str, Any]) -> bool:
+        return True
+
+    def generate(self, prompt: str, **kwargs) -> ModelResponse:
+        time.sleep(self.delay)
+        self._count()
+        return ModelResponse(content=f"{prompt}#{self.calls}")
+
+    async def agenerate(self, prompt: str, **kwargs) -> ModelResponse:
+        await asyncio.sleep(self.delay)
+        self._count()
+        return ModelResponse(content=f"{prompt}#{self.calls}")
+
+    async def generate_stream(self, prompt: str, **kwargs):
+        self._count()
+        for token in prompt.split():
+            await asyncio.sleep(self.delay / 2)
+            yield ModelResponse(content=token)
+
+    def is_available(self) -> bool:
+        return True
+
+    def get_model_info(self, model_id: str) -> Dict[str, Any]:
+        return {}
+
+    def list_loaded_models(self) -> List[str]:
+        return []
+
+
+def test_concurrent_sync_calls_share_one_request():
+    inner = CountingBackend()
+    backend = CoalescingBackend(inner, SingleFlight())
+    with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(lambda _: backend.generate("route me", model="m"), range(10)))
+    assert inner.calls == 1
+    assert {r.content for r in results} == {"route me#1"}
+    assert backend.singleflight.get_stats() == {"leaders": 1, "saved_calls": 9, "in_flight": 0}
+
+
+def test_async_calls_coalesce_by_key():
+    inner = CountingBackend()
+    backend = CoalescingBackend(inner, SingleFlight())
+
+    async def main():
+        return await asyncio.gather(
+            *(backend.agenerate("q", parameters={"temperature": 0}) for _ in range(5)),
+            backend.agenerate("q", parameters={"temperature": 0.5}),
+            backend.agenerate("other", parameters={"temperature": 0}),
+        )
+
+    results = asyncio.run(main())
+    assert inner.calls == 3
+    assert len({r.content for r in results[:5]}) == 1
+    # 请求结束后不再合并
+    asyncio.run(backend.agenerate("q", parameters={"temperature": 0}))
+    assert inner.calls == 4
+
+
+def test_sampled_requests_bypass_when_disallowed():
+    inner = CountingBackend()
+    backend = CoalescingBackend(inner, SingleFlight(allow_sampled=False))
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: backend.generate("q", parameters={"temperature": 0.7}), range(4)))
+    assert inner.calls == 4
+
+
+def test_streams_are_broadcast_including_late_joiners():
+    inner = CountingBackend(delay=0.04)
+    backend = CoalescingBackend(inner, SingleFlight())
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        return [c.content async for c in backend.generate_stream("a b c d")]
+
+    async def main():
+        return await asyncio.gather(consume(0), consume(0), consume(0.03))
+
+    results = asyncio.run(main())
+    assert inner.calls == 1
+    assert results == [["a", "b", "c", "d"]] * 3
+    assert backend.singleflight.stats["saved_calls"] == 2
+
+
+def test_abandoned_stream_cancels_upstream():
+    inner = CountingBackend(delay=0.04)
+    backend = CoalescingBackend(inner, SingleFlight())
+    produced = []
+
+    async def upstream(prompt, **kwargs):
+        for token in prompt.split():
+            await asyncio.sleep(0.02)
+            produced.append(token)
+            yield ModelResponse(content=token)
+
+    inner.generate_stream = upstream
+
+    async def main():
+        stream = backend.generate_stream("a b c d e f g h")
+        first = await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.3)
+        return first.content
+
+    assert asyncio.run(main()) == "a"
+    assert len(produced) < 8
+    assert backend.singleflight.get_stats()["in_flight"] == 0
+
+
+def test_errors_reach_every_waiter():
+    inner = CountingBackend(fail=True)
+    backend = CoalescingBackend(inner, SingleFlight())
+
+    async def main():
+        return await asyncio.gather(*(backend.agenerate("x") for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert inner.calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert backend.singleflight.get_stats()["in_flight"] == 0
+
+
+def test_langchain_model_coalesces_identical_invocations():
+    group = SingleFlight()
+    llm = coalesced_chat_model(FakeListChatModel, group)(responses=["first", "second"], sleep=0.05)
+    with ThreadPoolExecutor(6) as pool:
+        results = list(pool.map(lambda _: llm.invoke("same question").content, range(6)))
+    assert results == ["first"] * 6
+    assert group.stats["saved_calls"] == 5
+    assert llm.invoke("same question").content == "second"
+
+
+def test_langchain_astream_is_shared():
+    group = SingleFlight()
+    llm = coalesced_chat_model(FakeListChatModel, group)(responses=["hello"], sleep=0.01)
+
+    async def consume():
+        return "".join([chunk.content async for chunk in llm.astream("hi")])
+
+    async def main():
+        return await asyncio.gather(*(consume() for _ in range(3)))
+
+    assert asyncio.run(main()) == ["hello"] * 3
+    assert group.stats == {"leaders": 1, "saved_calls": 2}
+
+
+def test_langchain_astream_forwards_leader_run_manager():
+    managers = []
+
+    class Recording(FakeListChatModel):
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            managers.append(run_manager)
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+
+    llm = coalesced_chat_model(Recording, SingleFlight())(responses=["hey"])
+    run_manager = object()
+
+    async def main():
+        stream = llm._astream([HumanMessage(content="hi")], run_manager=run_manager)
+        return "".join([chunk.message.content async for chunk in stream])
+
+    assert asyncio.run(main()) == "hey"
+    assert managers == [run_manager]
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.agents.patterns import chaining, rag, routing
+
+
+def _collect(stream):
+    async def run():
+        return [chunk async for chunk in stream]
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    def install(module, responses):
+        llm = FakeListChatModel(responses=responses, sleep=0.001)
+        monkeypatch.setattr(module.model_loader, "load_llm", lambda model_id=None: llm)
+        return llm
+    return install
+
+
+def test_chaining_streams_final_stage_tokens(fake_llm):
+    fake_llm(chaining, ["cpu: 3.5GHz", '{"cpu": "3.5GHz"}'])
+    agent = chaining.ChainingAgent()
+    tokens = _collect(agent.astream("laptop specs"))
+    assert "".join(tokens) == '{"cpu": "3.5GHz"}'
+    assert len(tokens) > 1
+    metrics = agent.last_stream_metrics
+    assert metrics["chunks"] == len(tokens)
+    assert 0 < metrics["time_to_first_token"] <= metrics["latency"]
+    assert metrics["inter_token_latency"] > 0
+
+
+def test_chaining_run_returns_text_and_extract_returns_model(fake_llm):
+    reply = '{ "cpu" : "3.5GHz",\n  "memory": null }'
+    fake_llm(chaining, ["cpu: 3.5GHz", reply])
+    agent = chaining.ChainingAgent()
+    # run() 保持返回模型输出原文，结构化结果由 extract() 提供
+    assert agent.run("laptop specs") == reply
+    assert agent.extract("laptop specs") == chaining.Specifications(cpu="3.5GHz")
+
+
+def test_routing_stream_yields_handler_result(fake_llm):
+    fake_llm(routing, ["booker"])
+    agent = routing.RoutingAgent()
+    assert "Booking Handler" in "".join(_collect(agent.astream("book a flight")))
+
+
+def test_rag_stream(fake_llm):
+    fake_llm(rag, ["Python 创建于 1991 年"])
+    agent = rag.RAGAgent()
+    agent.vector_store.add_document(rag.Document(id="", content="Python 创建于 1991 年", metadata={"source": "intro"}))
+    assert "".join(_collect(agent.astream("Python"))) == "Python 创建于 1991 年"
+    assert agent.last_stream_metrics["time_to_first_token"] > 0
+    assert _collect(agent.astream("nothing matches")) == ["未找到相关信息。"]
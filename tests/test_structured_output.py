@@ -0,0 +1,114 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from pydantic import BaseModel
+
+from src.backends.base import ModelResponse
+from src.backends.mock_backend import MockBackend
+from src.backends.structured import IncrementalJSONValidator, StructuredOutputError, parse_structured
+from src.utils.structured_output import avalidate_json_stream, structured_llm
+
+
+class Specs(BaseModel):
+    cpu: str
+    memory: Optional[str] = None
+
+
+class Plan(BaseModel):
+    steps: List[str]
+
+
+def test_validator_skips_preamble_and_stops_when_complete():
+    validator = IncrementalJSONValidator()
+    assert not validator.feed('```json\n{"cpu": "3.5GHz", ')
+    assert validator.feed('"tags": ["a", "b}"]} trailing text')
+    assert validator.text == '{"cpu": "3.5GHz", "tags": ["a", "b}"]}'
+
+
+@pytest.mark.parametrize("bad", ["{'cpu': 1}", '{"a": [1}', '{"a": True}', '{"a": "line\nbreak"}'])
+def test_validator_rejects_invalid_json_early(bad):
+    with pytest.raises(StructuredOutputError):
+        IncrementalJSONValidator().feed(bad)
+
+
+def test_validator_gives_up_on_long_prose():
+    with pytest.raises(StructuredOutputError):
+        IncrementalJSONValidator(max_preamble=10).feed("Sure! Here is a long explanation instead of JSON")
+
+
+def test_validator_anchors_on_value_matching_schema():
+    validator = IncrementalJSONValidator(schema=Plan)
+    assert validator.feed('Note [1]: the plan is {see below}. {"steps": ["a", "b"]} done')
+    assert validator.text == '{"steps": ["a", "b"]}'
+    assert parse_structured('See [docs] first: {"steps": ["x"]}', Plan).steps == ["x"]
+
+
+def test_parse_structured_checks_schema():
+    assert parse_structured('Result: {"cpu": "M2"}', Specs).cpu == "M2"
+    with pytest.raises(StructuredOutputError):
+        parse_structured('{"memory": "16GB"}', Specs)
+    with pytest.raises(StructuredOutputError):
+        parse_structured('{"cpu": "M2"', Specs)
+
+
+def mock_backend(response):
+    return MockBackend({"mock": {"mode": "script", "default_response": response}})
+
+
+def test_backend_streams_and_stops_after_object():
+    backend = mock_backend('{"cpu": "3.5GHz", "memory": "16GB"} and some chatter afterwards')
+    result = asyncio.run(backend.agenerate_structured("laptop", Specs))
+    assert result == Specs(cpu="3.5GHz", memory="16GB")
+    assert backend.generate_structured("laptop", Specs).cpu == "3.5GHz"
+
+
+def test_backend_aborts_stream_on_invalid_output():
+    backend = mock_backend("{'cpu': " + "x " * 500)
+    with pytest.raises(StructuredOutputError):
+        asyncio.run(backend.agenerate_structured("laptop", Specs))
+    assert backend.stats["in_flight"] == 0
+
+
+def test_guided_backend_receives_schema():
+    calls = []
+
+    class Guided(MockBackend):
+        supports_guided_decoding = True
+
+        def generate(self, prompt, **kwargs):
+            calls.append(kwargs)
+            return ModelResponse(content='{"cpu": "M3"}')
+
+    backend = Guided({"mock": {}})
+    assert backend.generate_structured("laptop", Specs, model="m").cpu == "M3"
+    assert calls[0]["json_schema"] == Specs.model_json_schema()
+    assert calls[0]["model"] == "m"
+
+
+def test_structured_llm_with_streaming_fallback():
+    llm = FakeListChatModel(responses=['Here you go: {"steps": ["a", "b"]}'])
+    assert structured_llm(llm, Plan).invoke("plan it").steps == ["a", "b"]
+    assert asyncio.run(structured_llm(llm, Plan).ainvoke("plan it")).steps == ["a", "b"]
+
+
+def test_validated_token_stream():
+    async def tokens(text):
+        for ch in text:
+            yield ch
+
+    async def collect(text):
+        return "".join([t async for t in avalidate_json_stream(tokens(text), Specs)])
+
+    assert asyncio.run(collect('{"cpu": "M1"} extra')) == '{"cpu": "M1"}'
+    with pytest.raises(StructuredOutputError):
+        asyncio.run(collect('{"memory": "8GB"}'))
+
+
+def test_planning_agent_returns_structured_steps(monkeypatch):
+    from src.agents.patterns import planning
+
+    llm = FakeListChatModel(responses=['{"steps": ["Research", "Draft", "Review"]}'])
+    monkeypatch.setattr(planning.model_loader, "load_llm", lambda model_id=None: llm)
+    assert planning.PlanningAgent().create_plan("write a report") == ["Research", "Draft", "Review"]
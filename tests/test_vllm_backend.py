@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+from src.backends.vllm_backend import VLLMBackend
+
+
+def _backend(url: str) -> VLLMBackend:
+    return VLLMBackend({"connection": {"host": url, "timeout": 5, "pool_per_host": 4}})
+
+
+def test_generate_reuses_pooled_connection(vllm_stub):
+    backend = _backend(vllm_stub.url)
+    try:
+        for _ in range(5):
+            assert backend.generate("hello").content == "stub reply"
+        assert backend.is_available()
+    finally:
+        backend.close()
+
+    # 所有请求复用同一条keep-alive连接
+    assert len(vllm_stub.client_ports) == 1
+
+
+def test_stream_reuses_async_session(vllm_stub):
+    async def run():
+        async with _backend(vllm_stub.url) as backend:
+            outputs = []
+            for _ in range(3):
+                chunks = [c.content async for c in backend.generate_stream("hi")]
+                outputs.append("".join(chunks).strip())
+            session = backend._async_session
+        return outputs, session
+
+    outputs, session = asyncio.run(run())
+    assert outputs == ["stub reply"] * 3
+    assert session.closed
+    assert len(vllm_stub.client_ports) == 1
+
+
+def test_close_is_idempotent(vllm_stub):
+    backend = _backend(vllm_stub.url)
+    backend.generate("hello")
+    backend.close()
+    backend.close()
+    # 关闭后再次使用会重建会话
+    assert backend.generate("again").content == "stub reply"
+    backend.close()
+
+
+def test_agenerate_runs_concurrently_on_one_loop(vllm_stub):
+    vllm_stub.delay = 0.2
+
+    async def run():
+        async with _backend(vllm_stub.url) as backend:
+            return await asyncio.gather(*(backend.agenerate(f"q{i}") for i in range(4)))
+
+    start = time.time()
+    responses = asyncio.run(run())
+    assert time.time() - start < 0.6
+    assert [r.content for r in responses] == ["stub reply"] * 4
+    assert all(r.latency >= 0.2 for r in responses)
+    assert len(vllm_stub.requests) == 4
+
+
+def test_stream_chunks_carry_latency_metrics(vllm_stub):
+    vllm_stub.reply = "a b c d"
+
+    async def run():
+        async with _backend(vllm_stub.url) as backend:
+            return [c async for c in backend.generate_stream("hi")]
+
+    chunks = asyncio.run(run())
+    assert len(chunks) == 4
+    first_ttft = chunks[0].time_to_first_token
+    assert first_ttft is not None and first_ttft > 0
+    assert all(c.time_to_first_token == first_ttft for c in chunks)
+    assert chunks[-1].latency >= chunks[0].latency
+    assert chunks[0].inter_token_latency == 0.0
+
+
+def test_async_session_is_closed_on_its_own_loop(vllm_stub):
+    backend = _backend(vllm_stub.url)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(backend.agenerate("hi"), loop).result(timeout=5)
+        session = backend._async_session
+        # 另一线程的循环仍在运行：close 投递到该循环执行
+        backend.close()
+        deadline = time.time() + 5
+        while not session.closed and time.time() < deadline:
+            time.sleep(0.01)
+        assert session.closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_loop_change_does_not_close_session_on_foreign_loop(vllm_stub):
+    backend = _backend(vllm_stub.url)
+    asyncio.run(backend.agenerate("first"))
+    stale = backend._async_session
+
+    async def second():
+        async with backend:
+            return await backend.agenerate("second")
+
+    assert asyncio.run(second()).content == "stub reply"
+    # 旧循环已关闭：旧会话只被丢弃，不会在新循环上调用其 close
+    assert not stale.closed
+    assert backend._async_session is None